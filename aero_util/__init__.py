@@ -1,3 +1,4 @@
 from .core import *
+from . import atmosphere
 from . import attitude
 from . import grids
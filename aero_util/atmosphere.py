@@ -0,0 +1,220 @@
+''' US Standard Atmosphere (1976) properties
+
+    Temperature, pressure, density, speed of sound and viscosity from -5 km
+    to 86 km geometric altitude (84.852 km geopotential), where the
+    atmosphere is a sequence of layers with linear temperature profiles in
+    geopotential altitude. All functions are vectorized over arrays of
+    altitudes, which are geometric unless geopotential=True; altitudes
+    outside the model give NaN. Inputs may be given in other units with
+    the units argument (see core.convert_from); outputs are SI.
+
+    For hot loops, Table precomputes the properties on a dense altitude
+    grid and interpolates them linearly.
+'''
+import numpy as np
+from . import core
+
+#-------------------------------------------------------------------------------
+# Model Constants
+#-------------------------------------------------------------------------------
+_G0    = 9.80665                # Sea level gravity [m/s^2]
+_R0    = 6356766.0              # Effective earth radius [m]
+_R     = 8314.32 / 28.9644      # Gas constant of air [J/kg-K]
+_GAMMA = 1.4                    # Ratio of specific heats
+_MU_BETA = 1.458e-6             # Sutherland's law constant [kg/m-s-K^0.5]
+_MU_S    = 110.4                # Sutherland's constant [K]
+
+# Geopotential altitude [m'] and lapse rate [K/m'] at the base of each layer
+_H_BASE = np.array([0.0, 11000.0, 20000.0, 32000.0, 47000.0, 51000.0, 71000.0])
+_LAPSE  = np.array([-6.5, 0.0, 1.0, 2.8, 0.0, -2.8, -2.0]) * 1e-3
+_H_MIN  = _R0*-5000.0 / (_R0 - 5000.0)        # -5 km geometric
+_H_MAX  = _R0*86000.0 / (_R0 + 86000.0)       # 86 km geometric
+
+PROPERTIES = ('temperature', 'pressure', 'density', 'speed_of_sound', 'viscosity')
+
+def _layer_bases():
+    ''' Return temperature and pressure at the base of each layer '''
+    T, p = [288.15], [101325.0]
+    for Hb, L, H in zip(_H_BASE, _LAPSE, _H_BASE[1:]):
+        T.append(T[-1] + L*(H - Hb))
+        if L == 0.0:
+            p.append(p[-1] * np.exp(-_G0*(H - Hb)/(_R*T[-2])))
+        else:
+            p.append(p[-1] * (T[-2]/T[-1])**(_G0/(_R*L)))
+    return np.array(T), np.array(p)
+
+_T_BASE, _P_BASE = _layer_bases()
+_RHO_BASE = _P_BASE / (_R*_T_BASE)
+
+# p/pb = exp(_EXPONENT*ln(Tb/T) - _ISO_SCALE*(h - Hb)) within each layer
+_ISOTHERMAL = _LAPSE == 0.0
+_EXPONENT   = np.where(_ISOTHERMAL, 0.0, _G0 / (_R*np.where(_ISOTHERMAL, 1.0, _LAPSE)))
+_ISO_SCALE  = np.where(_ISOTHERMAL, _G0/(_R*_T_BASE), 0.0)
+
+#-------------------------------------------------------------------------------
+# Atmosphere Properties
+#-------------------------------------------------------------------------------
+def properties(altitude, units=None, geopotential=False):
+    ''' Return all atmosphere properties at altitudes
+
+        INPUTS:
+          altitude      Altitude(s), geometric unless geopotential is set [m]
+          units         Units of altitude (default: m)
+          geopotential  True if altitude is geopotential
+
+        OUTPUTS:
+          props         Dictionary of temperature [K], pressure [Pa],
+                        density [kg/m^3], speed_of_sound [m/s] and
+                        viscosity [kg/m-s], each shaped like altitude
+    '''
+    h = _geopotential(altitude, units, geopotential)
+    h = np.where((h >= _H_MIN) & (h <= _H_MAX), h, np.nan)
+    return {name: value[()] for name, value in _properties(h).items()}
+
+def temperature(altitude, units=None, geopotential=False):
+    ''' Return temperature [K] at altitudes (see properties) '''
+    return properties(altitude, units, geopotential)['temperature']
+
+def pressure(altitude, units=None, geopotential=False):
+    ''' Return pressure [Pa] at altitudes (see properties) '''
+    return properties(altitude, units, geopotential)['pressure']
+
+def density(altitude, units=None, geopotential=False):
+    ''' Return density [kg/m^3] at altitudes (see properties) '''
+    return properties(altitude, units, geopotential)['density']
+
+def speed_of_sound(altitude, units=None, geopotential=False):
+    ''' Return speed of sound [m/s] at altitudes (see properties) '''
+    return properties(altitude, units, geopotential)['speed_of_sound']
+
+def viscosity(altitude, units=None, geopotential=False):
+    ''' Return dynamic viscosity [kg/m-s] at altitudes (see properties) '''
+    return properties(altitude, units, geopotential)['viscosity']
+
+#-------------------------------------------------------------------------------
+# Inverse Lookups
+#-------------------------------------------------------------------------------
+def altitude_from_pressure(pressure, units=None, geopotential=False):
+    ''' Return altitudes at which the atmosphere has given pressures
+
+        INPUTS:
+          pressure      Pressure(s) [Pa]
+          units         Units of pressure (default: Pa)
+          geopotential  True to return geopotential altitudes
+
+        OUTPUTS:
+          altitude      Altitude(s), geometric unless geopotential is set
+                        [m]; NaN outside the model
+    '''
+    return _invert(pressure, units, geopotential, _P_BASE, _EXPONENT)
+
+def altitude_from_density(density, units=None, geopotential=False):
+    ''' Return altitudes at which the atmosphere has given densities
+
+        INPUTS:
+          density       Density(s) [kg/m^3]
+          units         Units of density (default: kg/m^3)
+          geopotential  True to return geopotential altitudes
+
+        OUTPUTS:
+          altitude      Altitude(s), geometric unless geopotential is set
+                        [m]; NaN outside the model
+    '''
+    # rho/rhob = (Tb/T)^(E+1) in gradient layers, as p/pb = (Tb/T)^E
+    return _invert(density, units, geopotential, _RHO_BASE,
+                   np.where(_ISOTHERMAL, 0.0, _EXPONENT + 1.0))
+
+#-------------------------------------------------------------------------------
+# Altitude Conversion
+#-------------------------------------------------------------------------------
+def geopotential_altitude(z):
+    ''' Return geopotential altitude [m'] of geometric altitude z [m] '''
+    z = np.asarray(z, dtype=float)
+    return (_R0*z / (_R0 + z))[()]
+
+def geometric_altitude(h):
+    ''' Return geometric altitude [m] of geopotential altitude h [m'] '''
+    h = np.asarray(h, dtype=float)
+    return (_R0*h / (_R0 - h))[()]
+
+#-------------------------------------------------------------------------------
+# Lookup Table
+#-------------------------------------------------------------------------------
+class Table:
+    ''' Atmosphere properties precomputed on a uniform grid of
+        geopotential altitude
+
+        Evaluating a Table is an index computation and a linear
+        interpolation, roughly 1.5x faster than properties() for large
+        arrays. Nodes are at multiples of step, so when step divides 1 km
+        the layer bases are nodes, and with the default 10 m spacing
+        interpolated values are within 1e-6 (relative) of the model.
+
+        INPUTS:
+          step      Geopotential altitude spacing of the table [m']
+    '''
+    def __init__(self, step=10.0):
+        lo, hi = np.floor(_H_MIN / step), np.ceil(_H_MAX / step)
+        self.step = step
+        self.altitude = step * np.arange(lo, hi + 1.0)
+        props = _properties(self.altitude)
+        self.values = np.stack([props[name] for name in PROPERTIES])
+        self.slopes = np.diff(self.values, axis=1)
+
+    def properties(self, altitude, units=None, geopotential=False):
+        ''' Return interpolated properties at altitudes (see properties) '''
+        h = _geopotential(altitude, units, geopotential)
+        x = (h - self.altitude[0]) / self.step
+        valid = (h >= _H_MIN) & (h <= _H_MAX)
+        i = np.minimum(np.where(valid, x, 0.0).astype(np.intp), self.slopes.shape[1] - 1)
+        f = np.where(valid, x - i, np.nan)
+        return {name: (v.take(i) + f*d.take(i))[()]
+                for name, v, d in zip(PROPERTIES, self.values, self.slopes)}
+
+
+#-------------------------------------------------------------------------------
+# Helper Functions
+#-------------------------------------------------------------------------------
+def _si(value, units=None):
+    ''' Return value as a float array, converted from units to SI '''
+    if units is not None:
+        value = core.convert_from(value, units)
+    return np.asarray(value, dtype=float)
+
+def _geopotential(altitude, units=None, geopotential=False):
+    ''' Return geopotential altitude [m'] of altitude inputs '''
+    h = _si(altitude, units)
+    return h if geopotential else _R0*h / (_R0 + h)
+
+def _properties(h):
+    ''' Return properties at geopotential altitudes h [m'], extending the
+        lowest and highest layers beyond the model limits
+    '''
+    layer = np.clip(np.searchsorted(_H_BASE, h, side='right') - 1, 0, len(_H_BASE) - 1)
+    Hb, Tb = _H_BASE[layer], _T_BASE[layer]
+    T = Tb + _LAPSE[layer]*(h - Hb)
+    p = _P_BASE[layer] * np.exp(_EXPONENT[layer]*np.log(Tb/T) - _ISO_SCALE[layer]*(h - Hb))
+    return {
+        'temperature':    T,
+        'pressure':       p,
+        'density':        p / (_R*T),
+        'speed_of_sound': np.sqrt(_GAMMA*_R*T),
+        'viscosity':      _MU_BETA * T*np.sqrt(T) / (T + _MU_S),
+    }
+
+def _invert(values, units, geopotential, bases, exponent):
+    ''' Return altitudes where a property decreasing with altitude takes
+        values, given its value at the base of each layer and the
+        exponents of Tb/T in its gradient layer profiles
+    '''
+    values = _si(values, units)
+    layer = np.clip(np.searchsorted(-bases, -values, side='right') - 1, 0, len(bases) - 1)
+    Hb, Tb, L = _H_BASE[layer], _T_BASE[layer], _LAPSE[layer]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_ratio = np.log(values / bases[layer])
+        h = np.where(_ISOTHERMAL[layer],
+                     Hb - log_ratio/_ISO_SCALE[layer],
+                     Hb + Tb*(np.exp(-log_ratio/exponent[layer]) - 1.0)/L)
+    tol = 1e-9 * (_H_MAX - _H_MIN)         # Round-off at the model limits
+    h = np.where((h >= _H_MIN - tol) & (h <= _H_MAX + tol), h, np.nan)
+    return (h if geopotential else _R0*h / (_R0 - h))[()]
@@ -1,7 +1,20 @@
-''' Tools for working with wind-relative attitude parameterizations '''
-from numpy import sqrt, sin, cos, arcsin, arctan2
+''' Tools for working with wind-relative attitude parameterizations
 
-def ab_from_uvw(u, v, w):
+    All functions accept scalars or arrays (broadcast against each other).
+    Array inputs are processed in chunks sized to stay in cache, computing
+    each sine/cosine once with no temporaries beyond a few chunk-sized
+    scratch buffers. Results may be written into existing arrays with
+    out=(a, b[, c]), which may be the inputs themselves for in-place
+    conversion.
+'''
+import numpy as np
+from . import core
+
+# Elements per chunk of array inputs; scratch buffers of this many doubles
+# fit in a typical L2 cache
+_CHUNK_SIZE = 1 << 13
+
+def ab_from_uvw(u, v, w, out=None, chunk_size=None):
     ''' Compute alpha/beta angles from wind-relative velocity vector
 
         INPUTS:
@@ -16,13 +29,12 @@ def ab_from_uvw(u, v, w):
         NOTE:
           Components of the wind-relative velocity vector are resolved
           in the body-fixed frame with X-axis forward, Y-axis to the
-          right and Z-axis down.
+          right and Z-axis down. Beta is evaluated as atan2(v,rss(u,w)),
+          which equals asin(v,V) but is accurate near +/-90 deg.
     '''
-    alpha = arctan2(w, u)
-    beta = arcsin(v / sqrt(u*u + v*v + w*w))
-    return alpha, beta
+    return _evaluate(_ab_from_uvw, (u, v, w), 2, 2, out, chunk_size)
 
-def ap_from_uvw(u, v, w):
+def ap_from_uvw(u, v, w, out=None, chunk_size=None):
     ''' Compute total alpha/phi angles from wind-relative velocity vector
 
         INPUTS:
@@ -39,11 +51,9 @@ def ap_from_uvw(u, v, w):
           in the body-fixed frame with X-axis forward, Y-axis to the
           right and Z-axis down.
     '''
-    alphat = arctan2(sqrt(v*v + w*w), u)
-    phi = arctan2(v, w)
-    return alphat, phi
+    return _evaluate(_ap_from_uvw, (u, v, w), 2, 2, out, chunk_size)
 
-def uvw_from_ab(alpha, beta):
+def uvw_from_ab(alpha, beta, out=None, chunk_size=None):
     ''' Compute normalized wind-relative velocity from alpha/beta angles
 
         INPUTS:
@@ -60,12 +70,9 @@ def uvw_from_ab(alpha, beta):
           in the body-fixed frame with X-axis forward, Y-axis to the
           right and Z-axis down.
     '''
-    u = cos(beta)*cos(alpha)
-    v = sin(beta)
-    w = cos(beta)*sin(alpha)
-    return u, v, w
+    return _evaluate(_uvw_from_ab, (alpha, beta), 3, 2, out, chunk_size)
 
-def uvw_from_ap(alphat, phi):
+def uvw_from_ap(alphat, phi, out=None, chunk_size=None):
     ''' Compute normalized wind-relative velocity from total alpha/phi angles
 
         INPUTS:
@@ -82,12 +89,9 @@ def uvw_from_ap(alphat, phi):
           in the body-fixed frame with X-axis forward, Y-axis to the
           right and Z-axis down.
     '''
-    u = cos(alphat)
-    v = sin(alphat)*sin(phi)
-    w = sin(alphat)*cos(phi)
-    return u, v, w
+    return _evaluate(_uvw_from_ap, (alphat, phi), 3, 2, out, chunk_size)
 
-def ab_from_ap(alphat, phi):
+def ab_from_ap(alphat, phi, out=None, chunk_size=None):
     ''' Compute alpha/beta angles from total alpha/phi
 
         INPUTS:
@@ -98,9 +102,9 @@ def ab_from_ap(alphat, phi):
           alpha   Pitch plane angle of attack, atan2(w,u)  [rad]
           beta    Yaw plane angle of attac, asin(v,V)      [rad]
     '''
-    return ab_from_uvw(*uvw_from_ap(alphat, phi))
+    return _evaluate(_ab_from_ap, (alphat, phi), 2, 4, out, chunk_size)
 
-def ap_from_ab(alpha, beta):
+def ap_from_ab(alpha, beta, out=None, chunk_size=None):
     ''' Compute alpha/beta angles from total alpha/phi
 
         INPUTS:
@@ -111,5 +115,160 @@ def ap_from_ab(alpha, beta):
           alphat  Total angle of attack, atan2(rss(v,w),u) [rad]
           phi     Aerodynamic roll angle, atan2(v,w)       [rad]
     '''
-    return ap_from_uvw(*uvw_from_ab(alpha, beta))
+    return _evaluate(_ap_from_ab, (alpha, beta), 2, 4, out, chunk_size)
+
+def wind_angles(velocity, wind=None, q=None, sequence=None, angles=None,
+                angles_deg=None, out=None, chunk_size=None):
+    ''' Compute wind-relative attitude angles along trajectories
+
+        Combines vehicle attitude, inertial velocity and wind into all
+        wind-relative angles for every sample in one vectorized pass,
+        a chunk of samples at a time, so memory beyond the outputs is
+        bounded by chunk_size samples. The attitude is given either as
+        quaternions or as an Euler sequence (as for core.rotate_seq).
+
+        INPUTS:
+          velocity    Vehicle velocity resolved in the reference (e.g.
+                      NED) frame, (...,3) array
+          wind        Wind velocity in the reference frame, (...,3) or
+                      (3,) array (default: no wind)
+          q           Unit quaternions [w,x,y,z] from the reference to the
+                      body frame, (...,4) array (see core.quat_seq)
+          sequence    Euler rotation sequence from the reference to the
+                      body frame, e.g. 'zyx', used in place of q
+          angles      Angles for each rotation [rad], e.g. [psi, theta,
+                      phi] time histories
+          angles_deg  Angles for each rotation [deg]
+          out         Arrays for the four outputs (default: new arrays)
+          chunk_size  Samples per chunk
+
+        OUTPUTS:
+          alpha   Pitch plane angle of attack, atan2(w,u)  [rad]
+          beta    Yaw plane angle of attac, asin(v,V)      [rad]
+          alphat  Total angle of attack, atan2(rss(v,w),u) [rad]
+          phi     Aerodynamic roll angle, atan2(v,w)       [rad]
+
+        NOTE:
+          The body frame has X-axis forward, Y-axis to the right and
+          Z-axis down. All inputs are broadcast against each other over
+          the sample dimensions.
+    '''
+    velocity = np.asarray(velocity, dtype=float)
+    wind = np.zeros(3) if wind is None else np.asarray(wind, dtype=float)
+    if q is not None:
+        q = np.asarray(q, dtype=float)
+        samples = [q[..., 0]]
+    elif sequence is not None:
+        angles = core._seq_angles(sequence, angles, angles_deg)
+        angles = [np.asarray(a, dtype=float) for a in angles]
+        samples = angles
+    else:
+        raise RuntimeError('Either q or sequence must be defined')
+    shape = np.broadcast(velocity[..., 0], wind[..., 0], *samples).shape
+
+    velocity = np.broadcast_to(velocity, shape + (3,))
+    wind = np.broadcast_to(wind, shape + (3,))
+    if q is not None:
+        q = np.broadcast_to(q, shape + (4,))
+    else:
+        angles = [np.broadcast_to(a, shape) for a in angles]
+    scalar = out is None and not shape
+    if out is None:
+        out = tuple(np.empty(shape) for _ in range(4))
+    alpha, beta, alphat, phi = out
+
+    for chunk in core._chunks(shape, chunk_size or _CHUNK_SIZE):
+        body_q = q[chunk] if q is not None else core.quat_seq(sequence, [a[chunk] for a in angles])
+        u, v, w = np.moveaxis(core.quat_apply(body_q, velocity[chunk] - wind[chunk]), -1, 0)
+        scratch = (np.empty_like(u), np.empty_like(u))
+        _ab_from_uvw(u, v, w, alpha[chunk], beta[chunk], scratch)
+        _ap_from_uvw(u, v, w, alphat[chunk], phi[chunk], scratch)
+    if scalar:
+        return tuple(r[()] for r in out)
+    return tuple(out)
+
+
+#-------------------------------------------------------------------------------
+# Helper Functions
+#-------------------------------------------------------------------------------
+def _evaluate(kernel, inputs, nout, nscratch, out=None, chunk_size=None):
+    ''' Evaluate kernel(*inputs, *outputs, scratch) over 1D chunks of the
+        broadcast inputs, writing into out (default: new arrays). Scalar
+        inputs give scalar results.
+    '''
+    inputs = [np.asarray(x) for x in inputs]
+    dtype = np.result_type(*inputs, 1.0)
+    scalar = out is None and all(np.ndim(x) == 0 for x in inputs)
+    chunk_size = chunk_size or _CHUNK_SIZE
+    operands = list(inputs) + list(out or [None]*nout)
+    it = np.nditer(operands, flags=['external_loop', 'buffered', 'zerosize_ok'],
+                   op_flags=[['readonly']]*len(inputs) + [['writeonly', 'allocate']]*nout,
+                   op_dtypes=[dtype]*len(operands), casting='same_kind',
+                   buffersize=chunk_size)
+    scratch = np.empty((nscratch, chunk_size), dtype)
+    with it:
+        for ops in it:
+            kernel(*ops, scratch[:, :len(ops[0])])
+        results = it.operands[len(inputs):]
+    if scalar:
+        return tuple(r[()] for r in results)
+    return tuple(out) if out is not None else tuple(results)
+
+def _rss(x, y, out, tmp):
+    ''' sqrt(x*x + y*y) into out; much faster than np.hypot '''
+    np.multiply(x, x, out=out)
+    np.multiply(y, y, out=tmp)
+    np.add(out, tmp, out=out)
+    return np.sqrt(out, out=out)
+
+def _ab_from_uvw(u, v, w, alpha, beta, scratch):
+    rss = _rss(u, w, *scratch)
+    np.arctan2(v, rss, out=rss)
+    np.arctan2(w, u, out=alpha)
+    np.copyto(beta, rss)
+
+def _ap_from_uvw(u, v, w, alphat, phi, scratch):
+    rss = _rss(v, w, *scratch)
+    np.arctan2(rss, u, out=rss)
+    np.arctan2(v, w, out=phi)
+    np.copyto(alphat, rss)
+
+def _uvw_from_ab(alpha, beta, u, v, w, scratch):
+    ca, cb = scratch
+    np.cos(alpha, out=ca)
+    np.cos(beta, out=cb)
+    np.sin(alpha, out=w)
+    np.sin(beta, out=v)
+    np.multiply(cb, ca, out=u)
+    np.multiply(cb, w, out=w)
+
+def _uvw_from_ap(alphat, phi, u, v, w, scratch):
+    sa, cp = scratch
+    np.sin(alphat, out=sa)
+    np.cos(phi, out=cp)
+    np.cos(alphat, out=u)
+    np.sin(phi, out=v)
+    np.multiply(sa, v, out=v)
+    np.multiply(sa, cp, out=w)
+
+def _ab_from_ap(alphat, phi, alpha, beta, scratch):
+    sa, ca, sp, cp = scratch
+    np.sin(alphat, out=sa)
+    np.cos(alphat, out=ca)
+    np.sin(phi, out=sp)
+    np.cos(phi, out=cp)
+    np.multiply(sa, cp, out=cp)         # w
+    np.multiply(sa, sp, out=sp)         # v (|v| <= 1, as V = 1)
+    np.arctan2(cp, ca, out=alpha)
+    np.arcsin(sp, out=beta)
 
+def _ap_from_ab(alpha, beta, alphat, phi, scratch):
+    sa, ca, sb, cb = scratch
+    np.sin(alpha, out=sa)
+    np.cos(alpha, out=ca)
+    np.sin(beta, out=sb)
+    np.cos(beta, out=cb)
+    np.multiply(cb, sa, out=sa)         # w
+    np.multiply(cb, ca, out=ca)         # u
+    np.arctan2(sb, sa, out=phi)
+    np.arctan2(_rss(sb, sa, cb, sa), ca, out=alphat)
@@ -0,0 +1,196 @@
+''' On-disk cache of parsed data files
+
+    Parsing large ASCII grids and solutions is slow, so grids.load and
+    tecio.read_dat can optionally store the arrays they parse in a cache
+    directory and memory map them on later loads of the same file:
+
+        blocks = grids.load('grid.p3d', cache=True)
+        zones  = tecio.read_dat('flow.dat', cache=Cache('/scratch/cache'))
+
+    Entries are keyed by the file's path, size and modification time (and
+    optionally a hash of its content) plus the options it was read with.
+    The least recently used entries are evicted once the total size of the
+    cache exceeds its limit. Arrays loaded from the cache are read-only.
+'''
+import hashlib
+import json
+import logging
+import numpy as np
+import os
+import shutil
+import tempfile
+
+log = logging.getLogger(__name__)
+
+# Default cache location may be overridden with this environment variable
+CACHE_DIR_VARIABLE = 'AERO_UTIL_CACHE_DIR'
+DEFAULT_MAX_SIZE   = 4 << 30
+
+# Arrays smaller than this are read into memory instead of memory mapped
+_MMAP_THRESHOLD = 1 << 16
+
+_META_FILE = 'meta.json'
+_default_cache = None
+
+
+#----------------------------------------------------------------------------
+# Public API Functions
+#----------------------------------------------------------------------------
+class Cache:
+    ''' Size-bounded, least recently used cache of parsed arrays
+
+        INPUTS:
+          directory     str|Path  Cache location (default: the directory in
+                                  $AERO_UTIL_CACHE_DIR, else
+                                  ~/.cache/aero_util)
+          max_size      int       Maximum total size of entries in bytes
+          hash_content  bool      If True, keys include a SHA-256 hash of
+                                  the file, so entries are only reused if
+                                  the content is unchanged (slower, but
+                                  immune to mtime being preserved on copy)
+    '''
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE, hash_content=False):
+        if directory is None:
+            directory = os.environ.get(CACHE_DIR_VARIABLE) or \
+                os.path.join(os.path.expanduser('~'), '.cache', 'aero_util')
+        self.directory = os.fspath(directory)
+        self.max_size = max_size
+        self.hash_content = hash_content
+
+    def fetch(self, path, kind, params, read, pack, unpack):
+        ''' Return the parsed data of a file, from the cache if possible
+
+            INPUTS:
+              path    str|Path  Data file
+              kind    str       Name of the reader, e.g. 'grids.load'
+              params  object    Reader options; its repr is part of the key
+              read    callable  read(path) parses the file
+              pack    callable  pack(data) returns (list(np.array), meta),
+                                where meta is JSON serializable
+              unpack  callable  unpack(arrays, meta) rebuilds the data
+        '''
+        key = self.key(path, kind, params)
+        entry = self.load(key)
+        if entry is not None:
+            log.info('Loaded "%s" from cache entry %s', path, key)
+            return unpack(*entry)
+        data = read(path)
+        self.store(key, *pack(data))
+        return data
+
+    def key(self, path, kind, params=None):
+        ''' Return the cache key of a file read by kind with params '''
+        stat = os.stat(path)
+        fields = [os.path.abspath(path), stat.st_size, stat.st_mtime_ns, kind, repr(params)]
+        if self.hash_content:
+            fields.append(_file_hash(path))
+        return hashlib.sha256(json.dumps(fields).encode()).hexdigest()
+
+    def load(self, key):
+        ''' Return (arrays, meta) of an entry, or None if it is not cached '''
+        entry = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(entry, _META_FILE)) as f:
+                meta = json.load(f)
+            arrays = [_load_array(os.path.join(entry, f'{n}.npy'))
+                      for n in range(meta['count'])]
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(os.path.join(entry, _META_FILE))     # Mark as recently used
+        except OSError as e:    # Read-only cache, or evicted by another process
+            log.debug('Unable to mark cache entry "%s" as used: %s', key, e)
+        return arrays, meta['meta']
+
+    def store(self, key, arrays, meta):
+        ''' Add an entry, then evict old entries if over the size limit.
+            Failure to write the cache is logged, but not an error.
+        '''
+        size = sum(a.nbytes for a in arrays)
+        if size > self.max_size:
+            log.info('Not caching %d bytes; cache limit is %d', size, self.max_size)
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.directory)
+            for n, data in enumerate(arrays):
+                np.save(os.path.join(tmp, f'{n}.npy'), data, allow_pickle=False)
+            with open(os.path.join(tmp, _META_FILE), 'w') as f:
+                json.dump({'count': len(arrays), 'meta': meta}, f)
+            try:
+                os.rename(tmp, os.path.join(self.directory, key))
+            except OSError:         # Stored concurrently by another process
+                shutil.rmtree(tmp, ignore_errors=True)
+        except OSError as e:
+            log.warning('Unable to write cache entry in "%s": %s', self.directory, e)
+            return
+        self.evict()
+
+    def evict(self, max_size=None):
+        ''' Remove least recently used entries until the cache fits in
+            max_size bytes (default: the cache limit)
+        '''
+        max_size = self.max_size if max_size is None else max_size
+        entries = []
+        for key in self.keys():
+            entry = os.path.join(self.directory, key)
+            try:
+                used = os.stat(os.path.join(entry, _META_FILE)).st_mtime_ns
+                size = sum(e.stat().st_size for e in os.scandir(entry))
+            except OSError:
+                continue
+            entries.append((used, size, entry))
+        total = sum(size for used, size, entry in entries)
+        for used, size, entry in sorted(entries):
+            if total <= max_size:
+                break
+            log.info('Evicting cache entry "%s"', entry)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        ''' Remove all entries '''
+        self.evict(0)
+
+    def keys(self):
+        ''' Return keys of all entries in the cache '''
+        try:
+            return [e.name for e in os.scandir(self.directory)
+                    if e.is_dir() and not e.name.startswith('.')]
+        except OSError:
+            return []
+
+
+def get_cache(cache):
+    ''' Return the Cache for a cache= argument: True for the default cache,
+        a directory, or a Cache object
+    '''
+    global _default_cache
+    if isinstance(cache, Cache):
+        return cache
+    if cache is True:
+        if _default_cache is None:
+            _default_cache = Cache()
+        return _default_cache
+    return Cache(cache)
+
+
+#----------------------------------------------------------------------------
+# Helper Functions
+#----------------------------------------------------------------------------
+def _load_array(path):
+    ''' Load an array file, memory mapping it unless it is small '''
+    if os.path.getsize(path) < _MMAP_THRESHOLD:
+        data = np.load(path, allow_pickle=False)
+        data.flags.writeable = False
+        return data
+    return np.load(path, mmap_mode='r', allow_pickle=False)
+
+def _file_hash(path, chunk_size=1 << 20):
+    ''' Return SHA-256 hex digest of a file's content '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,73 @@
+''' Transparent decompression of input files '''
+
+import bz2
+import gzip
+import io
+import lzma
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Leading bytes identifying each supported compression format
+_SIGNATURES = [
+    ('gzip', b'\x1f\x8b'),
+    ('bz2',  b'BZh'),
+    ('xz',   b'\xfd7zXZ\x00'),
+    ('zstd', b'\x28\xb5\x2f\xfd'),
+]
+
+
+#----------------------------------------------------------------------------
+# Public API Functions
+#----------------------------------------------------------------------------
+def detect_compression(path_or_file):
+    ''' Return compression format of a file ('gzip', 'bz2', 'xz', 'zstd')
+        or None if it is not compressed. File objects must support peek()
+        or seek(); their position is not changed.
+    '''
+    if hasattr(path_or_file, 'read'):
+        if isinstance(path_or_file, io.TextIOBase):
+            return None
+        magic = peek(path_or_file, 6)
+    else:
+        with open(path_or_file, 'rb') as f:
+            magic = f.read(6)
+    for name, signature in _SIGNATURES:
+        if magic.startswith(signature):
+            return name
+    return None
+
+def open_compressed(path_or_file):
+    ''' Open a file for binary reading, decompressing it on the fly
+
+        The compression format is detected from the leading bytes of the
+        file, not its name. Data is decompressed as it is read, so no
+        temporary copy is made. Uncompressed files and text file objects
+        are returned as-is. Closing the result closes files opened from a
+        path, but never a file object passed in by the caller.
+    '''
+    compression = detect_compression(path_or_file)
+    is_path = not hasattr(path_or_file, 'read')
+    if compression is None:
+        return open(path_or_file, 'rb') if is_path else path_or_file
+    if compression == 'gzip':
+        return gzip.open(path_or_file, 'rb')
+    if compression == 'bz2':
+        return bz2.open(path_or_file, 'rb')
+    if compression == 'xz':
+        return lzma.open(path_or_file, 'rb')
+    if zstandard is None:
+        raise ImportError('Reading zstd compressed files requires the "zstandard" package')
+    f = open(path_or_file, 'rb') if is_path else path_or_file
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f, closefd=is_path))
+
+def peek(f, size):
+    ''' Return leading bytes of a file object without consuming them '''
+    if hasattr(f, 'peek'):
+        return f.peek(size)[:size]
+    position = f.tell()
+    data = f.read(size)
+    f.seek(position)
+    return data
@@ -1,12 +1,23 @@
 ''' Core toolbox components for general-purpose calculations '''
-import pint
+import functools
 import numpy as np
+import os
 
 
 #-------------------------------------------------------------------------------
 # Unit Conversion (Pint Wrappers)
 #-------------------------------------------------------------------------------
-_UREG = pint.UnitRegistry()
+# The unit registry is built on first use, since importing pint and parsing
+# its definitions takes a large part of a second. Set this environment
+# variable to a directory (or ":auto:" for pint's default) to cache the
+# parsed definitions there, which makes building the registry ~10x faster
+# (requires pint 0.18+).
+UNIT_CACHE_VARIABLE = 'AERO_UTIL_UNIT_CACHE'
+
+_ureg = None
+
+# Unit pairs whose conversion factor/offset are remembered
+_CONVERSION_CACHE_SIZE = 1024
 
 deg = np.degrees
 rad = np.radians
@@ -22,7 +33,7 @@ def convert(value, uin, uout):
         OUTPUTS:
             cvalue  float     The converted value
     '''
-    return _UREG.convert(value, uin, uout)
+    return _apply_conversion(value, _conversion(uin, uout), _pint_convert, uin, uout)
 
 def convert_from(value, uin):
     ''' Convert value from input units to SI
@@ -34,7 +45,7 @@ def convert_from(value, uin):
         OUTPUTS:
             cvalue  float     The converted value
     '''
-    return _UREG.Quantity(value, uin).to_base_units().magnitude
+    return _apply_conversion(value, _conversion(uin, None), _to_base, uin)
 
 def convert_to(value, uout):
     ''' Convert value from SI to output units
@@ -46,8 +57,7 @@ def convert_to(value, uout):
         OUTPUTS:
             cvalue  float     The converted value
     '''
-    si_unit = _UREG(uout).to_base_units().units
-    return _UREG.convert(value, si_unit, uout)
+    return _apply_conversion(value, _conversion(None, uout), _from_base, uout)
 
 
 #-------------------------------------------------------------------------------
@@ -62,19 +72,27 @@ def convert_to(value, uout):
 #       The functions below return the change-of-basis (a.k.a passive or alias)
 #       direction cosine matrix, TAB, which allows computing [b1,b2,b3] given
 #       [a1,a2,a3].
+#
+#       Angles (and axes) may also be arrays, e.g. a time history, in which
+#       case a stack of DCMs with shape angles.shape + (3,3) is returned,
+#       equal to the DCMs computed one angle at a time.
+
+# Vectors transformed at a time by transform, bounding temporary memory
+_TRANSFORM_CHUNK = 1 << 18
 
 def rotate_axis(axis, angle=None, angle_deg=None):
     ''' Return DCM for coordinate system rotation about an arbitrary axis
 
         INPUTS:
-            axis       float(3)  Unit vector specifying axis of rotation
+            axis       float(3)  Vector specifying axis of rotation, or
+                                 array (...,3) of an axis for each angle
             angle      float     Angle of rotation [rad]
             angle_deg  float     Angle of rotation [deg]
 
         OUTPUTS:
-            dcm        np.array  3x3 rotation matrix
+            dcm        np.array  3x3 rotation matrix, or (...,3,3) stack
     '''
-    x,y,z = axis
+    x,y,z = np.moveaxis(np.asarray(axis, dtype=float), -1, 0)
     norm  = np.sqrt(x*x + y*y + z*z)
     x,y,z = x/norm, y/norm, z/norm
 
@@ -82,7 +100,7 @@ def rotate_axis(axis, angle=None, angle_deg=None):
     c,s = np.cos(a), np.sin(a)
     C   = 1.0 - c
 
-    return np.array([
+    return _dcm([
         [x*x*C + c,   x*y*C + z*s, x*z*C - y*s],
         [y*x*C - z*s, y*y*C + c,   y*z*C + x*s],
         [z*x*C + y*s, z*y*C - x*s, z*z*C + c  ],
@@ -93,24 +111,24 @@ def rotate_seq(sequence, angles=None, angles_deg=None):
 
         INPUTS:
             sequence    string    List of rotations, e.g. 'zyx','xyx'
-            angles      float(N)  Angles for each rotation [rad]
+            angles      float(N)  Angles for each rotation [rad]; each may
+                                  be an array, e.g. [psi, theta, phi]
+                                  time histories
             angles_deg  float(N)  Angles for each rotation [deg]
 
         OUTPUTS:
-            dcm        np.array  3x3 rotation matrix
+            dcm        np.array  3x3 rotation matrix, or (...,3,3) stack
+                                 composed by batched matrix products
     '''
-    angles = _set_angles(angles, angles_deg)
-    dcm = np.eye(3)
+    angles = _seq_angles(sequence, angles, angles_deg)
+    rotate = {'x': rotate_x, 'y': rotate_y, 'z': rotate_z}
+    dcm = None
     for axis, angle in zip(sequence.lower(), angles):
-        if axis == 'x':
-            dcm = rotate_x(angle) @ dcm
-        elif axis == 'y':
-            dcm = rotate_y(angle) @ dcm
-        elif axis == 'z':
-            dcm = rotate_z(angle) @ dcm
-        else:
+        if axis not in rotate:
             raise RuntimeError(f'Invalid rotation axis "{axis}"')
-    return dcm
+        R = rotate[axis](angle)
+        dcm = R if dcm is None else np.matmul(R, dcm)
+    return np.eye(3) if dcm is None else dcm
 
 def rotate_x(angle=None, angle_deg=None):
     ''' Return DCM for coordinate system rotation about the X-axis
@@ -120,13 +138,14 @@ def rotate_x(angle=None, angle_deg=None):
           angle_deg  float     Rotation angle about +X axis [deg]
 
         OUTPUTS:
-          dcm        np.array  3x3 rotation matrix
+          dcm        np.array  3x3 rotation matrix, or (...,3,3) stack
     '''
-    a = _set_angles(angle, angle_deg)
-    return np.array([
-        [1.0,  0.0,       0.0      ],
-        [0.0,  np.cos(a), np.sin(a)],
-        [0.0, -np.sin(a), np.cos(a)],
+    a   = _set_angles(angle, angle_deg)
+    c,s = np.cos(a), np.sin(a)
+    return _dcm([
+        [1.0,  0.0, 0.0],
+        [0.0,  c,   s  ],
+        [0.0, -s,   c  ],
     ])
 
 def rotate_y(angle=None, angle_deg=None):
@@ -137,13 +156,14 @@ def rotate_y(angle=None, angle_deg=None):
           angle_deg  float     Rotation angle about +Y axis [deg]
 
         OUTPUTS:
-          dcm        np.array  3x3 rotation matrix
+          dcm        np.array  3x3 rotation matrix, or (...,3,3) stack
     '''
-    a = _set_angles(angle, angle_deg)
-    return np.array([
-        [np.cos(a),  0.0, -np.sin(a)],
-        [0.0,        1.0,  0.0      ],
-        [np.sin(a),  0.0,  np.cos(a)],
+    a   = _set_angles(angle, angle_deg)
+    c,s = np.cos(a), np.sin(a)
+    return _dcm([
+        [c,    0.0, -s  ],
+        [0.0,  1.0,  0.0],
+        [s,    0.0,  c  ],
     ])
 
 def rotate_z(angle=None, angle_deg=None):
@@ -154,26 +174,358 @@ def rotate_z(angle=None, angle_deg=None):
           angle_deg  float     Rotation angle about +Z axis [deg]
 
         OUTPUTS:
-          dcm        np.array  3x3 rotation matrix
+          dcm        np.array  3x3 rotation matrix, or (...,3,3) stack
+    '''
+    a   = _set_angles(angle, angle_deg)
+    c,s = np.cos(a), np.sin(a)
+    return _dcm([
+        [ c,    s,    0.0],
+        [-s,    c,    0.0],
+        [ 0.0,  0.0,  1.0],
+    ])
+
+def transform(components, dcm, translation=None, out=None, chunk_size=None):
+    ''' Apply a DCM and translation to vectors in bulk, out = dcm @ v + t
+
+        Vectors are given by component arrays, e.g. [x, y, z] of a grid or
+        [u, v, w] of a velocity field, or one (...,3) array. They are
+        transformed a chunk at a time, so temporary memory is bounded by
+        chunk_size vectors rather than the size of the data.
+        Passing the inputs as out transforms them in place. 2D vectors
+        take a 2x2 DCM.
+
+        INPUTS:
+            components   list|np.array  Component arrays of equal shape, or
+                                        one array with vectors in the last
+                                        axis
+            dcm          np.array       3x3 matrix, or a stack of shape
+                                        components.shape + (3,3) with a
+                                        matrix for each vector
+            translation  float(3)       Offset added after rotation, or an
+                                        array with one for each vector
+            out          list|np.array  Outputs, like components (default:
+                                        new arrays)
+            chunk_size   int            Vectors per chunk
+
+        OUTPUTS:
+            out          list|np.array  The transformed vectors
+    '''
+    if isinstance(components, (list, tuple)):
+        arrays = [np.asarray(a) for a in components]
+    else:
+        vectors = np.asarray(components)
+        arrays = [vectors[..., n] for n in range(vectors.shape[-1])]
+    ndims = len(arrays)
+    shape = np.shape(arrays[0])
+    dcm = np.asarray(dcm)
+    assert dcm.shape[-2:] == (ndims, ndims), f'DCM must be {ndims}x{ndims} for {ndims} components'
+    assert dcm.ndim == 2 or dcm.shape[:-2] == shape, 'DCM stack must have one matrix per vector'
+    translation = np.zeros(ndims) if translation is None else np.asarray(translation)
+
+    if out is None:
+        dtype = np.result_type(*arrays, dcm, translation, float)
+        out = [np.empty(shape, dtype) for _ in range(ndims)]
+        if not isinstance(components, (list, tuple)):
+            out = np.stack(out, axis=-1)
+    outputs = out if isinstance(out, (list, tuple)) else [out[..., n] for n in range(ndims)]
+
+    for chunk in _chunks(shape, chunk_size or _TRANSFORM_CHUNK):
+        v = [a[chunk] for a in arrays]
+        d = dcm[chunk] if dcm.ndim > 2 else dcm
+        t = translation[chunk] if translation.ndim > 1 else translation
+        result = [sum(d[..., r, c] * v[c] for c in range(ndims)) + t[..., r]
+                  for r in range(ndims)]
+        for o, values in zip(outputs, result):      # After all are computed
+            o[chunk] = values
+    return out
+
+#-------------------------------------------------------------------------------
+# Quaternions
+#-------------------------------------------------------------------------------
+# NOTE: Quaternions are arrays [w, x, y, z] (scalar first), or (...,4) stacks
+#       of them. They represent the same change-of-basis rotations as the
+#       DCMs above: the quaternion of a rotation by angle a about unit axis n
+#       is [cos(a/2), n*sin(a/2)], and quat_to_dcm of it equals rotate_axis.
+#       Composition follows the DCMs, i.e. if T_AC = T_BC @ T_AB then
+#       q_AC = quat_multiply(q_BC, q_AB).
+
+def quat_multiply(q2, q1):
+    ''' Return quaternions of rotation q1 followed by q2 (the quaternion
+        counterpart of dcm2 @ dcm1)
+
+        INPUTS:
+            q2   np.array  (...,4) quaternions of the second rotation
+            q1   np.array  (...,4) quaternions of the first rotation
+
+        OUTPUTS:
+            q    np.array  (...,4) composed quaternions
+    '''
+    w1, x1, y1, z1 = np.moveaxis(np.asarray(q1, dtype=float), -1, 0)
+    w2, x2, y2, z2 = np.moveaxis(np.asarray(q2, dtype=float), -1, 0)
+    return np.stack([
+        w1*w2 - x1*x2 - y1*y2 - z1*z2,
+        w1*x2 + x1*w2 + y1*z2 - z1*y2,
+        w1*y2 - x1*z2 + y1*w2 + z1*x2,
+        w1*z2 + x1*y2 - y1*x2 + z1*w2,
+    ], axis=-1)
+
+def quat_seq(sequence, angles=None, angles_deg=None):
+    ''' Return quaternion for a sequence of x/y/z rotations (see rotate_seq)
+
+        INPUTS:
+            sequence    string    List of rotations, e.g. 'zyx','xyx'
+            angles      float(N)  Angles for each rotation [rad]; each may
+                                  be an array
+            angles_deg  float(N)  Angles for each rotation [deg]
+
+        OUTPUTS:
+            q           np.array  Quaternion [w,x,y,z], or (...,4) stack
+    '''
+    angles = _seq_angles(sequence, angles, angles_deg)
+    q = [1.0, 0.0, 0.0, 0.0]            # Components w, x, y, z
+    for axis, angle in zip(sequence.lower(), angles):
+        if axis not in 'xyz':
+            raise RuntimeError(f'Invalid rotation axis "{axis}"')
+        half = 0.5 * np.asarray(angle, dtype=float)
+        c, s = np.cos(half), np.sin(half)
+
+        # quat_multiply([c, s*e_i], q), expanded for the one nonzero axis i
+        i, j, k = (1 + ('xyz'.index(axis) + n) % 3 for n in range(3))
+        q[0], q[i], q[j], q[k] = (q[0]*c - q[i]*s, q[i]*c + q[0]*s,
+                                  q[j]*c + q[k]*s, q[k]*c - q[j]*s)
+    return np.stack(np.broadcast_arrays(*q), axis=-1)
+
+def quat_to_dcm(q):
+    ''' Return DCMs of quaternions
+
+        INPUTS:
+            q    np.array  Quaternion [w,x,y,z], or (...,4) stack; need
+                           not be normalized
+
+        OUTPUTS:
+            dcm  np.array  3x3 rotation matrix, or (...,3,3) stack
     '''
-    a = _set_angles(angle, angle_deg)
-    return np.array([
-        [ np.cos(a),  np.sin(a),  0.0],
-        [-np.sin(a),  np.cos(a),  0.0],
-        [ 0.0,        0.0,        1.0],
+    q = np.asarray(q, dtype=float)
+    w, x, y, z = np.moveaxis(q / np.linalg.norm(q, axis=-1, keepdims=True), -1, 0)
+    return _dcm([
+        [w*w + x*x - y*y - z*z, 2.0*(x*y + w*z),       2.0*(x*z - w*y)      ],
+        [2.0*(x*y - w*z),       w*w - x*x + y*y - z*z, 2.0*(y*z + w*x)      ],
+        [2.0*(x*z + w*y),       2.0*(y*z - w*x),       w*w - x*x - y*y + z*z],
     ])
 
+def quat_from_dcm(dcm):
+    ''' Return quaternions of DCMs, with w >= 0
+
+        Uses Shepperd's method: each quaternion is computed from the
+        largest of its components, which is accurate for any rotation.
+
+        INPUTS:
+            dcm  np.array  3x3 rotation matrix, or (...,3,3) stack
+
+        OUTPUTS:
+            q    np.array  Quaternion [w,x,y,z], or (...,4) stack
+    '''
+    T = np.asarray(dcm, dtype=float)
+    t00, t01, t02 = T[..., 0, 0], T[..., 0, 1], T[..., 0, 2]
+    t10, t11, t12 = T[..., 1, 0], T[..., 1, 1], T[..., 1, 2]
+    t20, t21, t22 = T[..., 2, 0], T[..., 2, 1], T[..., 2, 2]
+
+    # 4*q*q[n] for each choice of the largest component n
+    candidates = [
+        np.stack([1.0 + t00 + t11 + t22, t12 - t21, t20 - t02, t01 - t10], axis=-1),
+        np.stack([t12 - t21, 1.0 + t00 - t11 - t22, t01 + t10, t02 + t20], axis=-1),
+        np.stack([t20 - t02, t01 + t10, 1.0 - t00 + t11 - t22, t12 + t21], axis=-1),
+        np.stack([t01 - t10, t02 + t20, t12 + t21, 1.0 - t00 - t11 + t22], axis=-1),
+    ]
+    n = np.argmax(np.stack([t00 + t11 + t22, t00, t11, t22], axis=-1), axis=-1)
+    q = np.choose(n[..., np.newaxis], candidates)
+    q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+    return np.where(q[..., :1] < 0.0, -q, q)
+
+def quat_apply(q, vectors):
+    ''' Return vectors expressed in the rotated frame, i.e.
+        quat_to_dcm(q) @ vectors, without forming the DCMs
+
+        INPUTS:
+            q        np.array  Unit quaternion [w,x,y,z], or (...,4) stack
+            vectors  np.array  (...,3) vectors
+
+        OUTPUTS:
+            v        np.array  (...,3) rotated vectors
+    '''
+    w, x, y, z = np.moveaxis(np.asarray(q, dtype=float), -1, 0)
+    a, b, c    = np.moveaxis(np.asarray(vectors, dtype=float), -1, 0)
+
+    # v - 2w(u x v) + 2u x (u x v), for vector part u of q
+    i, j, k = y*c - z*b, z*a - x*c, x*b - y*a
+    return np.stack([
+        a - 2.0*(w*i - y*k + z*j),
+        b - 2.0*(w*j - z*i + x*k),
+        c - 2.0*(w*k - x*j + y*i),
+    ], axis=-1)
+
+def quat_slerp(q0, q1, t):
+    ''' Return spherical linear interpolation between quaternions
+
+        Interpolates along the shortest arc at constant angular rate, from
+        q0 at t=0 to q1 (or -q1, the same rotation) at t=1.
+
+        INPUTS:
+            q0   np.array  (...,4) unit quaternions at t=0
+            q1   np.array  (...,4) unit quaternions at t=1
+            t    float     Interpolation parameter(s), broadcast against
+                           the quaternion stacks
+
+        OUTPUTS:
+            q    np.array  (...,4) interpolated unit quaternions
+    '''
+    q0 = np.asarray(q0, dtype=float)
+    q1 = np.asarray(q1, dtype=float)
+    t  = np.asarray(t, dtype=float)[..., np.newaxis]
+    dot = np.sum(q0*q1, axis=-1, keepdims=True)
+    q1  = np.where(dot < 0.0, -q1, q1)
+    dot = np.minimum(np.abs(dot), 1.0)
+
+    theta = np.arccos(dot)
+    sin_theta = np.sin(theta)
+    small = sin_theta < 1e-6            # Nearly equal: linear is exact enough
+    with np.errstate(invalid='ignore', divide='ignore'):
+        w0 = np.where(small, 1.0 - t, np.sin((1.0 - t)*theta) / sin_theta)
+        w1 = np.where(small, t, np.sin(t*theta) / sin_theta)
+    q = w0*q0 + w1*q1
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+def quat_interp(t, tp, qp):
+    ''' Interpolate a time history of quaternions by SLERP between the
+        samples bracketing each time (the quaternion counterpart of
+        np.interp; times outside tp take the first/last sample)
+
+        INPUTS:
+            t    float(M)    Times at which to interpolate
+            tp   float(N)    Increasing sample times
+            qp   float(N,4)  Unit quaternion at each sample time
+
+        OUTPUTS:
+            q    np.array    (M,4) interpolated quaternions
+    '''
+    t  = np.asarray(t, dtype=float)
+    tp = np.asarray(tp, dtype=float)
+    qp = np.asarray(qp, dtype=float)
+    i  = np.clip(np.searchsorted(tp, t, side='right') - 1, 0, len(tp) - 2)
+    u  = np.clip((t - tp[i]) / (tp[i+1] - tp[i]), 0.0, 1.0)
+    return quat_slerp(qp[i], qp[i+1], u)
 
 #-------------------------------------------------------------------------------
 # Helper Functions
 #-------------------------------------------------------------------------------
 def _set_angles(angles=None, angles_deg=None):
     ''' Takes angles as either deg or radians, returning radians '''
-    if angles == None and angles_deg == None:
+    if angles is None and angles_deg is None:
         raise RuntimeError('Both angle and angle_deg are uninitialized')
-    if angles != None and angles_deg != None:
+    if angles is not None and angles_deg is not None:
         raise RuntimeError('Both angle and angle_deg are defined; please define one or the other')
-    if angles_deg:
+    if isinstance(angles_deg, (list, tuple)):
+        angles = [np.radians(a) for a in angles_deg]    # May mix scalars/arrays
+    elif angles_deg is not None:
         angles = np.radians(angles_deg)
     return angles
 
+def _seq_angles(sequence, angles=None, angles_deg=None):
+    ''' Return radian angles of a rotation sequence, checking there is one
+        (scalar or array) for each rotation, e.g. not an (N,3) array
+    '''
+    angles = _set_angles(angles, angles_deg)
+    if not isinstance(angles, (list, tuple)) and np.ndim(angles) == 0:
+        angles = [angles]
+    if len(angles) != len(sequence):
+        raise RuntimeError(f'Rotation sequence "{sequence}" needs {len(sequence)} angles, '
+                           f'got {len(angles)}; pass one scalar or array per rotation')
+    return angles
+
+@functools.lru_cache(maxsize=_CONVERSION_CACHE_SIZE)
+def _conversion(uin, uout):
+    ''' Return (factor, offset) such that converting value from uin to uout
+        (None for SI base units) is value*factor + offset, or None if the
+        conversion is not affine (e.g. logarithmic units). Computed once
+        through pint for each unit pair, which raises for invalid units.
+    '''
+    if uout is None:
+        convert = lambda value: _to_base(value, uin)
+    elif uin is None:
+        convert = lambda value: _from_base(value, uout)
+    else:
+        convert = lambda value: _pint_convert(value, uin, uout)
+    offset = float(convert(0.0))
+    if offset:              # Wide span limits cancellation error, e.g. K to degF
+        factor = (float(convert(1e3)) - float(convert(-1e3))) / 2e3
+    else:
+        factor = float(convert(1.0))
+    if not np.isclose(float(convert(2.0)), 2.0*factor + offset, rtol=1e-12, atol=0.0):
+        return None
+    return factor, offset
+
+def _apply_conversion(value, conversion, convert, *units):
+    ''' Convert value by a cached (factor, offset), else by pint '''
+    if conversion is None:
+        return convert(value, *units)
+    factor, offset = conversion
+    if isinstance(value, (list, tuple)):
+        value = np.asarray(value)
+    value = value * factor
+    return value + offset if offset else value
+
+def _registry():
+    ''' Return the pint unit registry, building it on first use '''
+    global _ureg
+    if _ureg is None:
+        import pint
+        folder = os.environ.get(UNIT_CACHE_VARIABLE)
+        _ureg = pint.UnitRegistry(cache_folder=folder) if folder else pint.UnitRegistry()
+    return _ureg
+
+def __getattr__(name):
+    ''' Provide the unit registry as _UREG, as in earlier versions '''
+    if name == '_UREG':
+        return _registry()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def _pint_convert(value, uin, uout):
+    ''' Convert value from uin to uout by pint '''
+    return _registry().convert(value, uin, uout)
+
+def _to_base(value, uin):
+    ''' Convert value from uin to SI base units by pint '''
+    return _registry().Quantity(value, uin).to_base_units().magnitude
+
+def _from_base(value, uout):
+    ''' Convert value from SI base units to uout by pint '''
+    ureg = _registry()
+    si_unit = ureg(uout).to_base_units().units
+    return ureg.convert(value, si_unit, uout)
+
+def _chunks(shape, size):
+    ''' Yield index tuples splitting an array of shape into views of at
+        most size elements (but at least one), whatever the shape
+    '''
+    if not shape:
+        yield (Ellipsis,)
+        return
+    axis, inner = len(shape) - 1, 1
+    while axis > 0 and inner*shape[axis] <= size:
+        inner *= shape[axis]
+        axis -= 1
+    rows = max(1, size // max(1, inner))
+    for index in np.ndindex(*shape[:axis]):
+        for i in range(0, shape[axis], rows):
+            yield index + (slice(i, i + rows),)
+
+def _dcm(rows):
+    ''' Return 3x3 matrix of nested lists of scalars or arrays, or a
+        (...,3,3) stack if any are arrays (broadcast against each other)
+    '''
+    elements = np.broadcast_arrays(*[e for row in rows for e in row])
+    dcm = np.empty(elements[0].shape + (9,))
+    for n, e in enumerate(elements):
+        dcm[..., n] = e
+    return dcm.reshape(elements[0].shape + (3, 3))
+
@@ -1,17 +1,38 @@
+import io
+import itertools
+import logging
+import mmap
 import numpy as np
-import xarray as xr
-from itertools import chain
+from . import core
+from .cache import get_cache
+from .compression import detect_compression, open_compressed, peek
+from .textio import TextStream, write_values
+from concurrent.futures import ProcessPoolExecutor
+
+log = logging.getLogger(__name__)
+
+# Bytes that may appear in the leading part of an ASCII Plot3D file
+_ASCII_BYTES = b' \t\r\n0123456789+-.eEdD'
+_SNIFF_SIZE  = 64
+
+# ASCII output format for each floating point precision, values per line
+_ASCII_FORMATS   = {4: '%.8E', 8: '%.16E'}
+_VALUES_PER_LINE = 5
+
+# Multipliers that hash quantized coordinates of face nodes to one integer
+_HASH_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9],
+                             dtype=np.uint64).view(np.int64)
 
 #-----------------------------------------------------------------------
 # Helper Functions
 #-----------------------------------------------------------------------
-def _load_blocks(f, nblock):
-    ''' Read Plot3D block data from file handle '''
+def _load_blocks(stream, nblock):
+    ''' Read Plot3D block data from a TextStream '''
 
     # Read header
     block_sizes = []
     for _ in range(nblock):
-        words = next(f).strip().split()
+        words = stream.readline().split()
         block_sizes.append(tuple(map(int, words)))
 
     # Set names that will used in xarray datasets
@@ -19,39 +40,761 @@ def _load_blocks(f, nblock):
     coord_names = ('i', 'j', 'k')[:ndims]
     data_names  = ('x', 'y', 'z')[:ndims]
 
-    # Parse coordinate data
+    # Parse coordinate data. All coordinates of a block are converted to
+    # numbers in bulk; each coordinate is a view into the block's array.
     blocks = []
-    words = chain.from_iterable(map(str.split, f))
     for size in block_sizes:
         coords = {n:range(s) for n,s in zip(coord_names, size)}
-        nvals  = int(np.product(size))
+        nvals  = int(np.prod(size))
+        vals   = stream.read_values(nvals*ndims).reshape(ndims, nvals)
         data   = {}
-        for name in data_names:
-            vals = np.fromiter(words, float, nvals)
-            vals = np.reshape(vals, size, order='F')
-            data[name] = (coord_names, vals)
-        blocks.append(xr.Dataset(data, coords=coords))
+        for name, v in zip(data_names, vals):
+            data[name] = (coord_names, np.reshape(v, size, order='F'))
+        blocks.append(_dataset(data, coords))
+
+    return blocks
+
+def _load_grid(f):
+    ''' Read Plot3D grid from a file handle in a single forward pass '''
+    stream = TextStream(f)
+    first = stream.peek_line()
+    if len(first.split()) == 1:
+        # If first line is a single integer, it's a block count and
+        # we have a multiblock grid. Proceed with read of all blocks.
+        stream.readline()
+        return _load_blocks(stream, int(first))
+
+    # If first line is multiple integers, its a single block grid.
+    return _load_blocks(stream, 1)
+
+def _is_binary(f):
+    ''' Return True if a file object holds binary rather than ASCII data '''
+    if isinstance(f, io.TextIOBase):
+        return False
+    return bool(peek(f, _SNIFF_SIZE).translate(None, _ASCII_BYTES))
+
+def _load_binary(buf):
+    ''' Read Plot3D grid from a buffer of binary data (bytes or mmap).
+        Arrays are views into the buffer; nothing is copied.
+    '''
+    for byteorder in ('<', '>'):
+        layout = _fortran_layout(buf, byteorder) or _stream_layout(buf, byteorder)
+        if layout is not None:
+            break
+    else:
+        raise ValueError('Unrecognized binary Plot3D file layout')
+
+    blocks = []
+    for offset, size, itemsize, iblank in layout:
+        ndims = len(size)
+        coord_names = ('i', 'j', 'k')[:ndims]
+        data_names  = ('x', 'y', 'z')[:ndims]
+        coords = {n:range(s) for n,s in zip(coord_names, size)}
+        nvals  = int(np.prod(size))
+        dtype  = np.dtype(f'{byteorder}f{itemsize}')
+        vals   = np.frombuffer(buf, dtype, ndims*nvals, offset).reshape(ndims, nvals)
+        data   = {}
+        for name, v in zip(data_names, vals):
+            data[name] = (coord_names, np.reshape(v, size, order='F'))
+        if iblank:
+            offset += ndims*nvals*itemsize
+            v = np.frombuffer(buf, byteorder + 'i4', nvals, offset)
+            data['iblank'] = (coord_names, np.reshape(v, size, order='F'))
+        blocks.append(_dataset(data, coords))
+    return blocks
+
+def _fortran_layout(buf, byteorder):
+    ''' Return (offset, size, itemsize, iblank) of each block of a Fortran
+        unformatted (sequential access) file, or None if buf is not one.
+        The block count record is optional for single block grids.
+    '''
+    records = []
+    pos = 0
+    while pos < len(buf):
+        if pos + 4 > len(buf):
+            return None
+        length = _int32s(buf, byteorder, pos, 1)[0]
+        end = pos + 4 + length
+        if length < 0 or end + 4 > len(buf) or _int32s(buf, byteorder, end, 1)[0] != length:
+            return None
+        records.append((pos + 4, length))
+        pos = end + 4
+
+    if records and records[0][1] == 4:
+        nblock = _int32s(buf, byteorder, records[0][0], 1)[0]
+        records = records[1:]
+    else:
+        nblock = 1
+    if nblock < 1 or len(records) != nblock + 1 or records[0][1] % (4*nblock):
+        return None
+    ndims = records[0][1] // (4*nblock)
+    if ndims not in (2, 3):
+        return None
+    sizes = _int32s(buf, byteorder, records[0][0], nblock*ndims).reshape(nblock, ndims)
+
+    layout = []
+    for size, (offset, length) in zip(sizes, records[1:]):
+        nvals = int(np.prod(size))
+        for itemsize, iblank in ((8, False), (8, True), (4, False), (4, True)):
+            if length == nvals*(ndims*itemsize + 4*iblank):
+                break
+        else:
+            return None
+        layout.append((offset, tuple(map(int, size)), itemsize, iblank))
+    return layout
 
+def _stream_layout(buf, byteorder):
+    ''' Return (offset, size, itemsize, iblank) of each block of a file
+        without record markers (C stream access), or None if no layout
+        matches the file size. The block count is optional for single
+        block grids; precision and IBLANK are inferred from the file size.
+    '''
+    for multi in (True, False):
+        offset = 4 if multi else 0
+        nblock = _int32s(buf, byteorder, 0, 1)[0] if multi and len(buf) >= 4 else 1
+        for ndims in (3, 2):
+            start = offset + 4*nblock*ndims
+            if nblock < 1 or start > len(buf):
+                continue
+            sizes = _int32s(buf, byteorder, offset, nblock*ndims).reshape(nblock, ndims)
+            if np.any(sizes < 1):
+                continue
+            nvals = np.prod(sizes.astype(np.int64), axis=1)
+            for itemsize, iblank in ((8, False), (8, True), (4, False), (4, True)):
+                if start + int(nvals.sum())*(ndims*itemsize + 4*iblank) != len(buf):
+                    continue
+                offsets = start + np.cumsum(nvals)*(ndims*itemsize + 4*iblank) \
+                    - nvals*(ndims*itemsize + 4*iblank)
+                return [
+                    (int(o), tuple(map(int, size)), itemsize, iblank)
+                    for o, size in zip(offsets, sizes)
+                ]
+    return None
+
+def _int32s(buf, byteorder, offset, count):
+    ''' Return count 32-bit integers from buf at offset '''
+    return np.frombuffer(buf, byteorder + 'i4', count, offset).astype(np.int64)
+
+class _Writer:
+    ''' Writes the records of an ASCII or binary Plot3D file.
+        Binary records are written as Fortran unformatted records if
+        records is True, else as a plain stream of values.
+    '''
+
+    def __init__(self, f, binary, dtype, records=True, byteorder='<'):
+        self.f = f
+        self.binary = binary
+        self.dtype = np.dtype(dtype).newbyteorder(byteorder)
+        self.int32 = np.dtype('i4').newbyteorder(byteorder)
+        self.records = records
+        self.fmt = _ASCII_FORMATS[self.dtype.itemsize]
+
+    def sizes(self, sizes):
+        ''' Write block sizes; one record, or one line per block if ASCII '''
+        if self.binary:
+            self.record([np.ravel(sizes)], [self.int32])
+        else:
+            self.f.write(''.join(' ' + ' '.join(map(str, s)) + '\n' for s in sizes))
+
+    def values(self, arrays, ints=()):
+        ''' Write floating point arrays then integer arrays in Fortran order '''
+        if self.binary:
+            self.record(list(arrays) + list(ints),
+                        [self.dtype]*len(arrays) + [self.int32]*len(ints))
+            return
+        for data in arrays:
+            write_values(self.f, np.ravel(data, order='F'), [self.fmt]*_VALUES_PER_LINE)
+        for data in ints:
+            write_values(self.f, np.ravel(data, order='F'), ['%d']*_VALUES_PER_LINE)
+
+    def record(self, arrays, dtypes):
+        ''' Write arrays as a single binary record '''
+        arrays = [np.ravel(a, order='F').astype(t, copy=False) for a, t in zip(arrays, dtypes)]
+        marker = np.array([sum(a.nbytes for a in arrays)], self.int32).data
+        if self.records:
+            self.f.write(marker)
+        for data in arrays:
+            self.f.write(data.data)
+        if self.records:
+            self.f.write(marker)
+
+def _save(filename, binary, write):
+    ''' Open filename (or use a file object) and call write(f) '''
+    if hasattr(filename, 'write'):
+        write(filename)
+    else:
+        with open(filename, 'wb' if binary else 'w') as f:
+            write(f)
+
+def _pack_blocks(blocks):
+    ''' Return arrays and JSON metadata of blocks for the parse cache '''
+    arrays = []
+    meta = []
+    for b in blocks:
+        variables = {}
+        for name, data in b.data_vars.items():
+            variables[name] = len(arrays)
+            arrays.append(data.values)
+        meta.append({'dims': list(b.x.dims), 'variables': variables})
+    return arrays, meta
+
+def _unpack_blocks(arrays, meta):
+    ''' Rebuild blocks from the parse cache '''
+    blocks = []
+    for entry in meta:
+        dims = tuple(entry['dims'])
+        data = {name: (dims, arrays[n]) for name, n in entry['variables'].items()}
+        shape = arrays[entry['variables']['x']].shape
+        blocks.append(_dataset(data, {d: range(s) for d, s in zip(dims, shape)}))
     return blocks
 
+def _dataset(data, coords):
+    ''' Return an xr.Dataset of a block. xarray is imported on first use, as
+        it takes a large part of a second and most users of the package
+        never need it.
+    '''
+    import xarray as xr
+    return xr.Dataset(data, coords=coords)
+
+def _block_dims(blocks):
+    ''' Return the dimension names shared by all blocks '''
+    dims = blocks[0].x.dims
+    assert all(b.x.dims == dims for b in blocks), 'Blocks must all be 2D or 3D'
+    return dims
+
+def _check_cells(blocks):
+    ''' Raise ValueError if any block has no cells, e.g. a 3D block with a
+        single k plane
+    '''
+    for n, block in enumerate(blocks):
+        if min(block.x.shape) < 2:
+            sizes = dict(zip(block.x.dims, block.x.shape))
+            raise ValueError(f'Block {n + 1} has no cells: {sizes}')
+
+def _coordinates(block):
+    ''' Return node coordinates of a block as an (i, j[, k], ndims) array '''
+    dims = block.x.dims
+    names = ('x', 'y', 'z')[:len(dims)]
+    return np.stack([block[n].transpose(*dims).values for n in names], axis=-1)
+
+def _faces(X, axis):
+    ''' Return area vectors and centroids of the faces of the cells of node
+        coordinates X normal to axis. Area vectors point towards
+        increasing index for a right-handed grid. For 3D grids, quad
+        faces use half the cross product of their diagonals.
+    '''
+    ndims = X.shape[-1]
+    order = [(axis + n) % ndims for n in range(ndims)]
+    Y = np.moveaxis(X, order, range(ndims))
+    if ndims == 2:
+        edge = Y[:, 1:] - Y[:, :-1]
+        sign = 1 if axis == 0 else -1
+        S = sign * np.stack([edge[..., 1], -edge[..., 0]], axis=-1)
+        C = 0.5*(Y[:, 1:] + Y[:, :-1])
+    else:
+        d1 = Y[:, 1:, 1:] - Y[:, :-1, :-1]
+        d2 = Y[:, :-1, 1:] - Y[:, 1:, :-1]
+        S = 0.5*np.cross(d1, d2)
+        C = 0.25*(Y[:, :-1, :-1] + Y[:, 1:, :-1] + Y[:, :-1, 1:] + Y[:, 1:, 1:])
+    return np.moveaxis(S, range(ndims), order), np.moveaxis(C, range(ndims), order)
+
+def _cell_volumes(X):
+    ''' Return cell volumes (areas in 2D) of node coordinates X by the
+        divergence theorem, V = sum(centroid . area)/ndims over faces.
+        Exact for cells with bilinear faces; negative for inverted cells.
+    '''
+    ndims = X.shape[-1]
+    volume = 0.0
+    for axis in range(ndims):
+        S, C = _faces(X, axis)
+        volume = volume + np.diff(np.sum(C*S, axis=-1), axis=axis)
+    return volume / ndims
+
+def _jacobian(X):
+    ''' Return determinant of d(x,y[,z])/d(i,j[,k]) at the nodes of X,
+        using second order central differences (one-sided at boundaries)
+    '''
+    ndims = X.shape[-1]
+    J = np.stack(np.gradient(X, axis=tuple(range(ndims))), axis=-1)
+    return np.linalg.det(J)
+
+def _block_metrics(block):
+    ''' Return block with metric variables added (see metrics) '''
+    X = _coordinates(block)
+    ndims = X.shape[-1]
+    dims = block.x.dims
+    cells = tuple('c' + d for d in dims)
+    data = {'volume': (cells, _cell_volumes(X)), 'jacobian': (dims, _jacobian(X))}
+    for axis, dim in enumerate(dims):
+        S, C = _faces(X, axis)
+        face_dims = cells[:axis] + (dim,) + cells[axis+1:]
+        area = np.linalg.norm(S, axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            normal = S / area[..., np.newaxis]
+        data['area_' + dim] = (face_dims, area)
+        data['normal_' + dim] = (face_dims + ('component',), normal)
+    coords = {'component': list('xyz'[:ndims])}
+    return block.assign(data).assign_coords(coords)
+
+def _block_quality(block):
+    ''' Return quality summary of a block (see check_quality) '''
+    X = _coordinates(block)
+    volume = _cell_volumes(X)
+    negative = volume <= 0
+    ratio = 1.0
+    for axis in range(volume.ndim):
+        a = np.moveaxis(volume, axis, 0)
+        v0, v1 = a[:-1], a[1:]
+        valid = (v0 > 0) & (v1 > 0)
+        if np.any(valid):
+            r = np.maximum(v0, v1)[valid] / np.minimum(v0, v1)[valid]
+            ratio = max(ratio, float(r.max()))
+    return {
+        'cells': int(volume.size),
+        'negative_volumes': int(np.count_nonzero(negative)),
+        'worst_cell': tuple(int(i) for i in np.unravel_index(np.argmin(volume), volume.shape)),
+        'min_volume': float(volume.min()),
+        'max_volume': float(volume.max()),
+        'max_volume_ratio': ratio,
+        'min_jacobian': float(_jacobian(X).min()),
+    }
+
+def _map_blocks(func, blocks, processes):
+    ''' Apply func to each block, in a pool of processes if requested '''
+    if not processes or processes == 1 or len(blocks) < 2:
+        return [func(b) for b in blocks]
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(func, blocks))
+
+def _face_nodes(blocks):
+    ''' Return the nodes on the faces of all blocks as flat arrays
+
+        Face f = 2*axis + side of block b has id 2*ndims*b + f. Its nodes
+        are indexed by (u, v) over the other axes in order; v has length 1
+        for 2D grids.
+
+        OUTPUTS:
+          xyz     np.array  (n, ndims) coordinates of each face node
+          node    np.array  Global id of each node, shared by the faces
+                            meeting at block edges
+          shapes  np.array  (nfaces, 2) node counts (nu, nv) of each face
+          starts  np.array  Index of the first node of each face
+    '''
+    xyz, node, shapes = [], [], []
+    base = 0
+    for block in blocks:
+        X = _coordinates(block)
+        ids = np.arange(X[..., 0].size).reshape(X.shape[:-1]) + base
+        base += ids.size
+        for axis in range(X.ndim - 1):
+            for side in (0, -1):
+                face = np.take(X, side, axis=axis)
+                xyz.append(face.reshape(-1, face.shape[-1]))
+                node.append(np.take(ids, side, axis=axis).ravel())
+                shapes.append((face.shape[:-1] + (1,))[:2])
+    shapes = np.array(shapes)
+    starts = np.concatenate([[0], np.cumsum(np.prod(shapes, axis=1))[:-1]])
+    return np.concatenate(xyz), np.concatenate(node), shapes, starts
+
+def _min_edge(xyz, shapes, starts):
+    ''' Return length of the shortest nonzero edge between face nodes '''
+    sizes = np.prod(shapes, axis=1)
+    local = np.arange(len(xyz)) - np.repeat(starts, sizes)
+    nv = np.repeat(shapes[:, 1], sizes)
+    nu = np.repeat(shapes[:, 0], sizes)
+    lengths = [np.linalg.norm(xyz[1:] - xyz[:-1], axis=1)[(local % nv < nv - 1)[:-1]]]
+    step = local // nv < nu - 1
+    lengths.append(np.linalg.norm(xyz[step] - xyz[np.flatnonzero(step) + nv[step]], axis=1))
+    lengths = np.concatenate(lengths)
+    lengths = lengths[lengths > 0]
+    return lengths.min() if len(lengths) else 1.0
+
+def _coincident(xyz, tol):
+    ''' Return an id for each point, equal for points whose coordinates
+        round to the same multiples of tol. Rounded coordinates are hashed
+        to one integer for a fast 1D sort; if any hashes collide, rounded
+        coordinates are compared directly instead.
+    '''
+    q = np.rint(xyz / tol).astype(np.int64)
+    with np.errstate(over='ignore'):
+        h = q @ _HASH_MULTIPLIERS[:q.shape[1]]
+    _, first, ids = np.unique(h, return_index=True, return_inverse=True)
+    if not np.array_equal(q, q[first[ids]]):
+        log.debug('Hash collision; comparing quantized coordinates')
+        rows = np.ascontiguousarray(q).view([('', q.dtype)]*q.shape[1])
+        ids = np.unique(rows, return_inverse=True)[1].ravel()
+    return ids
+
+def _coincident_pairs(ids, node):
+    ''' Return index pairs (a, b) of points with equal ids that are
+        different nodes, in both orders
+    '''
+    order = np.argsort(ids, kind='stable')
+    sorted_ids = ids[order]
+    start = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    count = np.diff(np.r_[start, len(ids)])
+    start, count = start[count > 1], count[count > 1]
+    size = count**2
+    group = np.repeat(np.arange(len(start)), size)
+    offset = np.arange(size.sum()) - np.repeat(np.cumsum(size) - size, size)
+    a = order[start[group] + offset // count[group]]
+    b = order[start[group] + offset % count[group]]
+    keep = node[a] != node[b]
+    return a[keep], b[keep]
+
+def _rectangles(mask):
+    ''' Split the True entries of a 2D mask into rectangles, returning
+        (start, stop) index pairs
+    '''
+    mask = mask.copy()
+    rects = []
+    while mask.any():
+        u0, v0 = np.unravel_index(np.argmax(mask), mask.shape)
+        v1 = v0 + np.argmin(np.append(mask[u0, v0:], False))
+        u1 = u0 + np.argmin(np.append(np.all(mask[u0:, v0:v1], axis=1), False))
+        mask[u0:u1, v0:v1] = False
+        rects.append(((u0, v0), (u1, v1)))
+    return rects
+
+def _patch_range(shape, face, begin, end):
+    ''' Return node indices of the corners of a patch of face number face
+        (2*axis + side) of a block of shape, from its face (u, v) indices
+    '''
+    axis, side = divmod(face, 2)
+    others = [n for n in range(len(shape)) if n != axis]
+    corners = []
+    for uv in (begin, end):
+        ijk = [side * (shape[axis] - 1)] * len(shape)
+        for n, d in enumerate(others):
+            ijk[d] = int(uv[n])
+        corners.append(tuple(ijk))
+    return corners
+
+def _patch_transform(ndims, face, donor_face, T):
+    ''' Return the CGNS-style transform (see connectivity) of a patch
+        from its face numbers and face (u, v) index map T
+    '''
+    axis, side = divmod(face, 2)
+    donor_axis, donor_side = divmod(donor_face, 2)
+    others = [n for n in range(ndims) if n != axis]
+    donor_others = [n for n in range(ndims) if n != donor_axis]
+    transform = [0]*ndims
+    transform[axis] = (donor_axis + 1) * (1 if side != donor_side else -1)
+    for r, d in enumerate(donor_others):
+        c = int(np.flatnonzero(T[r])[0])
+        transform[others[c]] = int(T[r, c]) * (d + 1)
+    return tuple(transform)
+
 
 #-----------------------------------------------------------------------
 # Public API
 #-----------------------------------------------------------------------
-def load(filename):
-    ''' Load block-structured grid from ASCII Plot3D file (2D or 3D) '''
+def load(filename, cache=None):
+    ''' Load block-structured grid from a Plot3D file (2D or 3D)
 
-    with open(filename) as f:
-        line = next(f).strip().split()
-        if len(line) == 1:
-            # If first line is a single integer, it's a block count and
-            # we have a multiblock grid. Proceed with read of all blocks.
-            return _load_blocks(f, int(line[0]))
+        ASCII and binary files are detected automatically. Binary files
+        may be Fortran unformatted (with record markers) or C stream
+        files, either byte order, single or double precision, with or
+        without IBLANK, which is returned as an int32 'iblank' variable.
+        Binary data is memory mapped: coordinates are read-only views of
+        the file and pages are only read from disk when accessed.
 
-    # If first line is multiple integers, its a single block grid.
-    # Reopen file to reset the iterator and read the block.
-    with open(filename) as f:
-        return _load_blocks(f, 1)
+        Accepts a path or file object. Compressed files (gzip, bz2, xz,
+        zstd) are decompressed on the fly without a temporary copy;
+        compressed binary files and binary file objects are read into
+        memory.
+
+        Pass cache=True (or a directory or cache.Cache) to store the parsed
+        grid in an on-disk cache and memory map it from there on later
+        loads of the same file; see aero_util.cache.
+    '''
+    if cache and not hasattr(filename, 'read'):
+        return get_cache(cache).fetch(
+            filename, 'grids.load', None, load, _pack_blocks, _unpack_blocks)
+    if not hasattr(filename, 'read') and detect_compression(filename) is None:
+        with open(filename, 'rb') as f:
+            if _is_binary(f):
+                return _load_binary(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    if hasattr(filename, 'read'):
+        f = open_compressed(filename)
+        return _load_binary(f.read()) if _is_binary(f) else _load_grid(f)
+    with open_compressed(filename) as f:
+        return _load_binary(f.read()) if _is_binary(f) else _load_grid(f)
+
+def save(filename, blocks, binary=False, dtype=None, iblank=None,
+         records=True, byteorder='<', multiblock=True):
+    ''' Save block-structured grid to a Plot3D file (2D or 3D)
+
+        Blocks are xr.Dataset objects in the layout returned by load. Data
+        is written in bulk, a block at a time.
+
+        INPUTS:
+          filename    str|file   Output path or file object
+          blocks      list       xr.Dataset of each block
+          binary      bool       Write a binary instead of ASCII file
+          dtype       np.dtype   Precision of the coordinates ('f4' or
+                                 'f8'); default is that of the first block
+          iblank      bool       Write the 'iblank' variable of each block
+                                 (binary only); default is True if every
+                                 block has one
+          records     bool       Write Fortran record markers (binary only)
+          byteorder   str        '<' (little) or '>' (big endian)
+          multiblock  bool       Write the block count; may only be False
+                                 for single block grids
+    '''
+    dims = _block_dims(blocks)
+    names = ('x', 'y', 'z')[:len(dims)]
+    if iblank is None:
+        iblank = binary and all('iblank' in b for b in blocks)
+    if iblank and not binary:
+        raise ValueError('IBLANK is only supported for binary files')
+    assert multiblock or len(blocks) == 1, 'Multiple blocks require multiblock=True'
+    dtype = np.dtype(blocks[0].x.dtype if dtype is None else dtype)
+
+    def write(f):
+        w = _Writer(f, binary, dtype, records, byteorder)
+        if multiblock:
+            w.sizes([[len(blocks)]])
+        w.sizes([[b.sizes[d] for d in dims] for b in blocks])
+        for b in blocks:
+            w.values([b[n].transpose(*dims).values for n in names],
+                     [b.iblank.transpose(*dims).values] if iblank else [])
+    _save(filename, binary, write)
+
+def save_function(filename, blocks, variables=None, conditions=None,
+                  binary=False, dtype=None, records=True, byteorder='<',
+                  multiblock=True):
+    ''' Save solution variables of a block-structured grid to a Plot3D
+        function (*.f) file, or a Q file (*.q) if conditions are given.
+
+        Options are as for save. Variables are data variables of the
+        blocks, by default all except the coordinates and IBLANK. A Q file
+        holds the flow conditions (mach, alpha, reynolds, time) ahead of
+        each block's data and its block sizes omit the variable count; its
+        variables should be the 4 (2D) or 5 (3D) conserved variables.
+    '''
+    dims = _block_dims(blocks)
+    if variables is None:
+        variables = [v for v in blocks[0].data_vars if v not in ('x', 'y', 'z', 'iblank')]
+    assert multiblock or len(blocks) == 1, 'Multiple blocks require multiblock=True'
+    dtype = np.dtype(blocks[0][variables[0]].dtype if dtype is None else dtype)
+
+    def write(f):
+        w = _Writer(f, binary, dtype, records, byteorder)
+        if multiblock:
+            w.sizes([[len(blocks)]])
+        sizes = [[b.sizes[d] for d in dims] for b in blocks]
+        w.sizes(sizes if conditions is not None else [s + [len(variables)] for s in sizes])
+        for b in blocks:
+            if conditions is not None:
+                w.values([np.asarray(conditions, float)])
+            w.values([b[v].transpose(*dims).values for v in variables])
+    _save(filename, binary, write)
+
+def metrics(blocks, processes=None):
+    ''' Compute grid metrics of each block (2D or 3D)
+
+        Returns copies of the blocks with these variables added, computed
+        with vectorized stencils over whole blocks:
+
+          volume     Cell volume (area in 2D), on dims ci, cj[, ck];
+                     negative for inverted (left-handed) cells
+          jacobian   Determinant of d(x,y[,z])/d(i,j[,k]) at the nodes
+          area_i     Area (length in 2D) of the faces normal to i, on
+                     dims i, cj[, ck]; likewise area_j[, area_k]
+          normal_i   Unit normal of those faces, pointing towards
+                     increasing i, with a trailing 'component' dim
+
+        INPUTS:
+          blocks     list      xr.Dataset of each block, as from load
+          processes  int       If > 1, blocks are processed in parallel
+                               in a pool of this many processes
+    '''
+    _check_cells(blocks)
+    return _map_blocks(_block_metrics, blocks, processes)
+
+def check_quality(blocks, processes=None):
+    ''' Check blocks for negative volumes and summarize cell quality
+
+        Returns a dict for each block with the number of 'cells', number
+        of 'negative_volumes' (zero or negative), index of the smallest
+        ('worst_cell'), 'min_volume', 'max_volume', largest volume ratio
+        of adjacent cells ('max_volume_ratio') and 'min_jacobian'. Blocks
+        with negative volumes are logged as warnings.
+    '''
+    _check_cells(blocks)
+    results = _map_blocks(_block_quality, blocks, processes)
+    for n, result in enumerate(results):
+        if result['negative_volumes']:
+            log.warning('Block %d has %d negative volume cells; worst at %s',
+                        n + 1, result['negative_volumes'], result['worst_cell'])
+    return results
+
+def connectivity(blocks, tol=None):
+    ''' Find the point-matched face patches at which blocks abut (2D or 3D)
+
+        Face nodes of all blocks are rounded to multiples of tol and
+        hashed, so coincident nodes are found with one sort instead of
+        comparing faces pairwise. Coincident node pairs are grouped by the
+        faces they lie on and the index map between them, and the face
+        cells of each group are split into rectangular patches. This finds
+        full and partial faces, faces abutting several blocks, and faces
+        abutting their own block (e.g. O- and C-grid cuts). Collapsed face
+        cells (e.g. at a singular axis) are ignored.
+
+        Returns a list of dicts, one for each side of each interface:
+
+          block        Index of the block in blocks
+          face         Face of the block, e.g. 'imax'
+          begin, end   Node indices (i, j[, k]) of opposite patch corners
+          donor        Index of the abutting block
+          donor_face   Face of the donor block
+          donor_begin  Donor node indices matching begin and end
+          donor_end
+          transform    Donor axis matching each axis of the block, 1-based
+                       and signed by direction as in CGNS; e.g. (-2, 1, 3)
+                       maps i to -j of the donor, j to i and k to k
+
+        INPUTS:
+          blocks  list   xr.Dataset of each block, as from load
+          tol     float  Distance within which nodes coincide; default is
+                         1e-3 times the shortest face edge
+    '''
+    dims = _block_dims(blocks)
+    ndims = len(dims)
+    xyz, node, shapes, starts = _face_nodes(blocks)
+    if tol is None:
+        tol = 1e-3 * _min_edge(xyz, shapes, starts)
+    ids = _coincident(xyz, tol)
+    a, b = _coincident_pairs(ids, node)
+    if len(a) == 0:
+        return []
+
+    sizes = np.prod(shapes, axis=1)
+    face = np.repeat(np.arange(len(shapes)), sizes)
+    local = np.arange(len(xyz)) - np.repeat(starts, sizes)
+    nv = shapes[face, 1]
+    uv = np.stack([local // nv, local % nv], axis=-1)
+
+    # Sorted pair keys; lookups of neighbouring pairs are then nearly sorted
+    n = len(xyz)
+    pairs = np.sort(a*n + b)
+    a, b = pairs // n, pairs % n
+
+    ua, ub = uv[a], uv[b]
+    shape_a = shapes[face[a]]
+
+    def step(step_a):
+        ''' Return the (u, v) index step from each node b to the node on
+            its face paired with a + step_a, or zero if there is none
+        '''
+        valid = np.all(ua + step_a < shape_a, axis=1)
+        a2 = a + step_a[0]*shape_a[:, 1] + step_a[1]
+        found = np.minimum(np.searchsorted(pairs, a2*n + starts[face[b]]), len(pairs) - 1)
+        b2 = pairs[found] % n
+        valid &= (pairs[found] // n == a2) & (face[b2] == face[b])
+        return np.where(valid[:, np.newaxis], uv[b2] - ub, 0)
+
+    # Map T of face (u, v) index steps of each pair, from the pairs of the
+    # next nodes along u and v, which must be adjacent; in 3D the node
+    # along the diagonal must map consistently
+    m = ndims - 1
+    T = np.zeros((len(a), 2, 2), np.int64)
+    T[:, 1, 1] = 1
+    for c in range(m):
+        d = step(np.eye(2, dtype=np.int64)[c])
+        T[:, :, c] = np.where((np.abs(d).sum(axis=1) == 1)[:, np.newaxis], d, 0)
+    ok = T[:, 0, 0]*T[:, 1, 1] != T[:, 0, 1]*T[:, 1, 0]
+    if m == 2:
+        ok &= np.all(step(np.array([1, 1])) == T[:, :, 0] + T[:, :, 1], axis=1)
+
+    # Drop collapsed face cells, then group by faces and index map
+    rows = np.flatnonzero(ok)
+    fa = face[a[rows]]
+    corners = [c + (0,)*(3 - ndims) for c in itertools.product((0, 1), repeat=m)]
+    corner_ids = np.sort([ids[starts[fa] + (uv[a[rows], 0] + du)*shapes[fa, 1] +
+                              uv[a[rows], 1] + dv] for du, dv in corners], axis=0)
+    rows = rows[np.all(np.diff(corner_ids, axis=0) != 0, axis=0)]
+    offset = ub - np.einsum('nij,nj->ni', T, ua)
+    columns = np.column_stack([face[a], face[b], T.reshape(-1, 4), offset])[rows]
+    order = np.lexsort(columns.T[::-1])
+    rows, columns = rows[order], columns[order]
+    first = np.flatnonzero(np.r_[True, np.any(columns[1:] != columns[:-1], axis=1)])
+
+    # Split the face cells of each group into rectangular patches
+    names = [d + side for d in dims for side in ('min', 'max')]
+    patches = []
+    for sel in np.split(rows, first[1:]) if len(rows) else []:
+        r = sel[0]
+        (block, fa), (donor, fb) = divmod(face[a[r]], len(names)), divmod(face[b[r]], len(names))
+        shape = tuple(blocks[block].sizes[d] for d in dims)
+        donor_shape = tuple(blocks[donor].sizes[d] for d in dims)
+        lo = uv[a[sel]].min(axis=0)
+        mask = np.zeros(uv[a[sel]].max(axis=0) - lo + 1, bool)
+        mask[tuple((uv[a[sel]] - lo).T)] = True
+        for start, stop in _rectangles(mask):
+            begin = lo + start
+            end = lo + stop - (0, m == 1)
+            patch = _patch_range(shape, fa, begin, end)
+            donor_patch = _patch_range(donor_shape, fb, T[r] @ begin + offset[r],
+                                       T[r] @ end + offset[r])
+            patches.append({
+                'block': int(block),
+                'face': names[fa],
+                'begin': patch[0],
+                'end': patch[1],
+                'donor': int(donor),
+                'donor_face': names[fb],
+                'donor_begin': donor_patch[0],
+                'donor_end': donor_patch[1],
+                'transform': _patch_transform(ndims, fa, fb, T[r]),
+            })
+    patches.sort(key=lambda p: (p['block'], names.index(p['face']), p['begin']))
+    return patches
 
+def transform(blocks, dcm, translation=None, vectors=(), inplace=False, chunk_size=None):
+    ''' Rotate and translate the coordinates (and vector variables) of
+        the blocks of a grid to another frame, x' = dcm @ x + translation
 
+        Coordinates are transformed a chunk at a time (see core.transform),
+        so in place transforms need little memory beyond the grid itself.
+        Otherwise new coordinate arrays are allocated once and returned in
+        shallow copies of the blocks. Vector variables are rotated but not
+        translated.
 
+        INPUTS:
+          blocks       list      xr.Dataset of each block, as from load
+          dcm          np.array  3x3 (2x2 for 2D) DCM, e.g. from
+                                 core.rotate_seq, or a stack of one for
+                                 each block (e.g. each time step)
+          translation  float(3)  Offset added after rotation, or an array
+                                 of one for each block
+          vectors      list      Names of the components of each vector
+                                 variable, e.g. [('u', 'v', 'w')]
+          inplace      bool      Overwrite the arrays of blocks, which must
+                                 be writeable (memory mapped binary grids
+                                 are not)
+          chunk_size   int       Vectors transformed at a time
+    '''
+    dims = _block_dims(blocks)
+    dcm = np.asarray(dcm)
+    per_block = dcm.ndim == 3
+    if translation is not None:
+        translation = np.asarray(translation)
+    results = []
+    for n, block in enumerate(blocks):
+        d = dcm[n] if per_block else dcm
+        t = translation[n] if translation is not None and translation.ndim > 1 else translation
+        if not inplace:
+            block = block.copy()
+        for m, names in enumerate([('x', 'y', 'z')[:len(dims)]] + [tuple(v) for v in vectors]):
+            arrays = [block[v].values for v in names]
+            if inplace and not all(a.flags.writeable for a in arrays):
+                raise ValueError(f'Block {n + 1} variables {names} are read-only; use inplace=False')
+            out = core.transform(arrays, d, t if m == 0 else None,
+                                 arrays if inplace else None, chunk_size)
+            if not inplace:
+                for v, values in zip(names, out):
+                    block[v] = (block[v].dims, values)
+        results.append(block)
+    return results
@@ -0,0 +1,361 @@
+''' Point location and interpolation on structured multi-block grids
+
+    A SpatialIndex is built once over the nodes of the blocks returned by
+    grids.load (or the ordered zones returned by tecio.read_dat), then
+    queried with batches of points:
+
+        index = SpatialIndex(blocks)
+        dist, block, node = index.nearest(points)
+        values = index.interpolate(points, blocks, ['p', 'rho'])
+
+    Nodes are sorted along a Morton (Z-order) curve and grouped into
+    leaves of a few nodes, over which a binary tree of bounding boxes is
+    built, so build time is dominated by a single sort and clustered
+    (e.g. boundary layer) grids are handled as well as uniform ones.
+    Nearest node queries descend the tree one level at a time for a batch
+    of points, pruning boxes that cannot hold a closer node. Cells are
+    located by walking from the cell at the nearest node, inverting the
+    bilinear or trilinear map of each cell visited. All steps are
+    vectorized over the query points. Indices hold only numpy arrays, so
+    they may be pickled to cache them alongside a grid.
+'''
+import itertools
+import numpy as np
+
+# Nodes per leaf of the tree and query points per batch
+_LEAF_SIZE  = 8
+_BATCH_SIZE = 4096
+
+# Coordinate variable names looked up if not given
+_COORD_NAMES = [('x', 'y', 'z'), ('X', 'Y', 'Z')]
+
+
+#----------------------------------------------------------------------------
+# Public API Functions
+#----------------------------------------------------------------------------
+class SpatialIndex:
+    ''' Index of the nodes and cells of a set of structured blocks
+
+        INPUTS:
+          blocks  list      xr.Dataset blocks from grids.load, ordered
+                            zones from tecio.read_dat, or any mappings of
+                            coordinate name to (i, j[, k]) array
+          coords  list      Names of the coordinate variables; default is
+                            those of x, y, z (or X, Y, Z) present
+
+        NOTE:
+          Surface blocks (2D blocks with three coordinates) support
+          nearest node queries only; their cells cannot be located.
+    '''
+
+    def __init__(self, blocks, coords=None):
+        xyz = [_block_coordinates(b, coords) for b in blocks]
+        self.ndims = xyz[0].shape[-1]
+        self.shapes = [a.shape[:-1] for a in xyz]
+        assert all(a.shape[-1] == self.ndims for a in xyz), 'Blocks must all have the same coordinates'
+        assert len({len(s) for s in self.shapes}) == 1, 'Blocks must all be 2D or 3D'
+        self.offsets = np.cumsum([0] + [int(np.prod(s)) for s in self.shapes])
+        self.points = np.concatenate([a.reshape(-1, self.ndims) for a in xyz])
+        self.tree = _BoxTree(self.points)
+        self._block_trees = {}      # Built on demand to search single blocks
+
+    def nearest(self, points):
+        ''' Find the nearest node to each point
+
+            OUTPUTS:
+              distance  np.array  Distance to the nearest node
+              block     np.array  Index of the block of the node
+              node      np.array  (i, j[, k]) index of the node in its block
+        '''
+        points = self._check_points(points)
+        dist2, ids = self._nearest(points)
+        block, node = self._node_index(ids)
+        return np.sqrt(dist2), block, node
+
+    def locate(self, points, tol=1e-6, max_steps=None):
+        ''' Find the cell containing each point
+
+            OUTPUTS:
+              block   np.array  Index of the block, or -1 if no cell was found
+              cell    np.array  (i, j[, k]) index of the cell (lowest node)
+              params  np.array  Local coordinates of the point in the cell,
+                                each in [0, 1]; NaN if not found
+        '''
+        points = self._check_points(points)
+        if len(self.shapes[0]) != self.ndims:
+            raise ValueError(f'Cells of {len(self.shapes[0])}D blocks with {self.ndims} '
+                             'coordinates cannot be located; only nearest is supported')
+        max_steps = max_steps or 2*max(max(s) for s in self.shapes)
+        block = np.full(len(points), -1)
+        cell = np.zeros((len(points), self.ndims), int)
+        params = np.full((len(points), self.ndims), np.nan)
+
+        # Walk from the nearest node; try other blocks for points not found
+        dist2, ids = self._nearest(points)
+        start_block, start_node = self._node_index(ids)
+        self._walk(points, start_block, start_node, block, cell, params, tol, max_steps)
+        lost = np.flatnonzero(block < 0)
+        for b in range(len(self.shapes)):
+            if not len(lost):
+                break
+            lo, hi = self._block_bounds(b)
+            near = lost[np.all((points[lost] >= lo - tol) & (points[lost] <= hi + tol), axis=1)]
+            near = near[start_block[near] != b]
+            if len(near):
+                _, ids = self._nearest(points[near], b)
+                _, node = self._node_index(ids)
+                self._walk(points[near], np.full(len(near), b), node,
+                           block, cell, params, tol, max_steps, near)
+                lost = np.flatnonzero(block < 0)
+        return block, cell, params
+
+    def interpolate(self, points, blocks, variables, tol=1e-6):
+        ''' Interpolate nodal variables of blocks to points (bilinear in 2D,
+            trilinear in 3D). Blocks must be those the index was built from
+            (or have the same shapes). Points outside the grid are NaN.
+
+            OUTPUTS:
+              values  dict(str:np.array)  Interpolated value of each variable
+        '''
+        points = self._check_points(points)
+        block, cell, params = self.locate(points, tol)
+        values = {name: np.full(len(points), np.nan) for name in variables}
+        for b in np.unique(block[block >= 0]):
+            sel = np.flatnonzero(block == b)
+            ids = self._corner_ids(b, cell[sel]) - self.offsets[b]
+            weights = _corner_weights(params[sel])
+            for name in variables:
+                data = np.asarray(blocks[b][name], float).reshape(-1)
+                values[name][sel] = np.sum(data[ids] * weights, axis=1)
+        return values
+
+    #------------------------------------------------------------------------
+    # Implementation
+    #------------------------------------------------------------------------
+    def _check_points(self, points):
+        points = np.atleast_2d(np.asarray(points, float))
+        assert points.shape[-1] == self.ndims, f'Points must have {self.ndims} coordinates'
+        return points
+
+    def _nearest(self, points, block=None):
+        ''' Return squared distance to and id of the nearest node of each
+            point, only considering nodes of block if given
+        '''
+        if block is None:
+            return self.tree.nearest(points)
+        if block not in self._block_trees:
+            nodes = self.points[self.offsets[block]:self.offsets[block+1]]
+            self._block_trees[block] = _BoxTree(nodes)
+        dist2, ids = self._block_trees[block].nearest(points)
+        return dist2, ids + self.offsets[block]
+
+    def _walk(self, points, start_block, start_node, block, cell, params,
+              tol, max_steps, rows=None):
+        ''' Walk towards the cell containing each point, starting from the
+            cell around start_node the point is nearest to being inside.
+            Results are stored in rows (default: all points).
+        '''
+        rows = np.arange(len(points)) if rows is None else rows
+        for b in np.unique(start_block[start_block >= 0]):
+            limit = np.array(self.shapes[b]) - 2
+            sel = np.flatnonzero(start_block == b)
+            starts = np.clip(start_node[sel, np.newaxis] - _CORNERS[self.ndims], 0, limit)
+            outside = np.empty(starts.shape[:2])
+            for n in range(starts.shape[1]):
+                corners = self.points[self._corner_ids(b, starts[:, n])]
+                p = _invert(corners, points[sel])
+                outside[:, n] = np.sum(np.maximum(-p, 0) + np.maximum(p - 1, 0), axis=1)
+            c = starts[np.arange(len(sel)), np.argmin(outside, axis=1)]
+            for _ in range(max_steps):
+                corners = self.points[self._corner_ids(b, c)]
+                p = _invert(corners, points[sel])
+                inside = np.all((p >= -tol) & (p <= 1 + tol), axis=1)
+                block[rows[sel[inside]]] = b
+                cell[rows[sel[inside]]] = c[inside]
+                params[rows[sel[inside]]] = np.clip(p[inside], 0.0, 1.0)
+                step = np.where(p < -tol, -1, np.where(p > 1 + tol, 1, 0))
+                moved = np.clip(c + step, 0, limit)
+                keep = ~inside & np.any(moved != c, axis=1)
+                sel, c = sel[keep], moved[keep]
+                if not len(sel):
+                    break
+
+    def _node_index(self, ids):
+        ''' Return block and (i, j[, k]) index of global node ids '''
+        block = np.searchsorted(self.offsets, ids, side='right') - 1
+        block[ids < 0] = -1
+        node = np.zeros((len(ids), len(self.shapes[0])), int)
+        for b in np.unique(block[block >= 0]):
+            sel = block == b
+            node[sel] = np.stack(np.unravel_index(ids[sel] - self.offsets[b], self.shapes[b]), axis=1)
+        return block, node
+
+    def _corner_ids(self, b, cell):
+        ''' Return (M, 2**ndims) global node ids of the corners of cells '''
+        corners = cell[:, np.newaxis, :] + _CORNERS[self.ndims]
+        return self.offsets[b] + np.ravel_multi_index(
+            np.moveaxis(corners, -1, 0), self.shapes[b])
+
+    def _block_bounds(self, b):
+        nodes = self.points[self.offsets[b]:self.offsets[b+1]]
+        return nodes.min(axis=0), nodes.max(axis=0)
+
+
+#----------------------------------------------------------------------------
+# Helper Functions
+#----------------------------------------------------------------------------
+# Offsets of the corners of a cell from its lowest node, in C order
+_CORNERS = {n: np.array(list(itertools.product((0, 1), repeat=n))) for n in (2, 3)}
+
+def _block_coordinates(block, coords=None):
+    ''' Return node coordinates of a block as an (i, j[, k], ncoords) array '''
+    if coords is None:
+        for names in _COORD_NAMES:
+            if names[0] in block:
+                coords = [name for name in names if name in block]
+                break
+        else:
+            raise KeyError('No coordinate variables found; pass coords=')
+    xyz = np.stack([np.asarray(block[name], float) for name in coords], axis=-1)
+    assert xyz.ndim - 1 <= len(coords), \
+        f'{len(coords)} coordinates given for a {xyz.ndim - 1}D block'
+    return xyz
+
+class _BoxTree:
+    ''' Bounding box tree over points sorted along a Morton curve.
+        Level 0 holds the boxes of leaves of _LEAF_SIZE consecutive sorted
+        points; each level above holds the union of pairs of boxes below,
+        up to a single root box.
+    '''
+
+    def __init__(self, points):
+        self.points = points
+        ndims = points.shape[1]
+        lo, hi = points.min(axis=0), points.max(axis=0)
+        self.origin = lo
+        self.limit = 2**(63 // ndims) - 1
+        self.scale = self.limit / np.where(hi > lo, hi - lo, 1.0)
+        codes = self._codes(points)
+        self.order = np.argsort(codes, kind='stable')
+        self.codes = codes[self.order]
+
+        starts = np.arange(0, len(points), _LEAF_SIZE)
+        sorted_points = points[self.order]
+        self.levels = [(np.minimum.reduceat(sorted_points, starts),
+                        np.maximum.reduceat(sorted_points, starts))]
+        del sorted_points
+        while len(self.levels[-1][0]) > 1:
+            lo, hi = self.levels[-1]
+            pairs = len(lo) // 2
+            lo_up, hi_up = lo[::2].copy(), hi[::2].copy()
+            lo_up[:pairs] = np.minimum(lo[0:2*pairs:2], lo[1::2])
+            hi_up[:pairs] = np.maximum(hi[0:2*pairs:2], hi[1::2])
+            self.levels.append((lo_up, hi_up))
+
+    def nearest(self, points):
+        ''' Return squared distance to and id of the nearest point '''
+        best = np.empty(len(points))
+        ids = np.empty(len(points), int)
+        for start in range(0, len(points), _BATCH_SIZE):
+            stop = start + _BATCH_SIZE
+            best[start:stop], ids[start:stop] = self._nearest(points[start:stop])
+        return best, ids
+
+    def _codes(self, points):
+        ''' Return Morton codes of points, clipped to the bounding box '''
+        q = np.clip((points - self.origin) * self.scale, 0, self.limit)
+        return _morton(q.astype(np.uint64))
+
+    def _nearest(self, points):
+        ''' Descend the tree for a batch of points, pruning boxes farther
+            than a bound on the distance to the nearest point. The bound
+            starts from the leaves next to each point along the Morton
+            curve, and is tightened at each level by the farthest distance
+            to each box (every box holds at least one point).
+        '''
+        npoints = len(points)
+        nleaves = len(self.levels[0][0])
+        leaf = np.searchsorted(self.codes, self._codes(points)) // _LEAF_SIZE
+        leaves = np.clip(leaf + np.array([[-1], [0], [1]]), 0, nleaves - 1)
+        best, _ = self._leaf_distances(points, np.tile(np.arange(npoints), 3), leaves.ravel())
+
+        query = np.arange(npoints)
+        node = np.zeros(npoints, int)
+        for lo, hi in reversed(self.levels[:-1]):
+            query = np.repeat(query, 2)
+            node = 2*np.repeat(node, 2) + np.tile([0, 1], len(node))
+            valid = node < len(lo)
+            query, node = query[valid], node[valid]
+            q = points[query]
+            near = np.maximum(np.maximum(lo[node] - q, q - hi[node]), 0.0)
+            far = np.maximum(np.abs(q - lo[node]), np.abs(q - hi[node]))
+            near, far = np.sum(near**2, axis=1), np.sum(far**2, axis=1)
+            bound = best.copy()
+            np.minimum.at(bound, query, far)
+            keep = near <= bound[query]
+            query, node = query[keep], node[keep]
+        return self._leaf_distances(points, query, node)
+
+    def _leaf_distances(self, points, query, node):
+        ''' Return squared distance to and id of the nearest point of the
+            leaves node to each point of query (point, leaf pairs)
+        '''
+        query = np.repeat(query, _LEAF_SIZE)
+        index = (_LEAF_SIZE*np.repeat(node, _LEAF_SIZE)
+                 + np.tile(np.arange(_LEAF_SIZE), len(node)))
+        valid = index < len(self.order)
+        query, ids = query[valid], self.order[index[valid]]
+        dist2 = np.sum((self.points[ids] - points[query])**2, axis=1)
+        order = np.lexsort((dist2, query))
+        first = np.concatenate([[True], query[order][1:] != query[order][:-1]])
+        return dist2[order][first], ids[order][first]
+
+def _morton(q):
+    ''' Interleave the bits of (M, ndims) unsigned integer coordinates '''
+    ndims = q.shape[1]
+    if ndims == 2:
+        masks = [(16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                 (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333),
+                 (1, 0x5555555555555555)]
+    else:
+        masks = [(32, 0x001F00000000FFFF), (16, 0x001F0000FF0000FF),
+                 (8, 0x100F00F00F00F00F), (4, 0x10C30C30C30C30C3),
+                 (2, 0x1249249249249249)]
+    codes = np.zeros(len(q), np.uint64)
+    for n in range(ndims):
+        x = q[:, n].copy()
+        for shift, mask in masks:
+            x = (x | (x << np.uint64(shift))) & np.uint64(mask)
+        codes |= x << np.uint64(n)
+    return codes
+
+def _corner_factors(params):
+    ''' Return (M, 2**ndims, ndims) linear shape function factors, the
+        product of which over the last axis is the weight of each corner
+    '''
+    corners = _CORNERS[params.shape[1]]
+    return np.where(corners, params[:, np.newaxis, :], 1 - params[:, np.newaxis, :])
+
+def _corner_weights(params):
+    ''' Return (M, 2**ndims) bi/trilinear weights of the corners of cells '''
+    return np.prod(_corner_factors(params), axis=2)
+
+def _invert(corners, points, iterations=12):
+    ''' Return local coordinates of points in bi/trilinear cells by
+        Newton iteration; corners is (M, 2**ndims, ndims)
+    '''
+    ndims = points.shape[1]
+    signs = 2*_CORNERS[ndims] - 1
+    params = np.full(points.shape, 0.5)
+    for _ in range(iterations):
+        factors = _corner_factors(params)
+        residual = points - np.einsum('mc,mcd->md', np.prod(factors, axis=2), corners)
+        jacobian = np.empty(points.shape + (ndims,))
+        for n in range(ndims):
+            dweights = np.prod(np.delete(factors, n, axis=2), axis=2) * signs[:, n]
+            jacobian[:, :, n] = np.einsum('mc,mcd->md', dweights, corners)
+        step = np.zeros_like(params)
+        ok = np.abs(np.linalg.det(jacobian)) > 1e-300
+        step[ok] = np.linalg.solve(jacobian[ok], residual[ok][..., np.newaxis])[..., 0]
+        params = params + np.clip(step, -2.0, 2.0)
+    return params
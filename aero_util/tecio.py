@@ -1,10 +1,21 @@
 ''' Routines for reading/writing data from Tecplot files '''
 
+import collections.abc
 import io
+import json
 import logging
+import mmap
 import numpy as np
+import os
 import shlex
+import shutil
 import re
+import tempfile
+import weakref
+from . import core
+from .cache import get_cache
+from .compression import detect_compression, open_compressed
+from .textio import CHUNK_SIZE, TextStream, write_values
 
 log = logging.getLogger(__name__)
 
@@ -13,135 +24,1161 @@ _TECPLOT_KEYWORDS = [
     'GEOMETRY',  'CUSTOMLABELS',  'DATASETAUXDATA',  'VARAUXDATA',
 ]
 
+# Binary (*.plt) file format constants
+_PLT_MAGIC      = b'#!TDV'
+_PLT_ZONE       = 299.0
+_PLT_DATASETAUX = 799.0
+_PLT_VARAUX     = 899.0
+_PLT_EOH        = 357.0
+_PLT_ZONETYPES  = [
+    'ORDERED',  'FELINESEG', 'FETRIANGLE', 'FEQUADRILATERAL',
+    'FETETRAHEDRON', 'FEBRICK', 'FEPOLYGON', 'FEPOLYHEDRON',
+]
+_FE_NODES = {      # Nodes per element for each finite element zone type
+    'FELINESEG': 2, 'FETRIANGLE': 3, 'FEQUADRILATERAL': 4,
+    'FETETRAHEDRON': 4, 'FEBRICK': 8,
+}
+_PLT_DTYPES = {1: 'f4', 2: 'f8', 3: 'i4', 4: 'i2', 5: 'u1'}
+_PLT_DTNAMES = {1: 'SINGLE', 2: 'DOUBLE', 3: 'LONGINT', 4: 'SHORTINT', 5: 'BYTE'}
+
+# Numpy data type for each Tecplot DT name
+_DT_DTYPES = {
+    'SINGLE': 'f4', 'DOUBLE': 'f8', 'LONGINT': 'i4', 'SHORTINT': 'i2',
+    'BYTE': 'u1', 'BIT': 'u1',
+}
+
+# Output format for each numpy data type kind/size (DT name, plt format, text format)
+_WRITE_FORMATS = {
+    'f4': ('SINGLE',   1, '%.8E'),
+    'f8': ('DOUBLE',   2, '%.16E'),
+    'i4': ('LONGINT',  3, '%d'),
+    'i2': ('SHORTINT', 4, '%d'),
+    'u1': ('BYTE',     5, '%d'),
+}
+
+# Number of values written per line
+_VALUES_PER_LINE  = 5
+
 # Keep it simple for now. Just return list(dict(str:np.array))
-# Only supporting structured grids with nodal data for now
+# Supports ordered and (non-polyhedral) FE zones with nodal data
 
 #----------------------------------------------------------------------------
 # Public API Functions
 #----------------------------------------------------------------------------
-def read_dat(path_or_file, *args, **kwargs):
-    ''' Top level routine to load data '''
-    if not isinstance(path_or_file, io.TextIOBase):
-        with open(path_or_file) as f:
-            zones = _read_dat_impl(f, *args, **kwargs)
+def read_dat(path_or_file, dtype=None, variables=None, zones=None, cache=None):
+    ''' Top level routine to load data
+
+        Variables are loaded with the precision declared by the zone's DT
+        option (float32, float64, int32, int16 or uint8), or float64 if DT
+        is omitted. Pass dtype=<numpy dtype> to convert all variables to a
+        single type instead, e.g. dtype=float for the pre-DT behavior.
+
+        A subset of the data may be loaded with the variables= and zones=
+        keywords. Each accepts a list of names/titles and/or indices, or a
+        predicate called with the variable name or zone options dict:
+
+            read_dat(path, variables=['x', 'y', 3], zones=['wall'])
+            read_dat(path, zones=lambda opts: opts['J'] > 1)
+
+        Unselected zones and BLOCK packed variables are skipped without
+        being converted to numbers. File objects are read in a single
+        forward pass, so non-seekable inputs such as pipes are supported.
+        Compressed files (gzip, bz2, xz, zstd) are decompressed on the fly.
+
+        Variables and connectivity shared with an earlier zone (the
+        VARSHARELIST and CONNECTIVITYSHAREZONE options) are the same array
+        object in every zone that shares them. When reading from a file
+        object, the zone that holds shared data must be selected.
+
+        Pass cache=True (or a directory or cache.Cache) to store the zones
+        of a path in an on-disk cache and memory map them from there on
+        later reads of the same file; see aero_util.cache. Variables read
+        from the cache are read-only. Predicate selectors bypass the cache.
+    '''
+    params = (None if dtype is None else np.dtype(dtype).str, variables, zones)
+    if cache and not hasattr(path_or_file, 'read') and \
+            not callable(variables) and not callable(zones):
+        return get_cache(cache).fetch(
+            path_or_file, 'tecio.read_dat', params,
+            lambda path: read_dat(path, dtype, variables, zones),
+            _pack_zones, _unpack_zones)
+
+    if not hasattr(path_or_file, 'read'):
+        with open_compressed(path_or_file) as f:
+            zones = _read_dat_impl(TextStream(f), dtype, variables, zones, path=path_or_file)
     else:
-        zones = _read_dat_impl(f, *args, **kwargs)
+        f = open_compressed(path_or_file)
+        zones = _read_dat_impl(TextStream(f), dtype, variables, zones)
     return zones
 
 
+def iter_zones(path_or_file, *args, **kwargs):
+    ''' Yield zones from a Tecplot ASCII file one at a time
+
+        Each zone is parsed as it is requested and nothing is retained by
+        the reader once it is yielded, so reductions over the zones of a
+        file run in constant memory. Zones are Zone objects, which carry
+        the zone header in their options dict. Accepts the same keywords
+        as read_dat.
+
+        Shared variables are kept alive by the reader once a later zone
+        has shared them. When reading from a path, shared data of zones
+        that were not selected (or have since been released) is re-read
+        from the file; for file objects this raises a RuntimeError.
+    '''
+    if not hasattr(path_or_file, 'read'):
+        with open_compressed(path_or_file) as f:
+            yield from _iter_dat(TextStream(f), *args, path=path_or_file, **kwargs)
+    else:
+        f = open_compressed(path_or_file)
+        yield from _iter_dat(TextStream(f), *args, **kwargs)
+
+def read_plt(path, dtype=None):
+    ''' Load data from a Tecplot binary (*.plt) file
+
+        Variable arrays are read-only views into a memory map of the file,
+        so only the pages that are actually touched are read from disk.
+        Variables retain the precision they were stored with, unless dtype
+        is given, in which case all variables are copied to that type.
+        Compressed files are decompressed into memory instead. Shared
+        variables and connectivity are the same array in each zone.
+
+        OUTPUTS:
+          zones  list(dict(str:np.array))  Same layout as read_dat
+    '''
+    if detect_compression(path):
+        with open_compressed(path) as f:
+            buf = f.read()
+    else:
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return _read_plt_impl(buf, dtype)
+
+
+def write_dat(path_or_file, zones, titles=None, datapacking='BLOCK', title=''):
+    ''' Write zones to a Tecplot ASCII file
+
+        Zones are written as they are drawn from the zones iterable, so
+        passing a generator keeps only one zone in memory at a time. A
+        variable (or connectivity) that is the same array object as in the
+        previous zone that stored it is written as shared with that zone.
+
+        INPUTS:
+          path_or_file  str|file      Output path or text file object
+          zones         iter(dict)    Zones in the same layout as read_dat;
+                                      all variables in a zone share a shape
+          titles        iter(str)     Zone titles (default: the title of
+                                      Zone objects, else "Zone N")
+          datapacking   str           'BLOCK' or 'POINT'
+          title         str           Dataset title
+    '''
+    if isinstance(path_or_file, io.TextIOBase):
+        _write_dat_impl(path_or_file, zones, titles, datapacking, title)
+    else:
+        with open(path_or_file, 'w') as f:
+            _write_dat_impl(f, zones, titles, datapacking, title)
+
+def write_plt(path_or_file, zones, titles=None, title=''):
+    ''' Write zones to a Tecplot binary (*.plt) file
+
+        Each variable is stored with the precision of its array. Zones may
+        be a generator; the binary header lists every zone ahead of the
+        data, so in that case the data section is spooled to a temporary
+        file while the zone headers are collected. Variables and
+        connectivity are shared between zones as for write_dat.
+
+        INPUTS:
+          path_or_file  str|file      Output path or binary file object
+          zones         iter(dict)    Zones in the same layout as read_dat
+          titles        iter(str)     Zone titles (default: the title of
+                                      Zone objects, else "Zone N")
+          title         str           Dataset title
+    '''
+    if isinstance(path_or_file, io.IOBase):
+        _write_plt_impl(path_or_file, zones, titles, title)
+    else:
+        with open(path_or_file, 'wb') as f:
+            _write_plt_impl(f, zones, titles, title)
+
+def transform(zones, dcm, translation=None, vectors=(), coordinates=None,
+              inplace=False, chunk_size=None):
+    ''' Rotate and translate the coordinates (and vector variables) of
+        zones to another frame, x' = dcm @ x + translation
+
+        Arrays are transformed a chunk at a time (see core.transform), so
+        in place transforms need little memory beyond the zones. Otherwise
+        new arrays are allocated once and returned in copies of the zones.
+        Vector variables are rotated but not translated. Arrays shared
+        between zones (e.g. a static grid) are transformed once, and stay
+        shared in the result; in place, a shared array may not be given a
+        different transform in each zone.
+
+        INPUTS:
+          zones        iter(dict)  Zones in the same layout as read_dat
+          dcm          np.array    3x3 (2x2 for 2D) DCM, e.g. from
+                                   core.rotate_seq, or a stack of one for
+                                   each zone (e.g. each time step)
+          translation  float(3)    Offset added after rotation, or an
+                                   array of one for each zone
+          vectors      list        Names of the components of each vector
+                                   variable, e.g. [('U', 'V', 'W')]
+          coordinates  list        Names of the coordinate variables
+                                   (default: X, Y[, Z] or x, y[, z])
+          inplace      bool        Overwrite the arrays of the zones
+          chunk_size   int         Vectors transformed at a time
+    '''
+    dcm = np.asarray(dcm)
+    if translation is not None:
+        translation = np.asarray(translation)
+    done = {}       # Inputs (kept alive so ids are unique), outputs and transform, by ids
+    results = []
+    for n, zone in enumerate(zones):
+        d = dcm[n] if dcm.ndim == 3 else dcm
+        per_zone = translation is not None and translation.ndim > 1
+        t = translation[n] if per_zone else translation
+        names = [tuple(coordinates or _zone_coordinates(zone, len(d)))] + \
+            [tuple(v) for v in vectors]
+        result = zone if inplace else Zone(zone, getattr(zone, 'options', {}),
+                                           getattr(zone, 'connectivity', None))
+        for m, triple in enumerate(names):
+            arrays = [zone[v] for v in triple]
+            index = (n if dcm.ndim == 3 else 0, None if m else n if per_zone else 0)
+            ids = tuple(id(a) for a in arrays)
+            if ids in done and done[ids][2] == index:
+                out = done[ids][1]
+            elif ids in done and inplace:
+                raise ValueError(f'Variables {triple} are shared with a zone with a '
+                                 'different transform; use inplace=False')
+            else:
+                out = core.transform(arrays, d, None if m else t,
+                                     arrays if inplace else None, chunk_size)
+                done[ids] = (arrays, out, index)
+            for v, values in zip(triple, out):
+                result[v] = values
+        results.append(result)
+    return results
+
+class Zone(dict):
+    ''' Dict of variable arrays for a single zone plus its header options
+
+        The options dict holds the parsed zone header (e.g. 'T', 'I', 'J',
+        'K', 'SOLUTIONTIME', 'STRANDID', 'DT'). Zones behave exactly like
+        the plain dicts returned by earlier versions of this module.
+
+        For finite element zones, variables are 1D arrays of nodal values
+        and connectivity is an int32 (elements, nodes per element) array
+        of 0-based node indices. It is None for ordered zones.
+
+        Variables and connectivity shared with another zone are the same
+        array object in both zones, so they must not be modified in place
+        unless the change is meant to apply to every sharing zone.
+    '''
+
+    def __init__(self, data=(), options=None, connectivity=None):
+        super().__init__(data)
+        self.options = dict(options or {})
+        self.connectivity = connectivity
+
+    @property
+    def title(self):
+        return self.options.get('T', '')
+
+    @property
+    def solution_time(self):
+        return self.options.get('SOLUTIONTIME', 0.0)
+
+    @property
+    def strand_id(self):
+        return self.options.get('STRANDID', 0)
+
+
+class DatFile:
+    ''' Lazy, indexed access to the zones of a Tecplot ASCII file
+
+        On construction, the file is scanned once to build an index of the
+        zone headers and the byte range of each zone's data block; numeric
+        data is only parsed when a zone is accessed. Zones may be accessed
+        by position or by title (the "T=" zone option). Compressed files
+        are supported, but random access to them is slower:
+
+            dat  = DatFile('solution.dat')
+            wall = dat['wall']
+            last = dat[-1]
+
+        INPUTS:
+          path   str|Path  Path to the Tecplot ASCII file
+          cache  bool      If True, save/load the zone index to/from a
+                           file next to the data file (path + '.idx')
+          dtype  np.dtype  Convert all variables to this type (see read_dat)
+    '''
+
+    INDEX_VERSION = 2
+
+    def __init__(self, path, cache=False, dtype=None):
+        self.path = os.fspath(path)
+        self.dtype = dtype
+        self.index_path = self.path + '.idx'
+        self._file = open_compressed(self.path)
+        self._position = 0
+        index = self._load_index() if cache else None
+        if index is None:
+            index = _index_dat(TextStream(self._file))
+            self._position = float('inf')
+            if cache:
+                self._save_index(index)
+        self.variables = index['variables']
+        self.zones = index['zones']
+        self._shared = _SharedData(self._reload)
+
+    def __len__(self):
+        return len(self.zones)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self.titles:
+                raise KeyError(f'No match for "{key}"')
+            key = self.titles.index(key)
+        return self._read_zone(range(len(self))[key])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def titles(self):
+        ''' List of zone titles in file order '''
+        return [zone['T'] for zone in self.zones]
+
+    def read(self, dtype=None, variables=None, zones=None):
+        ''' Load a subset of variables/zones (see read_dat for selectors) '''
+        selected = _select(self.zones, zones, self.titles)
+        dtype = self.dtype if dtype is None else dtype
+        return [self._read_zone(i, dtype, variables) for i in selected]
+
+    def close(self):
+        ''' Release the file handle '''
+        self._file.close()
+
+    def _read_zone(self, index, dtype=None, variables=None):
+        ''' Parse data for the zone at index '''
+        entry = self.zones[index]
+        start, end = entry['OFFSET']
+        dtype = self.dtype if dtype is None else dtype
+        self._seek(start)
+        stream = TextStream.from_bytes(self._file.read(end - start))
+        self._position = end
+        zone = _read_zone_data(stream, entry, self.variables, dtype, variables,
+                               self._shared, index)
+        self._shared.add(index, zone)
+        return zone
+
+    def _reload(self, index, name):
+        ''' Read a variable (or connectivity if name is None) of a zone '''
+        zone = self._read_zone(index, variables=[] if name is None else [name])
+        return zone.connectivity if name is None else zone[name]
+
+    def _seek(self, offset):
+        ''' Move to offset, reading forward if the file is not seekable '''
+        if self._file.seekable():
+            self._file.seek(offset)
+            return
+        if self._position > offset:
+            self._file.close()      # Forward-only decompressor; start over
+            self._file = open_compressed(self.path)
+            self._position = 0
+        while self._position < offset:
+            data = self._file.read(min(CHUNK_SIZE, offset - self._position))
+            if not data:
+                raise EOFError(f'Unexpected end of file in "{self.path}"')
+            self._position += len(data)
+
+    def _load_index(self):
+        ''' Return cached index if it exists and matches the data file '''
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        stat = os.stat(self.path)
+        if (index.get('version') != self.INDEX_VERSION
+                or index.get('size') != stat.st_size
+                or index.get('mtime') != stat.st_mtime):
+            log.info('Ignoring stale zone index "%s"', self.index_path)
+            return None
+        return index
+
+    def _save_index(self, index):
+        ''' Write index to disk; failure to do so is not an error '''
+        stat = os.stat(self.path)
+        index = dict(index, version=self.INDEX_VERSION,
+                     size=stat.st_size, mtime=stat.st_mtime)
+        try:
+            with open(self.index_path, 'w') as f:
+                json.dump(index, f)
+        except OSError as e:
+            log.warning('Unable to write zone index "%s": %s', self.index_path, e)
+
+
 #----------------------------------------------------------------------------
 # Internal Implementation Functions
 #----------------------------------------------------------------------------
 def _read_dat_impl(f, *args, **kwargs):
     ''' Reads Tecplot file data into a list of dicts '''
-    zones = []
+    return list(_iter_dat(f, *args, **kwargs))
+
+def _iter_dat(stream, dtype=None, variables=None, zones=None, path=None):
+    ''' Yields Tecplot file zones as they are read from a TextStream.
+        If path is given, shared data that is no longer available is
+        re-read from the file at that path.
+    '''
+    # Names and indices are checked against the zones once all are read;
+    # negative indices would need the zone count up front
+    if zones is not None and not callable(zones):
+        zones = [zones] if isinstance(zones, (str, int)) else list(zones)
+        for key in zones:
+            if not isinstance(key, str) and key < 0:
+                raise KeyError(f'Negative zone index {key} is not supported when '
+                               'streaming; use DatFile for indexing from the end')
     varnames = None
-    for first_word in _peek_line(f):
+    headers = []
+    shared = _SharedData()
+    if path is not None:
+        shared.reload = lambda index, name: _reload_zone_data(
+            path, headers[index], varnames, dtype, name, shared, index)
+    while True:
+        first_word = stream.peek_word()
+        if first_word is None:
+            break
         first_word = first_word.upper()
         if first_word == 'VARIABLES':
-            varnames = _read_variables(f)
+            varnames = _read_variables(stream)
         elif first_word == 'ZONE':
-            zones.append(_read_zone(f,varnames))
+            options = _read_zone_options(stream)
+            headers.append(options)
+            zone = _read_zone(stream, options, varnames, dtype, variables, zones,
+                              shared, len(headers) - 1)
+            if zone is not None:
+                yield zone
         else:
             if first_word in _TECPLOT_KEYWORDS:
                 log.info('Ignoring "%s" record.', first_word)
-            f.readline()
+            stream.readline()
+    if zones is not None and not callable(zones):
+        _select(headers, zones, [options['T'] for options in headers])
+
+def _read_plt_impl(buf, dtype=None):
+    ''' Reads Tecplot binary data into a list of dicts '''
+    reader = _PltReader(buf)
+    varnames, headers = _read_plt_header(reader)
+    zones = []
+    for options in headers:
+        marker = reader.float32()
+        assert marker == _PLT_ZONE, f'Invalid zone marker {marker} in data section'
+        zone = _read_plt_zone(reader, options, varnames, zones)
+        zones.append(zone)
+    if dtype is not None:
+        converted = {}              # Keep shared variables shared
+        for i, zone in enumerate(zones):
+            for v in zone.values():
+                if id(v) not in converted:
+                    converted[id(v)] = v.astype(dtype)
+            data = {k: converted[id(v)] for k, v in zone.items()}
+            zones[i] = Zone(data, zone.options, zone.connectivity)
     return zones
 
-def _read_variables(f):
+def _read_plt_header(reader):
+    ''' Parse header section of a binary file; returns names and zone options '''
+    magic = reader.bytes(8)
+    assert magic.startswith(_PLT_MAGIC), 'File is not a Tecplot binary file'
+    reader.check_byte_order()
+    reader.int32()                  # FileType; grid/solution files not distinguished
+    reader.string()                 # Title
+    nvars = reader.int32()
+    varnames = [reader.string() for _ in range(nvars)]
+    log.info('Read variable names %s from file header', varnames)
+
+    headers = []
+    while True:
+        marker = reader.float32()
+        if marker == _PLT_ZONE:
+            headers.append(_read_plt_zone_header(reader, nvars))
+        elif marker == _PLT_DATASETAUX:
+            reader.string(), reader.int32(), reader.string()
+        elif marker == _PLT_VARAUX:
+            reader.int32(), reader.string(), reader.int32(), reader.string()
+        elif marker == _PLT_EOH:
+            break
+        else:
+            raise RuntimeError(f'Unsupported header record with marker {marker}')
+    return varnames, headers
+
+def _read_plt_zone_header(reader, nvars):
+    ''' Parse a zone record from the header section of a binary file '''
+    options = {}
+    options['T'] = reader.string()
+    options['PARENTZONE'] = reader.int32()
+    options['STRANDID'] = reader.int32()
+    options['SOLUTIONTIME'] = reader.float64()
+    reader.int32()                  # Zone color; not used
+    options['ZONETYPE'] = _PLT_ZONETYPES[reader.int32()]
+    if reader.int32():
+        location = reader.int32s(nvars)
+        assert not any(location), 'Only nodal variables are supported'
+    assert not reader.int32(), 'Raw face neighbors are not supported'
+    assert not reader.int32(), 'User-defined face neighbors are not supported'
+    if options['ZONETYPE'] == 'ORDERED':
+        options['I'], options['J'], options['K'] = reader.int32s(3)
+    else:
+        options['NODES'] = reader.int32()
+        assert options['ZONETYPE'] in _FE_NODES, \
+            f'Unsupported zone type "{options["ZONETYPE"]}"'
+        options['ELEMENTS'] = reader.int32()
+        reader.int32s(3)            # Cell dimensions; reserved
+    options['DATAPACKING'] = 'BLOCK'
+    while reader.int32():
+        name = reader.string()
+        reader.int32()              # Value format; always string
+        options[name] = reader.string()
+    return options
+
+def _read_plt_zone(reader, options, varnames, zones):
+    ''' Map data for a single zone from the data section of a binary file.
+        Zones are the zones read so far, which shared data is taken from.
+    '''
+    nvars = len(varnames)
+    formats = reader.int32s(nvars)
+    options['DT'] = [_PLT_DTNAMES.get(dt, 'BIT') for dt in formats]
+    passive = reader.int32s(nvars) if reader.int32() else [0]*nvars
+    shared  = reader.int32s(nvars) if reader.int32() else [-1]*nvars
+    assert not any(passive), 'Passive variables are not supported'
+    share_zone = reader.int32()
+    options['VARSHARELIST'] = [[i, int(z)] for i, z in enumerate(shared) if z != -1]
+    options['CONNECTIVITYSHAREZONE'] = None if share_zone == -1 else int(share_zone)
+    reader.float64s(2*sum(z == -1 for z in shared))   # Min/max of stored variables
+
+    shape = _zone_shape(options)
+    npts = int(np.prod(shape))
+    zone = Zone(options=options)
+    for name, dt, source in zip(varnames, formats, shared):
+        if source != -1:
+            zone[name] = zones[source][name]
+            continue
+        assert dt in _PLT_DTYPES, f'Unsupported data format {dt} for "{name}"'
+        data = reader.array(_PLT_DTYPES[dt], npts)
+        zone[name] = np.squeeze(data.reshape(shape, order='F'))
+    if options['CONNECTIVITYSHAREZONE'] is not None:
+        zone.connectivity = zones[options['CONNECTIVITYSHAREZONE']].connectivity
+    elif options['ZONETYPE'] != 'ORDERED':
+        nodes = _FE_NODES[options['ZONETYPE']]
+        data = reader.array('i4', options['ELEMENTS']*nodes)
+        zone.connectivity = data.reshape(-1, nodes)
+    return zone
+
+def _read_variables(stream):
     ''' Parse tecplot "variables" record.
-        File pointer must be positioned at the start of the "VARIABLES" keyword.
+        Stream must be positioned at the start of the "VARIABLES" keyword.
     '''
-    record = f.readline().split('=', maxsplit=1)[1]  # Remove 'VARIABLES ='
-    for first_word in _peek_line(f):
-        first_word = first_word.upper()
-        if first_word in _TECPLOT_KEYWORDS:
+    record = stream.readline().split('=', maxsplit=1)[1]  # Remove 'VARIABLES ='
+    while True:
+        first_word = stream.peek_word()
+        if first_word is None or first_word.upper() in _TECPLOT_KEYWORDS:
             break
-        else:
-            record += f.readline()
-    variables = shlex.split(record)
-    log.info('Read variable names %s from file header', variables)
-    return variables
+        record += stream.readline()
+    return _parse_variables(record)
 
-def _read_zone(f,varnames=None):
-    ''' Parser tecplot "zone" record.
-        File pointer must be positioned at the start of the "ZONE" keyword.
+def _read_zone(stream, options, varnames=None, dtype=None, variables=None,
+               selector=None, shared=None, index=0):
+    ''' Read data of a tecplot "zone" record whose header has been parsed.
+        Returns None if the zone is excluded by the zone selector. The
+        byte range of the data block is recorded in options['OFFSET'].
     '''
-    # TODO: Process/check VARLOCATION. Currently assume all variables are nodal.
-    options = _read_zone_options(f)
+    start = stream.offset
+    if not _select([options], selector, [options['T']], start=index, strict=False):
+        if not varnames:
+            varnames = _infer_variables(options, stream.peek_line())
+        stream.skip_values(_zone_value_count(options, len(varnames)))
+        zone = None
+    else:
+        zone = _read_zone_data(stream, options, varnames, dtype, variables, shared, index)
+        if shared is not None:
+            shared.add(index, zone)
+    options['OFFSET'] = [start, stream.offset]
+    return zone
 
-    # If no varnames, try to infer from first line of data
+def _read_zone_data(stream, options, varnames, dtype=None, variables=None,
+                    shared=None, index=0):
+    ''' Read zone data from stream into a dict of variable arrays.
+        Variables are converted to dtype if given, else the type set by DT.
+        Only variables matching the variables selector are returned; for
+        BLOCK packing, the other variables are never converted to numbers.
+        Shared variables and connectivity are looked up in shared, a
+        _SharedData of the earlier zones, index being this zone's index.
+    '''
+    # TODO: Process/check VARLOCATION. Currently assume all variables are nodal.
     if not varnames:
-        assert options['DATAPACKING'] == 'POINT', \
-            'Data must be in point format if variable names are omitted.'
-        position = f.tell()
-        line = f.readline()
-        f.seek(position)
-        varnames = [f'V{i}' for i in range(len(line.split()))]
+        varnames = _infer_variables(options, stream.peek_line())
     nvars = len(varnames)
+    selected = _select(varnames, variables, varnames)
+    sharing = _zone_sharing(options, index)
+    stored = [i for i in range(nvars) if i not in sharing]
+    if shared is None:
+        shared = _SharedData()
 
-    # Warnings/consistnecy checks
-    assert options['ZONETYPE'] == 'ORDERED', 'This function only supports ordered zones'
-    if options['DT'] and not all([dt == 'DOUBLE' for dt in options['DT']]):
-        log.warning('Converting all variable data to double precision')
-
-    # Load all the data for this zone
-    npts = options['I'] * options['J'] * options['K']
-    data = np.fromfile(f, count=npts*nvars, sep=' ')
+    dtypes = _zone_dtypes(options, nvars, dtype)
+    shape = _zone_shape(options)
+    npts = int(np.prod(shape))
+    vardata = {}
     if options['DATAPACKING'] == 'POINT':
-        data = data.reshape((nvars, options['I'], options['J'], options['K']), order='F')
-        vardata = [np.squeeze(data[i,:,:,:]) for i in range(nvars)]
+        data = stream.read_values(npts*len(stored))
+        data = data.reshape((len(stored),) + shape, order='F')
+        vardata = {i: data[n] for n, i in enumerate(stored) if i in selected}
     else:
-        data = data.reshape((options['I'], options['J'], options['K'], nvars), order='F')
-        vardata = [np.squeeze(data[:,:,:,i]) for i in range(nvars)]
+        for i in stored:
+            if i in selected:
+                vardata[i] = stream.read_values(npts).reshape(shape, order='F')
+            else:
+                stream.skip_values(npts)
+
+    # Element connectivity follows the nodal data for FE zones
+    connectivity = None
+    if options['ZONETYPE'] != 'ORDERED':
+        if options['CONNECTIVITYSHAREZONE'] is not None:
+            connectivity = shared.get(options['CONNECTIVITYSHAREZONE'], None)
+        else:
+            nodes = _FE_NODES[options['ZONETYPE']]
+            connectivity = stream.read_values(options['ELEMENTS']*nodes, np.int32)
+            connectivity = connectivity.reshape(-1, nodes)
+            connectivity -= 1
+
+    # Shared variables keep the type of the zone they are shared from
+    zone = Zone(options=options, connectivity=connectivity)
+    for i in selected:
+        if i in sharing:
+            data = shared.get(sharing[i], varnames[i])
+            if dtype is not None:
+                data = data.astype(dtype, copy=False)
+        else:
+            data = np.squeeze(vardata[i]).astype(dtypes[i], copy=False)
+        zone[varnames[i]] = data
+    return zone
+
+def _reload_zone_data(path, options, varnames, dtype, name, shared, index):
+    ''' Re-read a variable (or connectivity if name is None) of a zone
+        from the file at path. Options must include the zone 'OFFSET'.
+    '''
+    start, end = options['OFFSET']
+    with open_compressed(path) as f:
+        if f.seekable():
+            f.seek(start)
+        else:
+            remaining = start
+            while remaining > 0:
+                data = f.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    raise EOFError(f'Unexpected end of file in "{path}"')
+                remaining -= len(data)
+        stream = TextStream.from_bytes(f.read(end - start))
+    variables = [] if name is None else [name]
+    zone = _read_zone_data(stream, options, varnames, dtype, variables, shared, index)
+    return zone.connectivity if name is None else zone[name]
+
+def _infer_variables(options, line):
+    ''' Generate default variable names from the first line of zone data '''
+    assert options['DATAPACKING'] == 'POINT', \
+        'Data must be in point format if variable names are omitted.'
+    return [f'V{i}' for i in range(len(line.split()))]
+
+def _zone_coordinates(zone, ndims):
+    ''' Return names of the coordinate variables of a zone '''
+    for names in (('X', 'Y', 'Z'), ('x', 'y', 'z')):
+        if all(v in zone for v in names[:ndims]):
+            return names[:ndims]
+    raise KeyError(f'Zone has no {ndims}D coordinate variables; pass coordinates')
+
+def _zone_shape(options):
+    ''' Return shape of the nodal data of a zone '''
+    if options['ZONETYPE'] == 'ORDERED':
+        return (options['I'], options['J'], options['K'])
+    assert options['ZONETYPE'] in _FE_NODES, \
+        f'Unsupported zone type "{options["ZONETYPE"]}"'
+    return (options['NODES'],)
+
+def _zone_value_count(options, nvars):
+    ''' Return number of values in the data block of an ASCII zone.
+        Shared variables and connectivity are not stored in the zone.
+    '''
+    count = int(np.prod(_zone_shape(options))) * (nvars - len(options['VARSHARELIST']))
+    if options['ZONETYPE'] != 'ORDERED' and options['CONNECTIVITYSHAREZONE'] is None:
+        count += options['ELEMENTS'] * _FE_NODES[options['ZONETYPE']]
+    return count
+
+def _zone_sharing(options, index):
+    ''' Return dict of shared variable index: index of the source zone.
+        Index is the index of the zone the options belong to.
+    '''
+    return {
+        var: index - 1 if zone is None else zone
+        for var, zone in options.get('VARSHARELIST', [])
+    }
 
-    return dict(zip(varnames,vardata))
+def _zone_dtypes(options, nvars, dtype=None):
+    ''' Return numpy data type of each variable in a zone '''
+    if dtype is not None:
+        return [np.dtype(dtype)] * nvars
+    names = options['DT'] + ['DOUBLE'] * (nvars - len(options['DT']))
+    for name in names:
+        assert name in _DT_DTYPES, f'Invalid data type "{name}"'
+    return [np.dtype(_DT_DTYPES[name]) for name in names[:nvars]]
 
-def _read_zone_options(f):
+def _read_zone_options(stream):
     ''' Parse options from zone header '''
 
     # Get all lines of the zone header
-    header = f.readline().split(maxsplit=1)[1]  # Remove "ZONE" keyword
-    for first_word in _peek_line(f):
-        if first_word[0] in '123456890+-.':
+    header = stream.readline().split(maxsplit=1)[1]  # Remove "ZONE" keyword
+    while True:
+        first_word = stream.peek_word()
+        if first_word is None or first_word[0] in '1234567890+-.':
             break
+        elif first_word.upper() in _TECPLOT_KEYWORDS:
+            break
+        header += stream.readline()
+    return _parse_zone_options(header)
+
+def _index_dat(stream):
+    ''' Build index of variable names and zones from a TextStream.
+        Only headers are parsed; each zone entry records the byte range of
+        its data block in the 'OFFSET' option.
+    '''
+    variables = None
+    zones = []
+    while True:
+        first_word = stream.peek_word()
+        if first_word is None:
+            break
+        first_word = first_word.upper()
+        if first_word == 'VARIABLES':
+            variables = _read_variables(stream)
+        elif first_word == 'ZONE':
+            options = _read_zone_options(stream)
+            varnames = variables or _infer_variables(options, stream.peek_line())
+            start = stream.offset
+            stream.skip_values(_zone_value_count(options, len(varnames)))
+            options['OFFSET'] = [start, stream.offset]
+            zones.append(options)
         else:
-            header += f.readline()
+            if first_word in _TECPLOT_KEYWORDS:
+                log.info('Ignoring "%s" record.', first_word)
+            stream.readline()
+    log.info('Indexed %d zones', len(zones))
+    return {'variables': variables, 'zones': zones}
+
+def _parse_variables(record):
+    ''' Parse variable names from body of "variables" record '''
+    variables = shlex.split(record)
+    log.info('Read variable names %s from file header', variables)
+    return variables
 
-    # Split the header in to key-value pairs
-    tokens  = [ s.strip().upper() for s in re.split(',?\s*(\w+)\s*=', header.strip()) ]
-    options = dict(zip(tokens[1::2],tokens[2::2])) # tokens[0] is alway empty string
+def _parse_zone_options(header):
+    ''' Parse options from body of zone header '''
+
+    # Split the header in to key-value pairs. Zone title retains its case.
+    tokens  = [ s.strip() for s in re.split(r',?\s*(\w+)\s*=', header.strip()) ]
+    options = {k.upper(): v.upper() for k, v in zip(tokens[1::2],tokens[2::2])}
+    titles  = [v for k, v in zip(tokens[1::2],tokens[2::2]) if k.upper() == 'T']
 
     # Do clean up on options we acutally use (dequote, coerce types, etc.)
-    options['T']  = _remove_delimiters(options.get('T',''))
+    options['T']  = _remove_delimiters(titles[0] if titles else '')
     options['I']  = int(options.get('I',1))
     options['J']  = int(options.get('J',1))
     options['K']  = int(options.get('K',1))
     options['DT'] = _remove_delimiters(options.get('DT','DOUBLE')).split()
+
+    # Accept the older F=FEPOINT, ET=TRIANGLE, N=, E= style of FE header
+    if 'ET' in options:
+        options.setdefault('ZONETYPE', 'FE' + options['ET'])
+    if options.get('F') in ('POINT', 'BLOCK', 'FEPOINT', 'FEBLOCK'):
+        options.setdefault('DATAPACKING', options['F'].replace('FE', ''))
     options['ZONETYPE'] = _remove_delimiters(options.get('ZONETYPE','ORDERED'))
     options['DATAPACKING'] = _remove_delimiters(options.get('DATAPACKING','BLOCK'))
+    options['NODES'] = int(options.get('NODES', options.get('N', 0)))
+    options['ELEMENTS'] = int(options.get('ELEMENTS', options.get('E', 0)))
+    options['SOLUTIONTIME'] = float(options.get('SOLUTIONTIME',0.0))
+    options['STRANDID'] = int(options.get('STRANDID',0))
+
+    # Variable/connectivity sharing; stored with 0-based indices
+    options['VARSHARELIST'] = _parse_varsharelist(options.get('VARSHARELIST',''))
+    share_zone = options.get('CONNECTIVITYSHAREZONE')
+    options['CONNECTIVITYSHAREZONE'] = int(share_zone) - 1 if share_zone else None
 
     return options
 
+def _parse_varsharelist(value):
+    ''' Parse a VARSHARELIST option, e.g. "([1-3]=1, [5])", into a list of
+        [variable, zone] pairs. Zone is None to share from the previous zone.
+    '''
+    sharing = []
+    for group in re.finditer(r'\[([^\]]*)\]\s*(?:=\s*(\d+))?', value):
+        zone = int(group[2]) - 1 if group[2] else None
+        for item in group[1].split(','):
+            first, _, last = item.partition('-')
+            for var in range(int(first), int(last or first) + 1):
+                sharing.append([var - 1, zone])
+    return sharing
+
+
+def _pack_zones(zones):
+    ''' Return arrays and JSON metadata of zones for the parse cache.
+        Arrays shared between zones are stored once.
+    '''
+    arrays = []
+    stored = {}
+    def store(data):
+        if id(data) not in stored:
+            stored[id(data)] = len(arrays)
+            arrays.append(data)
+        return stored[id(data)]
+    meta = []
+    for zone in zones:
+        meta.append({
+            'options': zone.options,
+            'variables': {name: store(data) for name, data in zone.items()},
+            'connectivity': None if zone.connectivity is None else store(zone.connectivity),
+        })
+    return arrays, meta
+
+def _unpack_zones(arrays, meta):
+    ''' Rebuild zones from the parse cache '''
+    return [
+        Zone({name: arrays[n] for name, n in entry['variables'].items()}, entry['options'],
+             None if entry['connectivity'] is None else arrays[entry['connectivity']])
+        for entry in meta
+    ]
+
+def _write_dat_impl(f, zones, titles, datapacking, title):
+    ''' Write Tecplot ASCII file data from an iterable of dicts '''
+    datapacking = datapacking.upper()
+    assert datapacking in ('BLOCK', 'POINT'), f'Invalid DATAPACKING "{datapacking}"'
+    titles = iter(titles) if titles is not None else None
+    varnames = None
+    owners = {}
+    for n, zone in enumerate(zones):
+        if varnames is None:
+            varnames = list(zone.keys())
+            f.write(f'TITLE = "{title}"\n')
+            f.write('VARIABLES = ' + ' '.join(f'"{v}"' for v in varnames) + '\n')
+        assert list(zone.keys()) == varnames, 'All zones must have the same variables'
+        zone_title, strand, time = _zone_header(zone, titles, n)
+        dims, formats = _zone_layout(zone)
+        dtypes = ' '.join(fmt[0] for fmt in formats)
+        f.write(f'ZONE T="{zone_title}"\n')
+        if strand or time:
+            f.write(f' STRANDID={strand}, SOLUTIONTIME={time!r}\n')
+        if dims['ZONETYPE'] == 'ORDERED':
+            f.write(' I={I}, J={J}, K={K}, ZONETYPE=Ordered\n'.format(**dims))
+        else:
+            f.write(' NODES={NODES}, ELEMENTS={ELEMENTS}, ZONETYPE={ZONETYPE}\n'.format(**dims))
+        f.write(f' DATAPACKING={datapacking}\n')
+        f.write(f' DT=({dtypes})\n')
+        shared, share_zone = _zone_shares(zone, n, owners)
+        if shared:
+            groups = {}
+            for i, source in shared.items():
+                groups.setdefault(source, []).append(str(i + 1))
+            groups = ', '.join(f'[{",".join(v)}]={z+1}' for z, v in groups.items())
+            f.write(f' VARSHARELIST=({groups})\n')
+        if share_zone is not None:
+            f.write(f' CONNECTIVITYSHAREZONE={share_zone+1}\n')
+        stored = [
+            (data, fmt) for i, (data, fmt) in enumerate(zip(_zone_arrays(zone, formats), formats))
+            if i not in shared
+        ]
+        if datapacking == 'BLOCK':
+            for data, fmt in stored:
+                write_values(f, data, [fmt[2]]*_VALUES_PER_LINE)
+        elif stored:
+            data = np.stack([data for data, fmt in stored], axis=1).astype(np.float64)
+            write_values(f, data, [fmt[2] for data, fmt in stored])
+        if dims['ZONETYPE'] != 'ORDERED' and share_zone is None:
+            connectivity = np.asarray(zone.connectivity, np.int64) + 1
+            write_values(f, connectivity, ['%d']*connectivity.shape[1])
+
+def _write_plt_impl(f, zones, titles, title):
+    ''' Write Tecplot binary file data from an iterable of dicts '''
+    titles = iter(titles) if titles is not None else None
+    if isinstance(zones, collections.abc.Sequence):
+        headers = [_zone_header(zone, titles, n) for n, zone in enumerate(zones)]
+        layouts = [_zone_layout(zone) for zone in zones]
+        varnames = list(zones[0].keys()) if zones else []
+        for zone in zones:
+            assert list(zone.keys()) == varnames, 'All zones must have the same variables'
+        _write_plt_header(f, varnames, headers, layouts, title)
+        owners = {}
+        for n, (zone, (dims, formats)) in enumerate(zip(zones, layouts)):
+            _write_plt_zone(f, zone, formats, _zone_shares(zone, n, owners))
+    else:
+        headers = []
+        layouts = []
+        varnames = None
+        owners = {}
+        with tempfile.TemporaryFile() as spool:
+            for n, zone in enumerate(zones):
+                if varnames is None:
+                    varnames = list(zone.keys())
+                assert list(zone.keys()) == varnames, 'All zones must have the same variables'
+                headers.append(_zone_header(zone, titles, n))
+                layouts.append(_zone_layout(zone))
+                _write_plt_zone(spool, zone, layouts[-1][1], _zone_shares(zone, n, owners))
+            _write_plt_header(f, varnames or [], headers, layouts, title)
+            spool.seek(0)
+            shutil.copyfileobj(spool, f)
+
+def _write_plt_header(f, varnames, headers, layouts, title):
+    ''' Write header section of a binary file '''
+    f.write(b'#!TDV112')
+    _write_array(f, '<i4', [1, 0])              # Byte order, file type
+    _write_string(f, title)
+    _write_array(f, '<i4', [len(varnames)])
+    for name in varnames:
+        _write_string(f, name)
+    for (zone_title, strand, time), (dims, formats) in zip(headers, layouts):
+        zonetype = _PLT_ZONETYPES.index(dims['ZONETYPE'])
+        if dims['ZONETYPE'] == 'ORDERED':
+            sizes = [dims['I'], dims['J'], dims['K']]
+        else:
+            sizes = [dims['NODES'], dims['ELEMENTS'], 0, 0, 0]
+        _write_array(f, '<f4', [_PLT_ZONE])
+        _write_string(f, zone_title)
+        _write_array(f, '<i4', [-1, strand])    # Parent zone, strand ID
+        _write_array(f, '<f8', [time])          # Solution time
+        _write_array(f, '<i4', [-1, zonetype, 0, 0, 0, *sizes, 0])
+    _write_array(f, '<f4', [_PLT_EOH])
+
+def _write_plt_zone(f, zone, formats, shares):
+    ''' Write data section for a single zone of a binary file.
+        Shares is the shared variables and connectivity from _zone_shares.
+    '''
+    shared, share_zone = shares
+    arrays = [a for i, a in enumerate(_zone_arrays(zone, formats)) if i not in shared]
+    _write_array(f, '<f4', [_PLT_ZONE])
+    _write_array(f, '<i4', [fmt[1] for fmt in formats])
+    _write_array(f, '<i4', [0])                 # No passive variables
+    if shared:
+        _write_array(f, '<i4', [1] + [shared.get(i, -1) for i in range(len(formats))])
+    else:
+        _write_array(f, '<i4', [0])
+    _write_array(f, '<i4', [-1 if share_zone is None else share_zone])
+    limits = [[np.nanmin(a), np.nanmax(a)] if a.size else [0, 0] for a in arrays]
+    _write_array(f, '<f8', limits)
+    for data in arrays:
+        f.write(data.data)
+    if _zone_connectivity(zone) is not None and share_zone is None:
+        f.write(np.ascontiguousarray(zone.connectivity, '<i4').data)
+
+def _zone_header(zone, titles, n):
+    ''' Return title, strand ID and solution time for the nth zone written.
+        Uses the next of titles if given, else the header of a Zone object.
+    '''
+    options = getattr(zone, 'options', {})
+    if titles is not None:
+        zone_title = next(titles)
+    else:
+        zone_title = options.get('T') or f'Zone {n+1}'
+    return zone_title, options.get('STRANDID', 0), options.get('SOLUTIONTIME', 0.0)
+
+def _zone_layout(zone):
+    ''' Return the zone type and dimensions of a zone and output format
+        of each variable. Zones with connectivity are written as FE zones.
+    '''
+    arrays = [np.asarray(a) for a in zone.values()]
+    shape = arrays[0].shape if arrays else ()
+    assert len(shape) <= 3, 'Zones may have at most three dimensions'
+    assert all(a.shape == shape for a in arrays), 'All variables must have the same shape'
+    formats = []
+    for a in arrays:
+        key = 'u1' if a.dtype.itemsize == 1 else f'{a.dtype.kind}{a.dtype.itemsize}'
+        formats.append(_WRITE_FORMATS.get(key, _WRITE_FORMATS['f8']))
+
+    connectivity = _zone_connectivity(zone)
+    if connectivity is None:
+        shape = tuple(shape) + (1,)*(3 - len(shape))
+        return dict(zip(('ZONETYPE', 'I', 'J', 'K'), ('ORDERED',) + shape)), formats
+    assert len(shape) == 1, 'Variables in FE zones must be 1D'
+    zonetype = getattr(zone, 'options', {}).get('ZONETYPE', '')
+    if _FE_NODES.get(zonetype) != connectivity.shape[1]:
+        zonetype = {2: 'FELINESEG', 3: 'FETRIANGLE', 4: 'FEQUADRILATERAL', 8: 'FEBRICK'}
+        zonetype = zonetype[connectivity.shape[1]]
+    dims = {'ZONETYPE': zonetype, 'NODES': shape[0], 'ELEMENTS': connectivity.shape[0]}
+    return dims, formats
+
+def _zone_shares(zone, n, owners):
+    ''' Return variables and connectivity of the nth zone written that are
+        shared with an earlier zone, as a dict of variable index: source
+        zone and the connectivity source zone (or None). An array is shared
+        if it is the same object as in the last zone that stored it. Owners
+        maps variable names (None for connectivity) to that zone and array
+        and is updated for the arrays stored by this zone.
+    '''
+    shared = {}
+    share_zone = None
+    items = list(zone.items()) + [(None, getattr(zone, 'connectivity', None))]
+    for i, (name, data) in enumerate(items):
+        if data is None:
+            continue
+        owner = owners.get(name)
+        if owner is not None and owner[1] is data:
+            if name is None:
+                share_zone = owner[0]
+            else:
+                shared[i] = owner[0]
+        else:
+            owners[name] = (n, data)
+    return shared, share_zone
+
+def _zone_arrays(zone, formats):
+    ''' Return zone variables as flat, little-endian arrays in Fortran order '''
+    dtypes = {fmt: dtype for dtype, fmt in _WRITE_FORMATS.items()}
+    return [
+        np.ravel(np.asarray(a), order='F').astype(np.dtype(dtypes[fmt]).newbyteorder('<'), copy=False)
+        for a, fmt in zip(zone.values(), formats)
+    ]
+
+def _zone_connectivity(zone):
+    ''' Return connectivity of a Zone, or None for ordered zones/plain dicts '''
+    connectivity = getattr(zone, 'connectivity', None)
+    return None if connectivity is None else np.asarray(connectivity)
+
 
 #----------------------------------------------------------------------------
 # Low Level Helper Function
 #----------------------------------------------------------------------------
-def _peek_line(f):
-    ''' Yield first word each non-blank line of a file w/o advancing file pointer.
-        Note: If you read from a file after peeking, the next word yielded
-              by the generator will be the first word after the end of the read.
-              Thus, if your read terminated mid-line, the word yielded will not
-              be the first word of the next line.
-    '''
-    position = f.tell()
-    for line in iter(f.readline, ''):
-        line = line.strip()
-        if line:
-            first_word = re.split('[ =]', line, maxsplit=1)[0]
-            f.seek(position)
-            yield first_word
-        position = f.tell()
+class _SharedData:
+    ''' Arrays of the zones read so far, for resolving shared variables.
+        Arrays are held by weak reference until a later zone shares them,
+        and by strong reference from then on, so arrays nobody shares may
+        still be released by the caller. Arrays that are not available
+        (released, or of a zone that was not read) are recovered with
+        reload(index, name) if given. Connectivity is stored as name None.
+    '''
+
+    def __init__(self, reload=None):
+        self.reload = reload
+        self._refs = {}
+        self._shared = {}
+
+    def add(self, index, zone):
+        ''' Register the arrays of the zone at index '''
+        for name, data in zone.items():
+            self._refs[index, name] = weakref.ref(data)
+        if zone.connectivity is not None:
+            self._refs[index, None] = weakref.ref(zone.connectivity)
+
+    def get(self, index, name):
+        ''' Return variable name (or connectivity) of the zone at index '''
+        key = (index, name)
+        if key not in self._shared:
+            ref = self._refs.get(key)
+            data = None if ref is None else ref()
+            if data is None:
+                if self.reload is None:
+                    what = 'Connectivity' if name is None else f'Variable "{name}"'
+                    raise RuntimeError(f'{what} of zone {index+1} is shared by a later '
+                                       'zone, but the zone was not read or was released')
+                data = self.reload(index, name)
+            self._shared[key] = data
+        return self._shared[key]
+
+
+class _PltReader:
+    ''' Sequential reader for primitive values in a Tecplot binary buffer '''
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+        self.order = '<'
+
+    def check_byte_order(self):
+        ''' Detect byte order from the integer 1 following the magic number '''
+        if self.int32() != 1:
+            self.order = '>'
+        self.pos -= 4
+        assert self.int32() == 1, 'Unable to determine byte order'
+
+    def bytes(self, count):
+        value = self.buf[self.pos:self.pos + count]
+        self.pos += count
+        return value
+
+    def array(self, dtype, count):
+        ''' Return a zero-copy view of the next count values '''
+        dtype = np.dtype(dtype).newbyteorder(self.order)
+        value = np.frombuffer(self.buf, dtype, count, self.pos)
+        self.pos += count * dtype.itemsize
+        return value
+
+    def int32(self):
+        return int(self.array('i4', 1)[0])
+
+    def int32s(self, count):
+        return self.array('i4', count).tolist()
+
+    def float32(self):
+        return float(self.array('f4', 1)[0])
+
+    def float64(self):
+        return float(self.array('f8', 1)[0])
+
+    def float64s(self, count):
+        return self.array('f8', count).tolist()
+
+    def string(self):
+        ''' Read null-terminated string stored as one int32 per character '''
+        chars = []
+        while True:
+            c = self.int32()
+            if c == 0:
+                return ''.join(chars)
+            chars.append(chr(c))
+
+def _select(items, selector, names, start=0, strict=True):
+    ''' Return indices of items matched by a selector.
+        Selector may be None (all items), a predicate called with each item
+        or a list of names and/or indices. Start is the index of items[0].
+        If strict, names/indices that match no item raise a KeyError.
+    '''
+    indices = range(start, start + len(items))
+    if selector is None:
+        return list(indices)
+    if callable(selector):
+        return [i for i, item in zip(indices, items) if selector(item)]
+    if isinstance(selector, (str, int)):
+        selector = [selector]
+    wanted = set()
+    for key in selector:
+        if isinstance(key, str):
+            if strict and key not in names:
+                raise KeyError(f'No match for "{key}"')
+            wanted.update(i for i, name in zip(indices, names) if name == key)
+        elif strict:
+            if not -len(items) <= key < len(items):
+                raise KeyError(f'Index {key} out of range')
+            wanted.add(key % len(items))
+        else:
+            wanted.add(key)
+    return [i for i in indices if i in wanted]
+
+def _write_array(f, dtype, values):
+    ''' Write a sequence of values to a binary file '''
+    f.write(np.array(values, dtype).tobytes())
+
+def _write_string(f, s):
+    ''' Write null-terminated string as one int32 per character '''
+    _write_array(f, '<i4', [*map(ord, s), 0])
 
 def _remove_delimiters(s, delim='"\'()[]'):
     ''' Removes delimiters from start and end of string '''
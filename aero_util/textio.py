@@ -0,0 +1,176 @@
+''' Buffered tokenizing and bulk writing of ASCII numeric data files '''
+
+import io
+import numpy as np
+import re
+import warnings
+
+# Size of reads from the underlying file when parsing ASCII data
+CHUNK_SIZE = 1 << 20
+
+# Number of values per formatting operation when writing
+_VALUES_PER_CHUNK = 1 << 16
+
+
+#----------------------------------------------------------------------------
+# Public API Functions
+#----------------------------------------------------------------------------
+class TextStream:
+    ''' Forward-only buffered reader for ASCII (Tecplot, Plot3D) data.
+        Reads a binary (or text) file object in large chunks and never
+        seeks, so it may be used on pipes and other non-seekable inputs.
+        Header lines are returned as str; numeric data is tokenized and
+        converted in bulk with numpy.
+    '''
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        if isinstance(f, io.TextIOBase):
+            f = f.buffer if hasattr(f, 'buffer') else io.BytesIO(f.read().encode())
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = b''
+        self.pos = 0
+        self.base = 0       # Offset of buf[0] in the file
+        self.eof = False
+
+    @classmethod
+    def from_bytes(cls, buf):
+        ''' Create a stream over an in-memory buffer '''
+        stream = cls(None)
+        stream.buf = bytes(buf)
+        stream.eof = True
+        return stream
+
+    def _fill(self, size=None):
+        ''' Append up to size bytes (default: chunk_size) to the buffer.
+            Returns False if no more data is available.
+        '''
+        if self.eof:
+            return False
+        data = self.f.read(max(size or 0, self.chunk_size))
+        if not data:
+            self.eof = True
+            return False
+        self.base += self.pos
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    @property
+    def offset(self):
+        ''' Number of bytes consumed from the file '''
+        return self.base + self.pos
+
+    def peek_line(self):
+        ''' Return next line without consuming it, or None at end of file '''
+        line = self._next_line()
+        return line.decode() if line else None
+
+    def readline(self):
+        ''' Consume and return the next line ('' at end of file) '''
+        line = self._next_line()
+        self.pos += len(line)
+        return line.decode()
+
+    def _next_line(self):
+        ''' Return bytes of the next line, including the newline '''
+        while True:
+            end = self.buf.find(b'\n', self.pos)
+            if end >= 0:
+                return self.buf[self.pos:end+1]
+            if not self._fill():
+                return self.buf[self.pos:]
+
+    def peek_word(self):
+        ''' Return first word of the next non-blank line without consuming
+            it, or None at end of file. Blank lines are consumed.
+        '''
+        while True:
+            line = self.peek_line()
+            if line is None:
+                return None
+            line = line.strip()
+            if line:
+                return re.split('[ =]', line, maxsplit=1)[0]
+            self.readline()
+
+    def read_values(self, count, dtype=float):
+        ''' Parse the next count whitespace-delimited numbers '''
+        values = np.empty(count, dtype)
+        filled = 0
+        for start, end, ntokens in self._tokens(count):
+            # Parsing stops (with a warning) at the first invalid token, so
+            # the data is short; with count= the rest would be garbage
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', DeprecationWarning)
+                data = np.fromstring(self.buf[start:end], dtype, sep=' ')
+            if len(data) != ntokens:
+                token = self.buf[start:end].split()[len(data)].decode(errors='replace')
+                raise ValueError(f'Invalid numeric value "{token}"')
+            values[filled:filled+ntokens] = data
+            filled += ntokens
+        return values
+
+    def skip_values(self, count):
+        ''' Consume the next count whitespace-delimited tokens '''
+        for _ in self._tokens(count):
+            pass
+
+    def _tokens(self, count):
+        ''' Consume count tokens, yielding the (start, end, ntokens) buffer
+            slices holding them. Each slice is valid until the next iteration.
+        '''
+        remaining = count
+        window = 4096
+        while remaining:
+            # Only scan about as many bytes as the remaining tokens need
+            end = min(len(self.buf), self.pos + max(window, 24*remaining))
+            final = end == len(self.buf) and self.eof
+            ends = _token_ends(memoryview(self.buf)[self.pos:end], final)
+            if len(ends) == 0:
+                if end < len(self.buf):
+                    window *= 2
+                elif not self._fill(end - self.pos) and final:
+                    raise ValueError(f'Unexpected end of file; expected {remaining} more values')
+                continue
+            ntokens = min(remaining, len(ends))
+            start, stop = self.pos, self.pos + int(ends[ntokens-1])
+            self.pos = stop
+            remaining -= ntokens
+            yield start, stop, ntokens
+
+def write_values(f, data, fmts):
+    ''' Write rows of values to a text file with one formatting operation
+        per chunk. Data may be 1D (wrapped to len(fmts) values per line) or
+        2D (one row per line).
+    '''
+    if data.ndim == 1:
+        ncols = len(fmts)
+        nrows = len(data) // ncols
+        tail = data[nrows*ncols:]
+        data = data[:nrows*ncols].reshape(nrows, ncols)
+    else:
+        tail = data[:0]
+    row = ' ' + ' '.join(fmts) + '\n'
+    chunk = max(1, _VALUES_PER_CHUNK // len(fmts))
+    for start in range(0, len(data), chunk):
+        rows = data[start:start+chunk]
+        f.write((row * len(rows)) % tuple(rows.ravel().tolist()))
+    if len(tail):
+        f.write(' ' + ' '.join(fmts[:len(tail)]) % tuple(tail.tolist()) + '\n')
+
+
+#----------------------------------------------------------------------------
+# Helper Functions
+#----------------------------------------------------------------------------
+def _token_ends(text, final=True):
+    ''' Return offset of the end of each whitespace-delimited token in text.
+        If not final, a token running up to the end of text is incomplete
+        and is not counted.
+    '''
+    chars = np.frombuffer(text, np.uint8)
+    space = chars <= ord(' ')
+    ends = np.flatnonzero(~space[:-1] & space[1:]) + 1
+    if final and len(chars) and not space[-1]:
+        ends = np.append(ends, len(chars))
+    return ends
@@ -9,5 +9,5 @@ setup(
     author = 'Jeffrey Hill',
     author_email = 'jeff.p.hill@gmail.com',
     packages = ['aero_util'],
-    python_requires = '>=3.6',
+    python_requires = '>=3.7',
 )
@@ -0,0 +1,53 @@
+''' Benchmarks for aero_util.attitude conversions
+
+    Run with "python -m test.bench_attitude" from the repository root.
+'''
+import numpy as np
+from aero_util import attitude, core
+from .bench_core import rate
+from .test_attitude import ref_ab_from_uvw, ref_ap_from_uvw, ref_uvw_from_ab, ref_uvw_from_ap
+
+
+def ref_ab_from_ap(alphat, phi):
+    ''' Previous attitude.ab_from_ap implementation '''
+    return ref_ab_from_uvw(*ref_uvw_from_ap(alphat, phi))
+
+def ref_ap_from_ab(alpha, beta):
+    ''' Previous attitude.ap_from_ab implementation '''
+    return ref_ap_from_uvw(*ref_uvw_from_ab(alpha, beta))
+
+def stitched_wind_angles(velocity, wind, euler_deg):
+    ''' Previous approach: batched DCMs, then the separate conversions '''
+    dcm = core.rotate_seq('zyx', angles_deg=euler_deg)
+    u, v, w = core.transform(list((velocity - wind).T), dcm)
+    return attitude.ab_from_uvw(u, v, w) + attitude.ap_from_uvw(u, v, w)
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    n = 1000000
+    x, y = rng.uniform(-1.0, 1.0, (2, n))
+    out = (np.empty(n), np.empty(n))
+    for name, ref in (('ab_from_ap', ref_ab_from_ap), ('ap_from_ab', ref_ap_from_ab)):
+        func = getattr(attitude, name)
+        old = rate(f'{name} previous (1M)', ref, x, y, number=5)
+        new = rate(f'{name} (1M)', func, x, y, number=5)
+        print(f'{"":40s} {old/new:10.1f} x')
+        new = rate(f'{name} out= (1M)', lambda: func(x, y, out=out), number=5)
+        print(f'{"":40s} {old/new:10.1f} x')
+
+    for n in (1000000, 10000000):
+        euler = list(rng.uniform(-90.0, 90.0, (3, n)))
+        velocity = rng.uniform(-100.0, 100.0, (n, 3))
+        wind = np.array([10.0, -5.0, 2.0])
+        label = f'({n//1000000}M)'
+        if n <= 1000000:
+            old = rate(f'stitched rotate_seq/transform {label}', stitched_wind_angles,
+                       velocity, wind, euler, number=1)
+        new = rate(f'wind_angles euler {label}', lambda: attitude.wind_angles(
+            velocity, wind, sequence='zyx', angles_deg=euler), number=1)
+        print(f'{"":40s} {old*n/1e6/new:10.1f} x (per sample)')
+        q = core.quat_seq('zyx', angles_deg=euler)
+        new = rate(f'wind_angles quaternion {label}', lambda: attitude.wind_angles(
+            velocity, wind, q=q), number=1)
+        print(f'{"":40s} {old*n/1e6/new:10.1f} x (per sample)')
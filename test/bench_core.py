@@ -0,0 +1,41 @@
+''' Benchmarks for aero_util.core unit conversions
+
+    Run with "python -m test.bench_core" from the repository root.
+'''
+import time
+import numpy as np
+from aero_util import core
+
+
+def rate(label, func, *args, repeat=3, number=2000):
+    ''' Print best-of-repeat time per call of func '''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func(*args)
+        best = min(best, (time.perf_counter() - start) / number)
+    print(f'{label:40s} {best*1e6:10.2f} us/call')
+    return best
+
+
+def pint_convert(value, uin, uout):
+    ''' Previous core.convert implementation '''
+    return core._pint_convert(value, uin, uout)
+
+def pint_convert_to(value, uout):
+    ''' Previous core.convert_to implementation '''
+    si_unit = core._registry()(uout).to_base_units().units
+    return core._pint_convert(value, si_unit, uout)
+
+
+if __name__ == '__main__':
+    array = np.linspace(0.0, 1e4, 10000)
+    for label, value in (('scalar', 1234.5), ('10k array', array)):
+        for uin, uout in (('ft', 'm'), ('degF', 'K')):
+            old = rate(f'pint convert {uin}->{uout} ({label})', pint_convert, value, uin, uout)
+            new = rate(f'convert {uin}->{uout} ({label})', core.convert, value, uin, uout)
+            print(f'{"":40s} {old/new:10.1f} x')
+        old = rate(f'pint convert_to psi ({label})', pint_convert_to, value, 'psi')
+        new = rate(f'convert_to psi ({label})', core.convert_to, value, 'psi')
+        print(f'{"":40s} {old/new:10.1f} x')
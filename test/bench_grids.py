@@ -0,0 +1,49 @@
+''' Throughput benchmarks for aero_util.grids
+
+    Run with "python -m test.bench_grids" from the repository root.
+'''
+import os
+import tempfile
+import numpy as np
+from itertools import chain
+from aero_util import grids
+from aero_util.cache import Cache
+from .bench_tecio import throughput
+
+
+def multi_block_file(path, nblock, size):
+    ''' Write a synthetic multi-block 3D ASCII Plot3D grid '''
+    rng = np.random.default_rng(0)
+    with open(path, 'w') as f:
+        f.write(f' {nblock}\n')
+        for _ in range(nblock):
+            f.write(' {} {} {}\n'.format(*size))
+        for _ in range(nblock):
+            values = rng.uniform(-1.0, 1.0, 3*int(np.prod(size)))
+            np.savetxt(f, values.reshape(-1, 4), fmt='%.12E')
+    return os.path.getsize(path)
+
+
+def load_tokenized(path):
+    ''' Previous grids.load implementation: tokenize each line in Python '''
+    with open(path) as f:
+        nblock = int(next(f))
+        sizes = [tuple(map(int, next(f).split())) for _ in range(nblock)]
+        words = chain.from_iterable(line.split() for line in f)
+        return [
+            [np.fromiter(words, float, int(np.prod(size))).reshape(size, order='F')
+             for _ in range(3)]
+            for size in sizes
+        ]
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'blocks.p3d')
+        size = multi_block_file(path, 8, (64, 64, 32))
+        print(f'{size/1e6:.1f} MB, 8 blocks of 64x64x32 points')
+        throughput('line tokenizer (previous)', size, load_tokenized, path)
+        throughput('grids.load', size, grids.load, path)
+        cache = Cache(os.path.join(tmp, 'cache'))
+        grids.load(path, cache=cache)
+        throughput('grids.load (cached)', size, grids.load, path, cache)
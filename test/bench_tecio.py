@@ -0,0 +1,47 @@
+''' Throughput benchmarks for aero_util.tecio
+
+    Run with "python -m test.bench_tecio" from the repository root.
+'''
+import os
+import tempfile
+import time
+from aero_util import tecio
+from . import common
+
+
+def many_zone_file(path, copies):
+    ''' Write a file with the zones of cube.dat repeated copies times '''
+    zones = tecio.read_dat(common.data_dir/'cube.dat')
+    tecio.write_dat(path, (zone for _ in range(copies) for zone in zones))
+    return os.path.getsize(path)
+
+
+def throughput(label, size, func, *args, repeat=3):
+    ''' Print best-of-repeat throughput of func in MB/s '''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    print(f'{label:30s} {size/best/1e6:8.1f} MB/s  ({best*1e3:.1f} ms)')
+
+
+def read_file_object(path):
+    with open(path) as f:
+        return tecio.read_dat(f)
+
+
+def iterate_zones(path):
+    for zone in tecio.iter_zones(path):
+        pass
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cubes.dat')
+        size = many_zone_file(path, 500)
+        print(f'{size/1e6:.1f} MB, {6*500} zones')
+        throughput('read_dat(path)', size, tecio.read_dat, path)
+        throughput('read_dat(file object)', size, read_file_object, path)
+        throughput('iter_zones(path)', size, iterate_zones, path)
+        throughput('DatFile index', size, lambda p: tecio.DatFile(p).close(), path)
@@ -2,3 +2,14 @@ from pathlib import Path
 
 root_dir = Path(__file__).parent
 data_dir = root_dir/'data'
+
+def compressors():
+    ''' Return (name, module) for each available compression library '''
+    import bz2, gzip, lzma
+    modules = [('gz', gzip), ('bz2', bz2), ('xz', lzma)]
+    try:
+        import zstandard
+        modules.append(('zst', zstandard))
+    except ImportError:
+        pass
+    return modules
@@ -0,0 +1,61 @@
+import numpy as np
+import unittest
+from aero_util import atmosphere as atm
+
+# US Standard Atmosphere (1976) tables: geometric altitude [m], temperature
+# [K], pressure [Pa], density [kg/m^3], speed of sound [m/s], viscosity
+# [kg/m-s]
+STANDARD = np.array([
+    [-5000.0, 320.676, 1.7776e5, 1.9311,     358.99, 1.9422e-5],
+    [    0.0, 288.150, 1.01325e5, 1.2250,    340.29, 1.7894e-5],
+    [11000.0, 216.774, 2.2700e4, 3.6480e-1,  295.15, 1.4223e-5],
+    [20000.0, 216.650, 5.5293e3, 8.8910e-2,  295.07, 1.4216e-5],
+    [50000.0, 270.650, 7.9779e1, 1.0269e-3,  329.80, 1.7037e-5],
+    [86000.0, 186.946, 3.7338e-1, 6.958e-6,  274.10, 1.2533e-5],
+])
+
+class AtmosphereTestCase(unittest.TestCase):
+
+    def test_standard_values(self):
+        ''' Verify properties match the published tables '''
+        props = atm.properties(STANDARD[:, 0])
+        for n, name in enumerate(atm.PROPERTIES):
+            self.assertTrue(np.allclose(props[name], STANDARD[:, n + 1],
+                                        rtol=1e-4, atol=0), name)
+        self.assertAlmostEqual(atm.temperature(11000.0, geopotential=True), 216.65)
+        self.assertAlmostEqual(atm.geometric_altitude(atm.geopotential_altitude(20000.0)),
+                               20000.0)
+
+        # Scalars give scalars, and altitudes outside the model NaN
+        self.assertEqual(np.ndim(atm.pressure(1000.0)), 0)
+        self.assertTrue(np.all(np.isnan(atm.density([-5100.0, 86100.0]))))
+
+        # Unit inputs
+        self.assertAlmostEqual(atm.pressure(11.0, 'km', geopotential=True),
+                               atm.pressure(11000.0, geopotential=True))
+
+    def test_inverse(self):
+        ''' Verify altitudes from pressure and density invert the model '''
+        z = np.linspace(-5000.0, 86000.0, 9101)
+        self.assertTrue(np.allclose(atm.altitude_from_pressure(atm.pressure(z)), z,
+                                    rtol=0, atol=1e-6))
+        self.assertTrue(np.allclose(atm.altitude_from_density(atm.density(z)), z,
+                                    rtol=0, atol=1e-6))
+        h = atm.altitude_from_pressure(atm.pressure(z), geopotential=True)
+        self.assertTrue(np.allclose(h, atm.geopotential_altitude(z)))
+        self.assertAlmostEqual(atm.altitude_from_pressure(14.696, 'psi'), 0.0, delta=1.0)
+        self.assertTrue(np.all(np.isnan(atm.altitude_from_pressure([2e5, 0.1]))))
+
+    def test_table(self):
+        ''' Verify table interpolation is close to the model '''
+        table = atm.Table()
+        z = np.random.default_rng(0).uniform(-5000.0, 86000.0, 10000)
+        z = np.concatenate([z, [-5000.0, 86000.0, -5100.0]])
+        expected = atm.properties(z)
+        props = table.properties(z)
+        for name in atm.PROPERTIES:
+            self.assertTrue(np.allclose(props[name][:-1], expected[name][:-1],
+                                        rtol=1e-6, atol=0), name)
+            self.assertTrue(np.isnan(props[name][-1]))
+        props = table.properties(z[:10]/0.3048, 'ft')
+        self.assertTrue(np.allclose(props['pressure'], expected['pressure'][:10], rtol=1e-6))
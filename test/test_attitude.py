@@ -1,5 +1,6 @@
 import numpy as np
 import unittest
+from aero_util import core
 from aero_util.attitude import *
 
 rad = np.radians
@@ -11,6 +12,19 @@ def all_close(test_case, array1, array2):
 def all_true(test_case, logical_array):
     test_case.assertTrue(np.all(logical_array))
 
+# Previous (unfused) implementations, for equivalence checks
+def ref_ab_from_uvw(u, v, w):
+    return np.arctan2(w, u), np.arcsin(v/np.sqrt(u*u + v*v + w*w))
+
+def ref_ap_from_uvw(u, v, w):
+    return np.arctan2(np.sqrt(v*v + w*w), u), np.arctan2(v, w)
+
+def ref_uvw_from_ab(a, b):
+    return np.cos(b)*np.cos(a), np.sin(b), np.cos(b)*np.sin(a)
+
+def ref_uvw_from_ap(at, p):
+    return np.cos(at), np.sin(at)*np.sin(p), np.sin(at)*np.cos(p)
+
 class AttitudeTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -77,3 +91,86 @@ class AttitudeTestCase(unittest.TestCase):
         all_close(self, alphat, rad(self.alphat))
         all_close(self, phi[alphat > 0.0], rad(self.phi[alphat > 0.0]))
 
+
+    def test_equivalence(self):
+        ''' Verify fused conversions match the unfused formulas '''
+        rng = np.random.default_rng(0)
+        n = 20000
+        angles = (rng.uniform(-np.pi/2, np.pi/2, n), rng.uniform(-np.pi/2, np.pi/2, n))
+        uvw = tuple(rng.uniform(-1.0, 1.0, (3, n)))
+        cases = [
+            (ab_from_uvw, ref_ab_from_uvw, uvw),
+            (ap_from_uvw, ref_ap_from_uvw, uvw),
+            (uvw_from_ab, ref_uvw_from_ab, angles),
+            (uvw_from_ap, ref_uvw_from_ap, angles),
+            (ab_from_ap, lambda *x: ref_ab_from_uvw(*ref_uvw_from_ap(*x)), angles),
+            (ap_from_ab, lambda *x: ref_ap_from_uvw(*ref_uvw_from_ab(*x)), angles),
+        ]
+        for func, ref, inputs in cases:
+            expected = ref(*inputs)
+            for result in (func(*inputs), func(*inputs, chunk_size=1000)):
+                for r, e in zip(result, expected):
+                    self.assertTrue(np.allclose(r, e, rtol=1e-12, atol=1e-12), func.__name__)
+
+            # Lists are accepted like arrays
+            result = func(*(list(x[:5]) for x in inputs))
+            self.assertTrue(np.allclose(result, [e[:5] for e in expected]))
+
+            # Scalars give scalars
+            result = func(*(x[0] for x in inputs))
+            self.assertTrue(all(np.ndim(r) == 0 for r in result))
+            self.assertTrue(np.allclose(result, [e[0] for e in expected]))
+
+    def test_out(self):
+        ''' Verify results may be written into buffers and the inputs '''
+        at, p = rad(self.alphat), rad(self.phi)
+        alpha, beta = ab_from_ap(at, p)
+
+        out = (np.empty_like(at), np.empty_like(at))
+        result = ab_from_ap(at, p, out=out, chunk_size=5)
+        self.assertIs(result[0], out[0])
+        self.assertTrue(np.array_equal(out[0], alpha) and np.array_equal(out[1], beta))
+
+        # In place, with broadcast and strided inputs
+        at, p = at.copy(), p.copy()
+        ab_from_ap(at, p, out=(at, p), chunk_size=5)
+        self.assertTrue(np.array_equal(at, alpha) and np.array_equal(p, beta))
+        ap_from_ab(at, p, out=(at, p))
+        all_close(self, at, rad(self.alphat))
+
+        u, v, w = uvw_from_ap(rad(self.alphat[:, :1]), rad(self.phi[0]))
+        self.assertEqual(u.shape, (13, 7))
+        out = np.zeros((3, 7, 13))
+        uvw_from_ap(rad(self.alphat), rad(self.phi), out=tuple(out.swapaxes(1, 2)))
+        self.assertTrue(np.array_equal(out.swapaxes(1, 2),
+                                       uvw_from_ap(rad(self.alphat), rad(self.phi))))
+
+    def test_wind_angles(self):
+        ''' Verify trajectory angles match sample by sample DCM evaluation '''
+        rng = np.random.default_rng(1)
+        n = 200
+        euler = rng.uniform([-180, -80, -180], [180, 80, 180], (n, 3))
+        velocity = rng.uniform([50, -20, -20], [300, 20, 20], (n, 3))
+        wind = np.array([10.0, -5.0, 2.0])
+
+        expected = np.empty((4, n))
+        for m in range(n):
+            uvw = core.rotate_seq('zyx', angles_deg=euler[m]) @ (velocity[m] - wind)
+            expected[:, m] = ab_from_uvw(*uvw) + ap_from_uvw(*uvw)
+
+        result = wind_angles(velocity, wind, sequence='zyx', angles_deg=list(euler.T))
+        self.assertTrue(np.allclose(result, expected))
+        q = core.quat_seq('zyx', angles_deg=list(euler.T))
+        out = tuple(np.empty(n) for _ in range(4))
+        result = wind_angles(velocity, np.tile(wind, (n, 1)), q=q, out=out, chunk_size=7)
+        self.assertIs(result[0], out[0])
+        self.assertTrue(np.allclose(out, expected))
+
+        # Attitude broadcast over a grid of velocities
+        uvw = core.quat_apply(q[0], velocity)
+        for chunk_size in (None, 4):
+            result = wind_angles(velocity.reshape(2, 10, 10, 3), q=q[0], chunk_size=chunk_size)
+            self.assertEqual(result[0].shape, (2, 10, 10))
+            self.assertTrue(np.allclose(result[2].ravel(), ap_from_uvw(*uvw.T)[0]))
+        with self.assertRaises(RuntimeError):
+            wind_angles(velocity)
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import unittest
+from . import common
+from aero_util import grids, tecio
+from aero_util.cache import Cache
+
+class CacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = Cache(os.path.join(self.tmp, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_grid_cache(self):
+        ''' Verify grids are stored and reloaded from the cache '''
+        path = common.data_dir/'rectangles.p3d'
+        ref = grids.load(path)
+        self.assertEqual(len(self.cache.keys()), 0)
+        for _ in range(2):
+            grid = grids.load(path, cache=self.cache)
+            self.assertEqual(len(self.cache.keys()), 1)
+            for block, expected in zip(grid, ref):
+                self.assertTrue(block.equals(expected))
+        self.assertFalse(grid[0].x.values.flags.writeable)
+
+    def test_dat_cache(self):
+        ''' Verify zones, options and shared arrays survive the cache '''
+        path = shutil.copy(common.data_dir/'transient.dat', self.tmp)
+        ref = tecio.read_dat(path)
+        tecio.read_dat(path, cache=self.cache)
+        zones = tecio.read_dat(path, cache=self.cache)
+        self.assertEqual([z.options for z in zones], [z.options for z in ref])
+        self.assertIs(zones[2]['X'], zones[0]['X'])
+        self.assertIs(zones[2].connectivity, zones[0].connectivity)
+        for zone, expected in zip(zones, ref):
+            for name in expected:
+                self.assertTrue(np.array_equal(zone[name], expected[name]))
+
+        # Other options and modified files are separate entries
+        tecio.read_dat(path, variables=['P'], cache=self.cache)
+        self.assertEqual(len(self.cache.keys()), 2)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        tecio.read_dat(path, cache=self.cache)
+        self.assertEqual(len(self.cache.keys()), 3)
+
+        # Content hash keys detect changes that keep the size and mtime
+        cache = Cache(self.cache.directory, hash_content=True)
+        keys = [c.key(path, 'tecio.read_dat') for c in (self.cache, cache)]
+        stat = os.stat(path)
+        with open(path, 'r+') as f:
+            f.write('#')
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(self.cache.key(path, 'tecio.read_dat'), keys[0])
+        self.assertNotEqual(cache.key(path, 'tecio.read_dat'), keys[1])
+
+    def test_eviction(self):
+        ''' Verify least recently used entries are evicted '''
+        arrays = [np.zeros(1000)]
+        for key in ('a', 'b', 'c'):
+            self.cache.store(key, arrays, {})
+            os.utime(os.path.join(self.cache.directory, key, 'meta.json'),
+                     ns=(0, len(self.cache.keys()) * 10**9))
+        self.assertIsNotNone(self.cache.load('a'))   # Now the most recent
+        self.cache.max_size = 2*9000
+        self.cache.evict()
+        self.assertEqual(sorted(self.cache.keys()), ['a', 'c'])
+        self.cache.clear()
+        self.assertEqual(self.cache.keys(), [])
+        self.assertIsNone(self.cache.load('a'))
@@ -17,6 +17,26 @@ class TestUnits(unittest.TestCase):
         self.assertAlmostEqual(au.convert_from(0.0,'degC'), 273.15)
         self.assertAlmostEqual(au.convert_to(300,'degF'), 80.33, delta=1e-6)
 
+    def test_cached_convert(self):
+        ''' Verify cached factors match pint for scalars and arrays '''
+        values = np.linspace(-100.0, 500.0, 7)
+        for uin, uout in [('ft', 'm'), ('K', 'degF'), ('degC', 'degR'), ('knot', 'ft/s')]:
+            for value in (values, 12.5):
+                expected = au.core._pint_convert(value, uin, uout)
+                self.assertTrue(np.allclose(au.convert(value, uin, uout), expected, rtol=1e-13))
+            self.assertTrue(np.allclose(au.convert_from(values, uin),
+                                        au.core._to_base(values, uin)))
+            self.assertTrue(np.allclose(au.convert_to(au.convert_from(values, uout), uout), values))
+        self.assertTrue(np.allclose(au.convert([1.0, 2.0], 'ft', 'inch'), [12.0, 24.0]))
+        self.assertLessEqual(au.core._conversion.cache_info().currsize,
+                             au.core._conversion.cache_info().maxsize)
+
+        # Non-affine conversions fall back to pint; invalid ones still raise
+        self.assertAlmostEqual(au.convert(20.0, 'dB', 'dimensionless'), 100.0)
+        with self.assertRaises(Exception):
+            au.convert(1.0, 'ft', 'second')
+
+
 
 class TestRotation(unittest.TestCase):
     ''' Verify rotation matrices '''
@@ -37,3 +57,103 @@ class TestRotation(unittest.TestCase):
         self.assertTrue(np.allclose(Rz, au.rotate_axis([0,0,1], angle_deg=-60.0)))
 
 
+
+    def test_batched(self):
+        ''' Verify array angles give stacks equal to scalar DCMs '''
+        rng = np.random.default_rng(0)
+        angles = rng.uniform(-np.pi, np.pi, (3, 50))
+        axes = rng.normal(size=(50, 3))
+        for func in (au.rotate_x, au.rotate_y, au.rotate_z):
+            R = func(angles[0])
+            self.assertEqual(R.shape, (50, 3, 3))
+            for n in range(50):
+                self.assertTrue(np.array_equal(R[n], func(angles[0, n])))
+        R = au.rotate_axis(axes, angles[0])
+        for n in range(50):
+            self.assertTrue(np.array_equal(R[n], au.rotate_axis(axes[n], angles[0, n])))
+        R = au.rotate_seq('zyx', angles_deg=au.deg(angles))
+        self.assertEqual(R.shape, (50, 3, 3))
+        for n in range(50):
+            self.assertTrue(np.array_equal(R[n], au.rotate_seq('zyx', angles_deg=au.deg(angles[:, n]))))
+
+        # Scalar and array angles may be mixed; zero degrees is an angle
+        R = au.rotate_seq('zy', [angles[0], 0.5])
+        self.assertTrue(np.array_equal(R[7], au.rotate_seq('zy', [angles[0, 7], 0.5])))
+        R = au.rotate_seq('zy', angles_deg=[au.deg(angles[0]), 30.0])
+        self.assertTrue(np.array_equal(R[7], au.rotate_seq('zy', angles_deg=[au.deg(angles[0, 7]), 30.0])))
+        self.assertTrue(np.array_equal(au.rotate_x(angle_deg=0.0), np.eye(3)))
+        with self.assertRaises(RuntimeError):
+            au.rotate_x()
+
+        # Angles must be given per rotation, not as an (N,3) array
+        for func in (au.rotate_seq, au.quat_seq):
+            with self.assertRaises(RuntimeError):
+                func('zyx', angles.T)
+
+    def test_transform(self):
+        ''' Verify bulk transforms match matrix products, chunked and in place '''
+        rng = np.random.default_rng(1)
+        v = rng.normal(size=(100, 3))
+        R = au.rotate_seq('zyx', [0.1, 0.2, 0.3])
+        expected = v @ R.T + [1.0, 2.0, 3.0]
+        self.assertTrue(np.allclose(au.transform(v, R, [1.0, 2.0, 3.0], chunk_size=7), expected))
+
+        # Component arrays, in place
+        xyz = [v[:, n].copy() for n in range(3)]
+        self.assertIs(au.transform(xyz, R, [1.0, 2.0, 3.0], out=xyz, chunk_size=16), xyz)
+        self.assertTrue(np.allclose(np.stack(xyz, -1), expected))
+
+        # A DCM for each vector
+        Rs = au.rotate_seq('zyx', rng.uniform(-3.0, 3.0, (3, 100)))
+        self.assertTrue(np.allclose(au.transform(v, Rs, chunk_size=30),
+                                    np.einsum('nij,nj->ni', Rs, v)))
+
+        # Chunks smaller than the trailing axes, e.g. a single-block grid
+        grid = v.reshape(2, 5, 10, 3)
+        for chunk_size in (3, 10, 25):
+            self.assertTrue(np.allclose(au.transform(grid, R, [1.0, 2.0, 3.0], chunk_size=chunk_size),
+                                        expected.reshape(grid.shape)))
+
+
+class TestQuaternion(unittest.TestCase):
+    ''' Verify quaternions match the equivalent DCMs '''
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.angles = rng.uniform(-np.pi, np.pi, (3, 200))
+        self.q = au.quat_seq('zyx', self.angles)
+        self.dcm = au.rotate_seq('zyx', self.angles)
+
+    def test_dcm(self):
+        self.assertTrue(np.allclose(au.quat_to_dcm(self.q), self.dcm))
+        self.assertTrue(np.allclose(au.quat_to_dcm(au.quat_from_dcm(self.dcm)), self.dcm))
+        self.assertTrue(np.allclose(au.quat_to_dcm(au.quat_seq('y', angles_deg=[30.0])),
+                                    au.rotate_axis([0, 1, 0], angle_deg=30.0)))
+
+        # Half turns, where the largest component is not w
+        for axis in ([1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 1, 0]):
+            R = au.rotate_axis(axis, angle_deg=180.0)
+            q = au.quat_from_dcm(R)
+            self.assertAlmostEqual(q[0], 0.0)
+            self.assertTrue(np.allclose(au.quat_to_dcm(q), R))
+
+    def test_multiply_apply(self):
+        q2 = au.quat_seq('xyx', self.angles)
+        R2 = au.rotate_seq('xyx', self.angles)
+        self.assertTrue(np.allclose(au.quat_to_dcm(au.quat_multiply(q2, self.q)), R2 @ self.dcm))
+        v = np.random.default_rng(3).normal(size=(200, 3))
+        self.assertTrue(np.allclose(au.quat_apply(self.q, v), np.einsum('nij,nj->ni', self.dcm, v)))
+        self.assertTrue(np.allclose(au.quat_apply(self.q[0], [1.0, 0.0, 0.0]), self.dcm[0, :, 0]))
+
+    def test_slerp(self):
+        q0 = au.quat_seq('z', angles_deg=[10.0])
+        q1 = -au.quat_seq('z', angles_deg=[50.0])       # Same rotation as +q
+        q = au.quat_slerp(q0, q1, [0.0, 0.25, 1.0])
+        self.assertTrue(np.allclose(q, au.quat_seq('z', angles_deg=[[10.0, 20.0, 50.0]])))
+        self.assertTrue(np.allclose(au.quat_slerp(q0, q0, 0.5), q0))
+
+        # Time history interpolation, clamped at the ends
+        tp = [0.0, 1.0, 3.0]
+        qp = au.quat_seq('x', angles_deg=[[0.0, 20.0, 60.0]])
+        q = au.quat_interp([-1.0, 0.5, 2.0, 4.0], tp, qp)
+        self.assertTrue(np.allclose(q, au.quat_seq('x', angles_deg=[[0.0, 10.0, 40.0, 60.0]])))
@@ -1,7 +1,28 @@
+import os
+import tempfile
 import numpy as np
+import xarray as xr
 import unittest
 from . import common
-from aero_util import grids
+from aero_util import core, grids
+
+def write_binary(path, blocks, byteorder='<', dtype='f8', records=True, iblank=False):
+    ''' Write blocks of (x, y[, z]) arrays to a binary Plot3D file '''
+    def write(f, *arrays):
+        data = b''.join(np.asarray(a).astype(byteorder + a_type).tobytes(order='F')
+                        for a, a_type in arrays)
+        if records:
+            marker = np.array([len(data)], byteorder + 'i4').tobytes()
+            data = marker + data + marker
+        f.write(data)
+    with open(path, 'wb') as f:
+        write(f, ([len(blocks)], 'i4'))
+        write(f, (np.ravel([xyz[0].shape for xyz in blocks]), 'i4'))
+        for n, xyz in enumerate(blocks):
+            arrays = [(a, dtype) for a in xyz]
+            if iblank:
+                arrays.append((np.full(xyz[0].shape, n + 1), 'i4'))
+            write(f, *arrays)
 
 class StructuredGridTestCase(unittest.TestCase):
 
@@ -30,3 +51,271 @@ class StructuredGridTestCase(unittest.TestCase):
         self.assertAlmostEqual(cube.x[3,1,1],  0.5)
         self.assertAlmostEqual(cube.y[3,1,1],  0.0)
         self.assertAlmostEqual(cube.z[3,1,1],  1.0)
+
+    def test_load_compressed(self):
+        ''' Verify compressed grid files and file objects can be loaded '''
+        cube, = grids.load(common.data_dir/'cube.p3d')
+        text = (common.data_dir/'cube.p3d').read_bytes()
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, module in common.compressors():
+                path = os.path.join(tmp, 'cube.p3d.' + name)
+                with open(path, 'wb') as f:
+                    f.write(module.compress(text))
+                self.assertTrue(cube.equals(grids.load(path)[0]))
+                with open(path, 'rb') as f:
+                    self.assertTrue(cube.equals(grids.load(f)[0]))
+
+    def test_load_multiblock(self):
+        ''' Verify coordinates of 3D multi-block grids are read in order '''
+        sizes = [(3, 4, 2), (2, 2, 5)]
+        blocks = [np.random.default_rng(n).uniform(size=(3,) + s) for n, s in enumerate(sizes)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'blocks.p3d')
+            with open(path, 'w') as f:
+                f.write(f'{len(sizes)}\n')
+                for size in sizes:
+                    f.write('{} {} {}\n'.format(*size))
+                for xyz in blocks:
+                    values = np.concatenate([np.ravel(v, order='F') for v in xyz])
+                    np.savetxt(f, values.reshape(-1, 3), fmt='%.17E')
+            grid = grids.load(path)
+        for block, xyz in zip(grid, blocks):
+            self.assertEqual(block.x.dims, ('i', 'j', 'k'))
+            for name, values in zip('xyz', xyz):
+                self.assertTrue(np.array_equal(block[name].values, values))
+
+    def test_no_final_newline(self):
+        ''' Verify grids whose last value ends the file can be loaded '''
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'line.p3d')
+            with open(path, 'w') as f:
+                f.write('2 1 1\n0.0 1.0\n0.0 0.0\n0.0 2.5')
+            block, = grids.load(path)
+        self.assertEqual(list(block.z.values.ravel()), [0.0, 2.5])
+
+    def test_load_invalid(self):
+        ''' Verify malformed numbers (e.g. Fortran D exponents) raise '''
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'line.p3d')
+            with open(path, 'w') as f:
+                f.write('2 1 1\n0.0 1.0D+00\n0.0 0.0\n0.0 2.5\n')
+            with self.assertRaises(ValueError):
+                grids.load(path)
+
+    def test_load_binary(self):
+        ''' Verify binary grids are detected and memory mapped '''
+        cube, = grids.load(common.data_dir/'cube.p3d')
+        rects = grids.load(common.data_dir/'rectangles.p3d')
+        blocks = [
+            [cube.x.values, cube.y.values, cube.z.values],
+            [cube.x.values[:3], cube.y.values[:3], cube.z.values[:3]],
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'grid.xyz')
+            for byteorder in '<>':
+                for dtype in ('f4', 'f8'):
+                    for records in (True, False):
+                        for iblank in (False, True):
+                            write_binary(path, blocks, byteorder, dtype, records, iblank)
+                            grid = grids.load(path)
+                            self.assertEqual(len(grid), 2)
+                            for n, (block, xyz) in enumerate(zip(grid, blocks)):
+                                self.assertEqual(block.x.dtype.itemsize, int(dtype[1]))
+                                self.assertFalse(block.x.values.flags.writeable)
+                                for name, values in zip('xyz', xyz):
+                                    self.assertTrue(np.array_equal(block[name].values, values))
+                                self.assertEqual('iblank' in block, iblank)
+                                if iblank:
+                                    self.assertTrue(np.all(block.iblank.values == n + 1))
+                            del grid, block
+
+            # 2D grid, and a file object
+            write_binary(path, [[r.x.values, r.y.values] for r in rects])
+            with open(path, 'rb') as f:
+                for grid in (grids.load(path), grids.load(f)):
+                    for block, ref in zip(grid, rects):
+                        self.assertTrue(block.equals(ref))
+
+    def test_save_grid(self):
+        ''' Verify grids round trip through ASCII and binary files '''
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'grid.xyz')
+            for name in ('rectangle.p3d', 'rectangles.p3d', 'cube.p3d'):
+                grid = grids.load(common.data_dir/name)
+                options = [
+                    dict(), dict(multiblock=len(grid) > 1),
+                    dict(binary=True), dict(binary=True, dtype='f4'),
+                    dict(binary=True, records=False, byteorder='>'),
+                ]
+                for kwargs in options:
+                    grids.save(path, grid, **kwargs)
+                    for block, ref in zip(grids.load(path), grid):
+                        self.assertTrue(block.equals(ref), (name, kwargs))
+                    del block
+
+            # IBLANK
+            cube, = grids.load(common.data_dir/'cube.p3d')
+            cube['iblank'] = (cube.x.dims, np.ones(cube.x.shape, np.int32))
+            grids.save(path, [cube], binary=True)
+            self.assertTrue(grids.load(path)[0].equals(cube))
+            with self.assertRaises(ValueError):
+                grids.save(path, [cube], iblank=True)
+
+    def test_save_function(self):
+        ''' Verify layout of Plot3D function and Q files '''
+        cube, = grids.load(common.data_dir/'cube.p3d')
+        cube['p'] = cube.x + 2*cube.y
+        cube['t'] = cube.z**2
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cube.f')
+            grids.save_function(path, [cube], binary=True, records=False)
+            data = np.fromfile(path, np.int32, 5)
+            self.assertEqual(data.tolist(), [1, 5, 3, 2, 2])
+            data = np.fromfile(path, np.float64, offset=20).reshape(2, -1)
+            self.assertTrue(np.array_equal(data[0], np.ravel(cube.p.values, order='F')))
+            self.assertTrue(np.array_equal(data[1], np.ravel(cube.t.values, order='F')))
+
+            path = os.path.join(tmp, 'cube.q')
+            grids.save_function(path, [cube, cube], ['p', 't'], conditions=(0.8, 2.0, 1e6, 0.0))
+            with open(path) as f:
+                self.assertEqual(f.readline().split(), ['2'])
+                self.assertEqual(f.readline().split(), ['5', '3', '2'])
+                self.assertEqual(f.readline().split(), ['5', '3', '2'])
+                data = np.array(f.read().split(), float).reshape(2, -1)
+            self.assertTrue(np.array_equal(data[:, :4], [[0.8, 2.0, 1e6, 0.0]]*2))
+            self.assertTrue(np.array_equal(data[1, 4:34], np.ravel(cube.p.values, order='F')))
+
+    def test_metrics(self):
+        ''' Verify volumes, face areas and Jacobians of warped grids '''
+        rng = np.random.default_rng(1)
+        i, j, k = np.meshgrid(np.arange(4.0), np.arange(3.0), np.arange(3.0), indexing='ij')
+        xyz = np.stack([i, j, k]) + rng.uniform(-0.2, 0.2, (3,) + i.shape)
+        block = xr.Dataset({n: (('i', 'j', 'k'), v) for n, v in zip('xyz', xyz)})
+        m, = grids.metrics([block])
+
+        # Trilinear cell volume is integral of det(J); exact by 2-point Gauss
+        g = 0.5 + np.array([-0.5, 0.5])/np.sqrt(3)
+        nodes = xyz[:, 1:3, 0:2, 1:3]
+        volume = 0.0
+        for u in g:
+            for v in g:
+                for w in g:
+                    wu = np.array([1-u, u]); wv = np.array([1-v, v]); ww = np.array([1-w, w])
+                    dxu = np.einsum('cijk,j,k->c', np.diff(nodes, axis=1), wv, ww)
+                    dxv = np.einsum('cijk,i,k->c', np.diff(nodes, axis=2), wu, ww)
+                    dxw = np.einsum('cijk,i,j->c', np.diff(nodes, axis=3), wu, wv)
+                    volume += np.linalg.det(np.stack([dxu, dxv, dxw]))/8
+        self.assertAlmostEqual(float(m.volume[1, 0, 1]), volume)
+
+        # Face area vectors of each cell sum to zero (closed surface)
+        S = {d: m['normal_' + d] * m['area_' + d] for d in 'ijk'}
+        net = sum(S[d].isel({d: slice(1, None)}).values - S[d].isel({d: slice(None, -1)}).values
+                  for d in 'ijk')
+        self.assertTrue(np.allclose(net, 0.0))
+        self.assertTrue(np.allclose(np.linalg.norm(m.normal_i, axis=-1), 1.0))
+        self.assertTrue(np.all(m.jacobian > 0))
+
+        # 2D areas; metrics in parallel match serial results
+        rects = grids.load(common.data_dir/'rectangles.p3d')
+        serial = grids.metrics(rects)
+        for block, ref in zip(grids.metrics(rects, processes=2), serial):
+            self.assertTrue(block.equals(ref))
+            self.assertAlmostEqual(abs(float(block.volume.sum())), 2.5*1.0)
+
+    def test_check_quality(self):
+        ''' Verify negative volumes are detected '''
+        cube, = grids.load(common.data_dir/'cube.p3d')
+        result, = grids.check_quality([cube])
+        self.assertEqual(result['negative_volumes'], 0)
+        self.assertEqual(result['cells'], 8)
+        self.assertAlmostEqual(result['min_volume'], 1.0)
+        self.assertAlmostEqual(result['max_volume_ratio'], 1.0)
+
+        x = cube.x.values.copy()
+        x[2] = 1.2                  # Moves an i plane past the next two
+        cube['x'] = (cube.x.dims, x)
+        with self.assertLogs('aero_util.grids', 'WARNING'):
+            result, = grids.check_quality([cube])
+        self.assertEqual(result['negative_volumes'], 2)
+        self.assertLess(result['min_volume'], 0.0)
+        self.assertLess(result['min_jacobian'], 0.0)
+
+        # A planar 3D block has no cells
+        planar = cube.isel(k=slice(0, 1))
+        for check in (grids.check_quality, grids.metrics):
+            with self.assertRaisesRegex(ValueError, 'Block 2'):
+                check([cube, planar])
+
+    def test_transform(self):
+        ''' Verify grids and vector variables are rotated and translated '''
+        cube, = grids.load(common.data_dir/'cube.p3d')
+        cube['u'] = cube.x + 1.0
+        cube['v'] = cube.y * 0.0
+        cube['w'] = cube.z * 0.0
+        R = core.rotate_z(angle_deg=90.0)
+        moved, = grids.transform([cube], R, [0.0, 0.0, 1.0], vectors=[('u', 'v', 'w')],
+                                 chunk_size=5)
+        self.assertTrue(np.allclose(moved.x, cube.y))
+        self.assertTrue(np.allclose(moved.y, -cube.x))
+        self.assertTrue(np.allclose(moved.z, cube.z + 1.0))
+        self.assertTrue(np.allclose(moved.v, -cube.u))
+        self.assertTrue(np.allclose(moved.u, 0.0))
+        self.assertFalse(np.allclose(cube.x, moved.x))
+
+        # In place, with a DCM per block; memory mapped grids are read-only
+        blocks = [cube.copy(deep=True), cube.copy(deep=True)]
+        x = blocks[1].x.values
+        result = grids.transform(blocks, np.stack([np.eye(3), R]), inplace=True)
+        self.assertIs(result[1].x.values, x)
+        self.assertTrue(np.allclose(blocks[0].x, cube.x))
+        self.assertTrue(np.allclose(blocks[1].x, cube.y))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cube.x')
+            grids.save(path, [cube], binary=True)
+            with self.assertRaises(ValueError):
+                grids.transform(grids.load(path), R, inplace=True)
+
+    def test_connectivity(self):
+        ''' Verify abutting face patches and their index maps are found '''
+        def box(origin, shape, axes=(0, 1, 2), flip=()):
+            xyz = np.meshgrid(*[o + np.arange(n, dtype=float) for o, n in zip(origin, shape)],
+                              indexing='ij')
+            xyz = [np.flip(np.transpose(a, axes), flip) for a in xyz]
+            return xr.Dataset({n: (('i', 'j', 'k'), a) for n, a in zip('xyz', xyz)})
+
+        blocks = [
+            box((0, 0, 0), (5, 4, 3)),
+            box((4, 0, 0), (3, 3, 3)),                      # Abuts half of block 0
+            box((4, 2, 0), (3, 2, 3), (1, 0, 2), (0,)),     # Other half; i, j swapped
+            box((0, 0, 2), (5, 4, 2), (2, 1, 0)),           # On top of block 0; i, k swapped
+        ]
+        patches = grids.connectivity(blocks)
+        self.assertEqual(len(patches), 8)
+        self.assertEqual(
+            [(p['block'], p['face'], p['donor'], p['donor_face']) for p in patches[:3]],
+            [(0, 'imax', 1, 'imin'), (0, 'imax', 2, 'jmin'), (0, 'kmax', 3, 'imin')])
+        self.assertEqual(patches[1]['begin'], (4, 2, 0))
+        self.assertEqual(patches[1]['end'], (4, 3, 2))
+        for p in patches:
+            begin, end = np.array(p['begin']), np.array(p['end'])
+            M = np.zeros((3, 3), int)
+            for axis, t in enumerate(p['transform']):
+                M[abs(t) - 1, axis] = np.sign(t)
+            self.assertEqual(tuple(p['donor_begin'] + M @ (end - begin)), p['donor_end'])
+            nodes = np.stack(np.meshgrid(*[np.arange(min(b, e), max(b, e) + 1)
+                                           for b, e in zip(begin, end)], indexing='ij'), -1)
+            nodes = nodes.reshape(-1, 3)
+            donor_nodes = p['donor_begin'] + (nodes - begin) @ M.T
+            for n in 'xyz':
+                self.assertTrue(np.array_equal(
+                    blocks[p['block']][n].values[tuple(nodes.T)],
+                    blocks[p['donor']][n].values[tuple(donor_nodes.T)]))
+
+        # 2D O-grid abuts itself at the cut; the collapsed centre is ignored
+        r, t = np.meshgrid(np.arange(3.0), np.linspace(0, 2*np.pi, 9), indexing='ij')
+        ogrid = xr.Dataset({'x': (('i', 'j'), r*np.cos(t)), 'y': (('i', 'j'), r*np.sin(t))})
+        patches = grids.connectivity([ogrid], tol=1e-6)
+        self.assertEqual([(p['face'], p['begin'], p['end'], p['donor_face'], p['donor_begin'],
+                           p['transform']) for p in patches],
+                         [('jmin', (0, 0), (2, 0), 'jmax', (0, 8), (1, 2)),
+                          ('jmax', (0, 8), (2, 8), 'jmin', (0, 0), (1, 2))])
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Limit on time to import aero_util, excluding numpy [us]; about 50 ms now
+IMPORT_TIME_LIMIT = 200000
+
+def run_python(code, **env):
+    ''' Run code in a new interpreter, returning the completed process '''
+    return subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          cwd=Path(__file__).parents[1], env=dict(os.environ, **env),
+                          capture_output=True, text=True, check=True)
+
+class ImportTestCase(unittest.TestCase):
+
+    def test_import_time(self):
+        ''' Verify heavy dependencies are imported on first use, keeping
+            "import aero_util" fast
+        '''
+        result = run_python('import sys, aero_util; print(" ".join(sys.modules))')
+        modules = result.stdout.split()
+        for name in ('pint', 'xarray', 'pandas'):
+            self.assertNotIn(name, modules)
+
+        times = {}
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:') and 'cumulative' not in line:
+                _, cumulative, name = line.split('|')
+                times[name.strip()] = int(cumulative)
+        own = times['aero_util'] - times.get('numpy', 0)
+        self.assertLess(own, IMPORT_TIME_LIMIT, f'aero_util took {own/1e3:.0f} ms to import')
+
+    def test_unit_cache(self):
+        ''' Verify the unit registry is built on first use, optionally with
+            cached definitions
+        '''
+        with tempfile.TemporaryDirectory() as tmp:
+            code = 'import aero_util as au; print(au.convert(1.0, "ft", "m"))'
+            for _ in range(2):
+                result = run_python(code, AERO_UTIL_UNIT_CACHE=tmp)
+                self.assertAlmostEqual(float(result.stdout), 0.3048)
+            self.assertTrue(os.listdir(tmp))
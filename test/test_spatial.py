@@ -0,0 +1,79 @@
+import pickle
+import numpy as np
+import unittest
+import xarray as xr
+from . import common
+from aero_util import grids, tecio
+from aero_util.spatial import SpatialIndex
+
+def warped_blocks():
+    ''' Return two abutting, randomly warped 3D blocks with field "f" '''
+    rng = np.random.default_rng(2)
+    blocks = []
+    for origin in (0.0, 5.0):
+        i, j, k = np.meshgrid(origin + np.arange(6.0), np.arange(4.0), np.arange(5.0),
+                              indexing='ij')
+        xyz = np.stack([i, j, k])
+        xyz[:, 1:-1, 1:-1, 1:-1] += rng.uniform(-0.2, 0.2, (3, 4, 2, 3))
+        block = xr.Dataset({n: (('i', 'j', 'k'), v) for n, v in zip('xyz', xyz)})
+        block['f'] = 1.0 + 2.0*block.x - block.y + 0.5*block.z
+        blocks.append(block)
+    return blocks
+
+class SpatialIndexTestCase(unittest.TestCase):
+
+    def test_nearest(self):
+        ''' Verify nearest nodes match a brute force search '''
+        blocks = warped_blocks()
+        index = SpatialIndex(blocks)
+        nodes = np.concatenate([np.stack([b.x, b.y, b.z], -1).reshape(-1, 3) for b in blocks])
+        points = np.random.default_rng(3).uniform(-1.0, 11.0, (500, 3))
+        dist, block, node = index.nearest(points)
+        brute = np.linalg.norm(nodes[np.newaxis] - points[:, np.newaxis], axis=2)
+        self.assertTrue(np.allclose(dist, brute.min(axis=1)))
+        for n in range(10):
+            b = blocks[block[n]].isel(i=node[n, 0], j=node[n, 1], k=node[n, 2])
+            self.assertAlmostEqual(float(np.linalg.norm([b.x, b.y, b.z] - points[n])), dist[n])
+
+    def test_interpolate(self):
+        ''' Verify trilinear interpolation reproduces linear fields '''
+        blocks = warped_blocks()
+        index = SpatialIndex(blocks)
+        points = np.random.default_rng(4).uniform([0.5, 0.5, 0.5], [9.5, 2.5, 3.5], (1000, 3))
+        points = np.concatenate([points, [[50.0, 0.0, 0.0]]])
+        block, cell, params = index.locate(points)
+        self.assertEqual(set(block[:-1]), {0, 1})
+        self.assertEqual(block[-1], -1)
+        self.assertTrue(np.all((params[:-1] >= 0) & (params[:-1] <= 1)))
+        values = index.interpolate(points, blocks, ['f'])['f']
+        expected = 1.0 + points @ [2.0, -1.0, 0.5]
+        self.assertTrue(np.allclose(values[:-1], expected[:-1]))
+        self.assertTrue(np.isnan(values[-1]))
+
+        # Indices may be pickled
+        index = pickle.loads(pickle.dumps(index))
+        self.assertTrue(np.allclose(index.interpolate(points, blocks, ['f'])['f'][:-1],
+                                    expected[:-1]))
+
+    def test_zones_2d(self):
+        ''' Verify bilinear interpolation on ordered Tecplot zones '''
+        rects = grids.load(common.data_dir/'rectangles.p3d')
+        zones = [tecio.Zone({'X': r.x.values, 'Y': r.y.values, 'P': r.x.values*r.y.values})
+                 for r in rects]
+        index = SpatialIndex(zones)
+        points = [[-0.5, 0.25], [1.25, -0.25]]
+        values = index.interpolate(points, zones, ['P'])['P']
+        self.assertTrue(np.allclose(values, [-0.125, -0.3125]))
+
+    def test_surface_zones(self):
+        ''' Verify surface zones keep all three coordinates '''
+        zones = tecio.read_dat(common.data_dir/'cube.dat')
+        index = SpatialIndex(zones)
+        dist, block, node = index.nearest([[0.0, 0.0, 0.6], [0.0, 0.0, -0.6]])
+        self.assertEqual(list(block), [1, 5])
+        self.assertTrue(np.allclose(dist, 0.1))
+        self.assertEqual(node.shape, (2, 2))
+        with self.assertRaises(AssertionError):
+            index.nearest([[0.0, 0.0]])
+        with self.assertRaises(ValueError):
+            index.locate([[0.0, 0.0, 0.5]])
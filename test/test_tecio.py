@@ -1,8 +1,16 @@
 import io
+import os
+import shutil
+import tempfile
 import unittest
 from aero_util.tecio import *
 from . import common
 
+def read_dat_from_file(path, **kwargs):
+    ''' Read through the text file object path of read_dat '''
+    with open(path) as f:
+        return read_dat(f, **kwargs)
+
 class TestTecIO(unittest.TestCase):
 
     def test_simple_example(self):
@@ -53,3 +61,273 @@ class TestTecIO(unittest.TestCase):
         self.assertAlmostEqual(data[3]['x'][8,3], -0.30)
         self.assertAlmostEqual(data[3]['y'][8,3],  0.50)
         self.assertAlmostEqual(data[3]['z'][8,3],  0.20)
+
+    def test_lazy_zones(self):
+        ''' Verify indexed zone access matches the eager reader '''
+        data = read_dat(common.data_dir/'cube.dat')
+        with DatFile(common.data_dir/'cube.dat') as dat:
+            self.assertEqual(len(dat), 6)
+            self.assertEqual(dat.titles[3], 'cube.x:4')
+            for name in ('x', 'y', 'z'):
+                self.assertTrue(np.array_equal(dat[3][name], data[3][name]))
+                self.assertTrue(np.array_equal(dat['cube.x:6'][name], data[5][name]))
+            with self.assertRaises(KeyError):
+                dat['typo']
+
+        with DatFile(common.data_dir/'example1.dat') as dat:
+            self.assertEqual(dat.variables, ['X', 'Y'])
+            self.assertTrue(np.array_equal(dat[0]['Y'], [1., 1., 2., 2.]))
+
+    def test_lazy_index_cache(self):
+        ''' Verify zone index is written next to the file and reused '''
+        with tempfile.TemporaryDirectory() as tmp:
+            path = shutil.copy(common.data_dir/'cube.dat', tmp)
+            with DatFile(path, cache=True) as dat:
+                titles = dat.titles
+            self.assertTrue(os.path.exists(path + '.idx'))
+            with DatFile(path, cache=True) as dat:
+                self.assertEqual(dat.titles, titles)
+                self.assertAlmostEqual(dat[3]['x'][8,3], -0.30)
+
+    def test_binary_cube(self):
+        ''' Verify reading a binary file with mixed precision variables '''
+        ascii = read_dat(common.data_dir/'cube.dat')
+        data = read_plt(common.data_dir/'cube.plt')
+        self.assertEqual(len(data), 6)
+        self.assertEqual(data[3]['x'].dtype, np.float32)
+        self.assertEqual(data[3]['y'].dtype, np.float64)
+        for zone, expected in zip(data, ascii):
+            self.assertEqual(zone.keys(), expected.keys())
+            for name in zone:
+                self.assertEqual(zone[name].shape, expected[name].shape)
+                self.assertTrue(np.allclose(zone[name], expected[name]))
+
+    def test_write_round_trip(self):
+        ''' Verify data written in each format reads back unchanged '''
+        for filename in ('example1.dat', 'blayer2d.dat', 'cube.dat'):
+            data = read_dat(common.data_dir/filename)
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'data.dat')
+                for packing in ('BLOCK', 'POINT'):
+                    write_dat(path, data, datapacking=packing)
+                    self.assert_zones_equal(read_dat(path), data)
+                path = os.path.join(tmp, 'data.plt')
+                for zones in (data, (zone for zone in data)):
+                    write_plt(path, zones)
+                    self.assert_zones_equal(read_plt(path), data)
+
+    def test_mismatched_variables(self):
+        ''' Verify writing zones with different variables is an error '''
+        x, y = np.zeros((2, 3)), np.ones((2, 3))
+        for zones in ([{'x': x, 'y': y}, {'y': y, 'x': x}], [{'x': x, 'y': y}, {'x': x}]):
+            with tempfile.TemporaryDirectory() as tmp:
+                for name, write in (('data.dat', write_dat), ('data.plt', write_plt)):
+                    path = os.path.join(tmp, name)
+                    for data in (zones, (zone for zone in zones)):
+                        with self.assertRaises(AssertionError):
+                            write(path, data)
+
+    def test_native_precision(self):
+        ''' Verify variables are loaded with the declared data type '''
+        zone = {
+            'x': np.linspace(0.0, 1.0, 12, dtype=np.float32).reshape(3, 4),
+            'n': np.arange(12, dtype=np.int32).reshape(3, 4),
+            'm': np.arange(12, dtype=np.int16).reshape(3, 4),
+            'b': np.arange(12, dtype=np.uint8).reshape(3, 4),
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'data.dat')
+            write_dat(path, [zone])
+            self.assert_zones_equal(read_dat(path), [zone])
+            with DatFile(path) as dat:
+                self.assert_zones_equal(dat, [zone])
+            data = read_dat(path, dtype=float)
+            for name in zone:
+                self.assertEqual(data[0][name].dtype, np.float64)
+                self.assertTrue(np.allclose(data[0][name], zone[name]))
+
+    def test_subset(self):
+        ''' Verify reading selected variables and zones '''
+        path = common.data_dir/'blayer2d.dat'
+        full = read_dat(path)[0]
+        data = read_dat(path, variables=['pw (Pa)', 0, 'Re-kk'])
+        self.assertEqual(list(data[0].keys()), ['xw (m)', 'pw (Pa)', 'Re-kk'])
+        for name in data[0]:
+            self.assertTrue(np.array_equal(data[0][name], full[name]))
+
+        path = common.data_dir/'cube.dat'
+        full = read_dat(path)
+        for data in (
+            read_dat(path, variables=lambda v: v != 'y', zones=['cube.x:2', 4]),
+            read_dat_from_file(path, variables=lambda v: v != 'y', zones=['cube.x:2', 4]),
+        ):
+            self.assertEqual(len(data), 2)
+            self.assertEqual(list(data[1].keys()), ['x', 'z'])
+            self.assertTrue(np.array_equal(data[0]['x'], full[1]['x']))
+            self.assertTrue(np.array_equal(data[1]['z'], full[4]['z']))
+        self.assertEqual(len(read_dat(path, zones=lambda opts: opts['I'] > 11)), 0)
+        with self.assertRaises(KeyError):
+            read_dat(path, variables=['w'])
+        for zones in ([-1], [99], ['typo'], 'typo'):
+            with self.assertRaises(KeyError):
+                read_dat(path, zones=zones)
+
+    def test_iter_zones(self):
+        ''' Verify zones are streamed with their header options '''
+        data = read_dat(common.data_dir/'cube.dat')
+        count = 0
+        for n, zone in enumerate(iter_zones(common.data_dir/'cube.dat', variables='x')):
+            self.assertEqual(zone.title, f'cube.x:{n+1}')
+            self.assertEqual(zone.options['I'], 11)
+            self.assertEqual(zone.solution_time, 0.0)
+            self.assertEqual(list(zone.keys()), ['x'])
+            self.assertTrue(np.array_equal(zone['x'], data[n]['x']))
+            count += 1
+        self.assertEqual(count, 6)
+
+        # Zone headers survive a round trip through the binary format
+        data = read_plt(common.data_dir/'cube.plt')
+        self.assertEqual([z.strand_id for z in data], list(range(6)))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'data.dat')
+            write_dat(path, data)
+            for n, zone in enumerate(iter_zones(path)):
+                self.assertEqual(zone.title, f'cube.x:{n+1}')
+                self.assertEqual(zone.solution_time, float(n))
+
+    def test_non_seekable_input(self):
+        ''' Verify data can be read from pipes and in-memory text '''
+        data = read_dat(common.data_dir/'cube.dat')
+        text = (common.data_dir/'cube.dat').read_bytes()
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(write_fd, 'wb') as f:
+            f.write(text)
+        with os.fdopen(read_fd, 'rb') as f:
+            self.assertFalse(f.seekable())
+            self.assert_zones_equal(read_dat(f), data)
+        self.assert_zones_equal(read_dat(io.StringIO(text.decode())), data)
+
+    def test_no_final_newline(self):
+        ''' Verify the last value may end the file without a newline '''
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'point.dat')
+            with open(path, 'w') as f:
+                f.write('VARIABLES = "X" "Y"\nZONE I=2, DATAPACKING=POINT\n1 2\n3 4')
+            zone, = read_dat(path)
+            self.assertEqual(list(zone['Y']), [2.0, 4.0])
+            self.assertEqual(list(DatFile(path)[0]['X']), [1.0, 3.0])
+
+    def test_invalid_values(self):
+        ''' Verify malformed numbers raise instead of giving garbage '''
+        for text in ('1 abc 3 4', '1.0D+00 2 3 4'):
+            stream = io.StringIO('VARIABLES = "X" "Y"\nZONE I=2, DATAPACKING=POINT\n' + text)
+            with self.assertRaises(ValueError):
+                read_dat(stream)
+
+    def test_fe_zones(self):
+        ''' Verify reading/writing finite element zones '''
+        path = common.data_dir/'fe_surface.dat'
+        tri, quad = read_dat(path)
+        self.assertEqual(tri.options['ZONETYPE'], 'FETRIANGLE')
+        self.assertEqual(tri['X'].dtype, np.float32)
+        self.assertTrue(np.array_equal(tri['P'], [1.0, 2.0, 3.0, 4.0, 2.5]))
+        self.assertEqual(tri.connectivity.dtype, np.int32)
+        self.assertTrue(tri.connectivity.flags.c_contiguous)
+        self.assertEqual(tri.connectivity.tolist(), [[0,1,4], [1,2,4], [2,3,4], [3,0,4]])
+        self.assertEqual(quad.options['ZONETYPE'], 'FEQUADRILATERAL')
+        self.assertTrue(np.array_equal(quad['P'], np.arange(10.0, 16.0)))
+        self.assertEqual(quad.connectivity.tolist(), [[0,1,4,3], [1,2,5,4]])
+
+        data = [tri, quad]
+        self.assert_zones_equal(read_dat(path, zones='quads'), [quad])
+        with DatFile(path) as dat:
+            self.assert_zones_equal([dat['quads'], dat[0]], [quad, tri])
+        with tempfile.TemporaryDirectory() as tmp:
+            for packing in ('BLOCK', 'POINT'):
+                write_dat(os.path.join(tmp, 'fe.dat'), data, datapacking=packing)
+                self.assert_zones_equal(read_dat(os.path.join(tmp, 'fe.dat')), data)
+            write_plt(os.path.join(tmp, 'fe.plt'), data)
+            self.assert_zones_equal(read_plt(os.path.join(tmp, 'fe.plt')), data)
+
+    def test_shared_variables(self):
+        ''' Verify shared variables/connectivity are the same arrays '''
+        path = common.data_dir/'transient.dat'
+        data = read_dat(path)
+        self.assertEqual([z.solution_time for z in data], [0.0, 0.5, 1.0])
+        self.assertEqual([z.strand_id for z in data], [1, 1, 1])
+        for zone in data[1:]:
+            self.assertIs(zone['X'], data[0]['X'])
+            self.assertIs(zone['Y'], data[0]['Y'])
+            self.assertIs(zone.connectivity, data[0].connectivity)
+        self.assertTrue(np.array_equal(data[2]['P'], [2.0, 3.0, 4.0, 5.0]))
+
+        # Shared data of unselected zones is re-read when possible
+        self.assert_zones_equal(read_dat(path, zones=['t2']), data[2:])
+        with DatFile(path) as dat:
+            t2, t1 = dat['t2'], dat['t1']
+            self.assertIs(t2['X'], t1['X'])
+            self.assert_zones_equal([t1, t2], data[1:])
+        with self.assertRaises(RuntimeError):
+            read_dat_from_file(path, zones=['t2'])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            write_dat(os.path.join(tmp, 'shared.dat'), data)
+            write_plt(os.path.join(tmp, 'shared.plt'), data)
+            for zones in (read_dat(os.path.join(tmp, 'shared.dat')),
+                          read_plt(os.path.join(tmp, 'shared.plt')),
+                          read_plt(os.path.join(tmp, 'shared.plt'), dtype=np.float32)):
+                self.assertEqual(zones[2].options['VARSHARELIST'], [[0, 0], [1, 0]])
+                self.assertEqual(zones[2].options['CONNECTIVITYSHAREZONE'], 0)
+                self.assertIs(zones[2]['X'], zones[0]['X'])
+                self.assertIs(zones[2].connectivity, zones[0].connectivity)
+                self.assertEqual([z.solution_time for z in zones], [0.0, 0.5, 1.0])
+                for zone, ref in zip(zones, data):
+                    self.assertTrue(np.array_equal(zone['P'], ref['P']))
+
+    def assert_zones_equal(self, zones, expected):
+        self.assertEqual(len(zones), len(expected))
+        for zone, ref in zip(zones, expected):
+            self.assertEqual(list(zone.keys()), list(ref.keys()))
+            connectivity = getattr(ref, 'connectivity', None)
+            if connectivity is not None:
+                self.assertTrue(np.array_equal(zone.connectivity, connectivity))
+            for name in zone:
+                self.assertEqual(zone[name].dtype, ref[name].dtype)
+                self.assertTrue(np.array_equal(zone[name], ref[name]))
+
+    def test_transform(self):
+        ''' Verify zone transforms keep shared coordinates shared '''
+        data = read_dat(common.data_dir/'transient.dat')
+        R = np.array([[0.0, 1.0], [-1.0, 0.0]])
+        zones = transform(data, R, [1.0, 0.0])
+        self.assertTrue(np.allclose(zones[0]['X'], data[0]['Y'] + 1.0))
+        self.assertTrue(np.allclose(zones[0]['Y'], -data[0]['X']))
+        self.assertIs(zones[2]['X'], zones[0]['X'])
+        self.assertIs(zones[2]['P'], data[2]['P'])
+        self.assertIs(zones[2].connectivity, data[2].connectivity)
+        self.assertEqual(zones[1].options, data[1].options)
+
+        # A DCM per zone (e.g. a moving body) unshares the coordinates
+        x = data[0]['X'].copy()
+        zones = transform(data, np.stack([np.eye(2), R, R @ R]))
+        self.assertIsNot(zones[1]['X'], zones[0]['X'])
+        self.assertTrue(np.allclose(zones[2]['X'], -x))
+        with self.assertRaises(ValueError):
+            transform(data, np.stack([np.eye(2), R, R @ R]), inplace=True)
+        transform(data, R @ R, inplace=True)
+        self.assertTrue(np.allclose(data[2]['X'], -x))
+
+    def test_compressed_input(self):
+        ''' Verify compressed files are read transparently '''
+        data = read_dat(common.data_dir/'cube.dat')
+        text = (common.data_dir/'cube.dat').read_bytes()
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, module in common.compressors():
+                path = os.path.join(tmp, 'cube.dat.' + name)
+                with open(path, 'wb') as f:
+                    f.write(module.compress(text))
+                self.assert_zones_equal(read_dat(path), data)
+                with open(path, 'rb') as f:
+                    self.assert_zones_equal(read_dat(f), data)
+                with DatFile(path) as dat:
+                    self.assert_zones_equal([dat[4], dat[1]], [data[4], data[1]])